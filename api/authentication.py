@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from . import versoes
+
+CLAIM_VERSAO = 'versao'
+
+
+class CacheLRU:
+    """
+    Cache LRU em memória, com validade, compartilhado pelas threads do processo
+    """
+
+    def __init__(self, tamanho, validade):
+        self.tamanho = tamanho
+        self.validade = validade
+        self.itens = OrderedDict()
+        self.lock = threading.Lock()
+
+    def obter(self, chave):
+        with self.lock:
+            guardado = self.itens.get(chave)
+            if guardado is None:
+                return None
+            if guardado[0] < time.monotonic():
+                del self.itens[chave]
+                return None
+            self.itens.move_to_end(chave)
+            return guardado[1]
+
+    def guardar(self, chave, valor, validade=None):
+        validade = self.validade if validade is None else min(validade, self.validade)
+        with self.lock:
+            self.itens[chave] = (time.monotonic() + validade, valor)
+            self.itens.move_to_end(chave)
+            while len(self.itens) > self.tamanho:
+                self.itens.popitem(last=False)
+
+    def remover(self, chave):
+        with self.lock:
+            self.itens.pop(chave, None)
+
+
+usuarios = CacheLRU(**settings.JWT_CACHE_USUARIOS)
+refresh_verificados = CacheLRU(**settings.JWT_CACHE_REFRESH)
+
+
+class JWTAutenticacaoCache(JWTAuthentication):
+    """
+    Autenticação JWT que guarda os usuários em memória, consultando o banco apenas quando o usuário não está no
+    cache, quando a sua versão compartilhada mudou desde que ele foi guardado ou quando o token traz uma versão mais
+    nova que a guardada. Tokens com versão anterior à do usuário foram emitidos antes de uma mudança de papel ou
+    situação e são recusados. Cada alteração de usuário gera uma nova versão compartilhada após o commit, então as
+    alterações feitas em outro processo também são percebidas na hora
+    """
+
+    def get_user(self, validated_token):
+        versao = validated_token.get(CLAIM_VERSAO)
+        if versao is None:
+            return super(JWTAutenticacaoCache, self).get_user(validated_token)
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        # Lida antes do banco, para que uma alteração gravada depois da leitura gere outra versão
+        compartilhada = versoes.backend().obter(chave_usuario(user_id))
+        guardado = usuarios.obter(user_id)
+        if guardado is None or guardado[1] != compartilhada or guardado[0].versao_token < versao:
+            user = super(JWTAutenticacaoCache, self).get_user(validated_token)
+            usuarios.guardar(user_id, (user, compartilhada))
+        else:
+            user = guardado[0]
+
+        if user.versao_token != versao:
+            raise AuthenticationFailed('O token foi revogado, obtenha um novo', code='token_revogado')
+
+        return user
+
+
+def chave_usuario(user_id):
+    return 'usuario:%s' % user_id
+
+
+def alterar_usuario(user_id):
+    """
+    Descarta o usuário do cache deste processo e gera uma nova versão compartilhada, para os demais. Deve ser
+    chamada após o commit
+    """
+    usuarios.remover(user_id)
+    versoes.backend().incrementar(chave_usuario(user_id))
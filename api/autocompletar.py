@@ -0,0 +1,167 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from . import versoes
+from .busca import normalizar
+from .models import Categoria, Produto
+
+
+class IndicePrefixos:
+    """
+    Nomes de um modelo em listas ordenadas na memória do processo, buscados por prefixo com bisect, sem consultar
+    o banco. As alterações de nome ou disponibilidade feitas pelo próprio processo são aplicadas pelos sinais após
+    o commit e geram uma nova versão do índice nas versões compartilhadas pelos workers. A versão é conferida no
+    máximo a cada AUTOCOMPLETAR_INTERVALO segundos, e o índice é reconstruído em segundo plano ao perceber uma
+    versão gerada por outro processo
+    """
+
+    def __init__(self, modelo, consulta):
+        self.chave = 'autocompletar:%s' % modelo
+        self.consulta = consulta
+        # Entradas (nome sem acentos, id) ordenadas; a lista dos disponíveis compartilha as tuplas da completa
+        self.todos = None
+        self.disponiveis = None
+        self.itens = {}
+        self.versao = None
+        self.conferido = 0
+        self.reconstruindo = False
+        self.lock = threading.Lock()
+        self.lock_construcao = threading.Lock()
+
+    def buscar(self, prefixo, limite, todos=False):
+        """
+        Pares (id, nome) cujo nome começa pelo prefixo, ignorando acentos e maiúsculas, em ordem alfabética.
+        Sem o parâmetro todos, só retorna os disponíveis
+        """
+        self.conferir()
+        chave = normalizar(prefixo)
+        with self.lock:
+            entradas = self.todos if todos else self.disponiveis
+            inicio = bisect.bisect_left(entradas, (chave, ))
+            encontrados = []
+            for nome, item_id in entradas[inicio:inicio + limite]:
+                if not nome.startswith(chave):
+                    break
+                encontrados.append((item_id, self.itens[item_id][1]))
+        return encontrados
+
+    def conferir(self):
+        agora = time.monotonic()
+        if self.todos is not None and agora - self.conferido < settings.AUTOCOMPLETAR_INTERVALO:
+            return
+        self.conferido = agora
+
+        versao = self.versao_atual()
+        if self.todos is None:
+            with self.lock_construcao:
+                if self.todos is None:
+                    self.reconstruir(versao)
+        elif versao != self.versao and not self.reconstruindo:
+            self.reconstruindo = True
+            threading.Thread(target=self.reconstruir_em_segundo_plano, args=(versao, ), daemon=True).start()
+
+    def versao_atual(self):
+        return versoes.backend().obter(self.chave)
+
+    def reconstruir_em_segundo_plano(self, versao):
+        try:
+            self.reconstruir(versao)
+        finally:
+            self.reconstruindo = False
+            connection.close()
+
+    def reconstruir(self, versao):
+        itens = {}
+        for item_id, nome, disponivel in self.consulta():
+            itens[item_id] = ((normalizar(nome), item_id), nome, disponivel)
+        todos = sorted(entrada for entrada, _, _ in itens.values())
+        disponiveis = [entrada for entrada in todos if itens[entrada[1]][2]]
+
+        with self.lock:
+            self.itens, self.todos, self.disponiveis, self.versao = itens, todos, disponiveis, versao
+
+    def atualizar(self, item_id, nome, disponivel=True):
+        """
+        Aplica a gravação de um item, devendo ser chamada após o commit
+        """
+        with self.lock:
+            if self.todos is not None:
+                self._retirar(item_id)
+                entrada = (normalizar(nome), item_id)
+                self.itens[item_id] = (entrada, nome, disponivel)
+                bisect.insort(self.todos, entrada)
+                if disponivel:
+                    bisect.insort(self.disponiveis, entrada)
+        self._publicar()
+
+    def indisponibilizar(self, ids):
+        """
+        Marca os itens como indisponíveis, devendo ser chamada após o commit
+        """
+        with self.lock:
+            if self.todos is not None:
+                for item_id in ids:
+                    anterior = self.itens.get(item_id)
+                    if anterior is not None and anterior[2]:
+                        self._retirar(item_id)
+                        self.itens[item_id] = (anterior[0], anterior[1], False)
+                        bisect.insort(self.todos, anterior[0])
+        self._publicar()
+
+    def disponibilizar(self, ids):
+        """
+        Marca os itens como disponíveis, devendo ser chamada após o commit
+        """
+        with self.lock:
+            if self.todos is not None:
+                for item_id in ids:
+                    anterior = self.itens.get(item_id)
+                    if anterior is not None and not anterior[2]:
+                        self._retirar(item_id)
+                        self.itens[item_id] = (anterior[0], anterior[1], True)
+                        bisect.insort(self.todos, anterior[0])
+                        bisect.insort(self.disponiveis, anterior[0])
+        self._publicar()
+
+    def remover(self, item_id):
+        """
+        Aplica a exclusão de um item, devendo ser chamada após o commit
+        """
+        with self.lock:
+            if self.todos is not None:
+                self._retirar(item_id)
+        self._publicar()
+
+    def invalidar(self):
+        """
+        Gera uma nova versão sem aplicar nenhuma alteração, para que todos os processos reconstruam o índice. Usada
+        após as gravações em massa, que não disparam os sinais; deve ser chamada após o commit
+        """
+        versoes.backend().incrementar(self.chave)
+
+    def _retirar(self, item_id):
+        anterior = self.itens.pop(item_id, None)
+        if anterior is None:
+            return
+        entrada, _, disponivel = anterior
+        for entradas in (self.todos, self.disponiveis) if disponivel else (self.todos, ):
+            posicao = bisect.bisect_left(entradas, entrada)
+            if posicao < len(entradas) and entradas[posicao] == entrada:
+                del entradas[posicao]
+
+    def _publicar(self):
+        # Gera a versão da alteração já aplicada. Se a anterior era a do índice, nenhuma alteração de outro processo
+        # ficou de fora e o índice continua completo, sem precisar ser reconstruído
+        versao = versoes.backend().incrementar(self.chave)
+        with self.lock:
+            if self.versao is not None and versao == self.versao + 1:
+                self.versao = versao
+
+
+produtos = IndicePrefixos('produto', lambda: Produto.objects.values_list('id', 'nome', 'disponivel').iterator())
+categorias = IndicePrefixos('categoria', lambda: ((categoria_id, nome, True) for categoria_id, nome in
+                                                  Categoria.objects.values_list('id', 'nome').iterator()))
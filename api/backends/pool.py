@@ -0,0 +1,236 @@
+import threading
+import time
+from collections import deque
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+class Pool:
+    """
+    Pool de conexões de um banco, compartilhado pelas threads do processo. Mantém até 'maximo' conexões abertas
+    e permite mais 'transbordo' conexões nos picos, que são fechadas ao serem devolvidas. Quando todas estão em
+    uso, espera até 'espera' segundos por uma conexão livre. Com 'pre_ping', confere cada conexão antes de
+    entregá-la, substituindo as que o banco já encerrou
+    """
+
+    def __init__(self, conectar, minimo, maximo, transbordo, espera, pre_ping):
+        self.conectar = conectar
+        self.minimo = minimo
+        self.maximo = maximo
+        self.transbordo = transbordo
+        self.espera = espera
+        self.pre_ping = pre_ping
+
+        self.livres = deque()
+        self.abertas = 0
+        self.em_uso = 0
+        self.condicao = threading.Condition()
+
+        self.esperas = 0
+        self.tempo_espera = 0.0
+        self.espera_maxima = 0.0
+        self.esgotadas = 0
+        self.criadas = 0
+        self.descartadas = 0
+        self.falhas_ping = 0
+
+        for _ in range(minimo):
+            self.livres.append(self.criar())
+
+    def criar(self):
+        conexao = self.conectar()
+        with self.condicao:
+            self.abertas += 1
+            self.criadas += 1
+        return conexao
+
+    def obter(self):
+        """
+        Entrega uma conexão livre, abre uma nova se o limite permitir ou espera até uma ser devolvida. Devolve
+        None se o tempo de espera se esgotar
+        """
+        inicio = time.monotonic()
+        with self.condicao:
+            while not self.livres and self.abertas >= self.maximo + self.transbordo:
+                restante = self.espera - (time.monotonic() - inicio)
+                if restante <= 0:
+                    self.esgotadas += 1
+                    return None
+                self.condicao.wait(restante)
+
+            espera = time.monotonic() - inicio
+            if espera > 0.001:
+                self.esperas += 1
+                self.tempo_espera += espera
+                self.espera_maxima = max(self.espera_maxima, espera)
+
+            self.em_uso += 1
+            conexao = self.livres.pop() if self.livres else None
+            if conexao is None:
+                # A vaga é reservada antes de abrir a conexão, que é feita fora do lock
+                self.abertas += 1
+
+        if conexao is None or self.pre_ping and not ativa(conexao):
+            if conexao is not None:
+                with self.condicao:
+                    self.falhas_ping += 1
+                    self.descartadas += 1
+                fechar(conexao)
+            try:
+                conexao = self.conectar()
+            except Exception:
+                self.liberar(fechar=True)
+                raise
+            with self.condicao:
+                self.criadas += 1
+
+        return conexao
+
+    def devolver(self, conexao, descartar=False):
+        """
+        Devolve a conexão ao pool. Conexões com erro ou além do tamanho máximo são fechadas
+        """
+        if not descartar:
+            try:
+                conexao.rollback()
+            except Exception:
+                descartar = True
+
+        with self.condicao:
+            transbordo = self.abertas > self.maximo
+        if descartar or transbordo:
+            fechar(conexao)
+            self.liberar(fechar=True, descartada=descartar)
+        else:
+            with self.condicao:
+                self.em_uso -= 1
+                self.livres.append(conexao)
+                self.condicao.notify()
+
+    def liberar(self, fechar, descartada=False):
+        with self.condicao:
+            self.em_uso -= 1
+            if fechar:
+                self.abertas -= 1
+            if descartada:
+                self.descartadas += 1
+            self.condicao.notify()
+
+    def esvaziar(self):
+        """
+        Fecha as conexões livres. As que estão em uso são fechadas ao serem devolvidas apenas se passarem do máximo
+        """
+        with self.condicao:
+            livres, self.livres = list(self.livres), deque()
+            self.abertas -= len(livres)
+        for conexao in livres:
+            fechar(conexao)
+
+    def metricas(self):
+        with self.condicao:
+            return {
+                'minimo': self.minimo,
+                'maximo': self.maximo,
+                'abertas': self.abertas,
+                'em_uso': self.em_uso,
+                'livres': len(self.livres),
+                'transbordo': max(self.abertas - self.maximo, 0),
+                'esperas': self.esperas,
+                'tempo_espera': round(self.tempo_espera, 6),
+                'espera_maxima': round(self.espera_maxima, 6),
+                'esgotadas': self.esgotadas,
+                'criadas': self.criadas,
+                'descartadas': self.descartadas,
+                'falhas_ping': self.falhas_ping,
+            }
+
+
+def ativa(conexao):
+    try:
+        cursor = conexao.cursor()
+        try:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        finally:
+            cursor.close()
+        conexao.rollback()
+        return True
+    except Exception:
+        return False
+
+
+def fechar(conexao):
+    try:
+        conexao.close()
+    except Exception:
+        pass
+
+
+def metricas():
+    """
+    Métricas dos pools do processo, por apelido do banco
+    """
+    with pools_lock:
+        return {alias: pool.metricas() for (alias, _), pool in pools.items()}
+
+
+def esvaziar(alias):
+    """
+    Fecha as conexões livres dos pools do banco, com quaisquer parâmetros de conexão
+    """
+    with pools_lock:
+        encontrados = [pool for (apelido, _), pool in pools.items() if apelido == alias]
+    for pool in encontrados:
+        pool.esvaziar()
+
+
+class CriacaoPoolMixin:
+    """
+    Fecha as conexões que ficaram no pool antes de excluir o banco de testes, já que o PostgreSQL não exclui um
+    banco com sessões abertas
+    """
+
+    def destroy_test_db(self, *args, **kwargs):
+        self.connection.close()
+        esvaziar(self.connection.alias)
+        super(CriacaoPoolMixin, self).destroy_test_db(*args, **kwargs)
+
+
+class PoolMixin:
+    """
+    Faz o DatabaseWrapper obter as conexões do pool em vez de abri-las, e devolvê-las ao pool em vez de
+    fechá-las. O pool é configurado pela chave POOL do banco em settings.DATABASES. Como a conexão volta ao pool
+    ao fim de cada requisição, o CONN_MAX_AGE do banco deve ser 0
+    """
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        conexao = pool.obter()
+        if conexao is None:
+            raise self.Database.OperationalError('Nenhuma conexão livre no pool do banco "%s" após %s segundos'
+                                                 % (self.alias, pool.espera))
+        self.pool = pool
+        self.preparar_conexao(conexao)
+        return conexao
+
+    def get_pool(self, conn_params):
+        # A chave inclui os parâmetros, pois os testes trocam o nome do banco usando o mesmo apelido
+        chave = (self.alias, repr(sorted(conn_params.items())))
+        with pools_lock:
+            if chave not in pools:
+                configuracao = self.settings_dict.get('POOL', {})
+                pools[chave] = Pool(lambda: super(PoolMixin, self).get_new_connection(dict(conn_params)),
+                                    minimo=configuracao.get('minimo', 0),
+                                    maximo=configuracao.get('maximo', 10),
+                                    transbordo=configuracao.get('transbordo', 0),
+                                    espera=configuracao.get('espera', 10),
+                                    pre_ping=configuracao.get('pre_ping', True))
+            return pools[chave]
+
+    def preparar_conexao(self, conexao):
+        pass
+
+    def _close(self):
+        if self.connection is not None:
+            self.pool.devolver(self.connection, descartar=self.errors_occurred)
@@ -0,0 +1,15 @@
+from django.db.backends.postgresql import base, creation
+
+from ..pool import CriacaoPoolMixin, PoolMixin
+
+
+class DatabaseCreation(CriacaoPoolMixin, creation.DatabaseCreation):
+    pass
+
+
+class DatabaseWrapper(PoolMixin, base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def preparar_conexao(self, conexao):
+        # O nível de isolamento é lido da conexão ao abri-la, o que não acontece com as conexões reaproveitadas
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', conexao.isolation_level)
@@ -0,0 +1,17 @@
+from django.db.backends.sqlite3 import base, creation
+
+from ..pool import CriacaoPoolMixin, PoolMixin
+
+
+class DatabaseCreation(CriacaoPoolMixin, creation.DatabaseCreation):
+    pass
+
+
+class DatabaseWrapper(PoolMixin, base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    def _start_transaction_under_autocommit(self):
+        # Com BEGIN IMMEDIATE a transação reserva a escrita ao começar. Com o BEGIN padrão, duas transações que
+        # leem e depois escrevem não conseguem promover o seu bloqueio e uma delas falha com "database is locked"
+        # em vez de esperar pela outra
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,375 @@
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Exists, OuterRef
+
+from .models import Produto, Termo, TermoProduto
+
+CONFIGURACAO = 'portugues_sem_acento'
+PALAVRAS_VAZIAS = frozenset(('A', 'AS', 'O', 'OS', 'E', 'DE', 'DA', 'DAS', 'DO', 'DOS', 'EM', 'NA', 'NAS', 'NO',
+                             'NOS', 'UM', 'UMA', 'COM', 'SEM', 'PARA', 'POR'))
+PALAVRA = re.compile(r'[A-Z0-9]+')
+MAXIMO_TERMOS = 8
+# Palavras buscadas com menos letras só encontram palavras iguais, e não as que começam por elas
+TAMANHO_PREFIXO = 2
+# Palavras com até esse número de complementos no vocabulário buscam cada um deles pela igualdade, que o índice
+# localiza diretamente em cada faixa de produtos. Com mais complementos, buscam a faixa de termos do prefixo
+MAXIMO_COMPLEMENTOS = 100
+# Palavras buscadas com menos letras não procuram erros de digitação, e as maiores aceitam até dois erros
+TAMANHO_PARECIDO = 4
+TAMANHO_DOIS_ERROS = 8
+MAXIMO_PARECIDOS = 50
+# Palavras com menos registros no índice são consideradas raras, e a primeira janela de ids pontua esse número de
+# produtos, dobrando a cada nova janela
+CANDIDATOS = 2000
+JANELA = 2000
+# Pontos de cada palavra buscada, pelo campo em que foi encontrada e pela forma como corresponde
+PESOS = {
+    TermoProduto.NOME: {'exato': 8, 'prefixo': 4, 'parecido': 2},
+    TermoProduto.CATEGORIA: {'exato': 4, 'prefixo': 2, 'parecido': 1},
+}
+
+
+def normalizar(texto):
+    """
+    Remove os acentos e converte para maiúsculas, a mesma forma com que os nomes são gravados
+    """
+    decomposto = unicodedata.normalize('NFKD', texto)
+    return ''.join(caractere for caractere in decomposto if not unicodedata.combining(caractere)).upper()
+
+
+def termos(texto):
+    """
+    Palavras normalizadas do texto, sem repetições e sem artigos e preposições
+    """
+    encontrados = []
+    for palavra in PALAVRA.findall(normalizar(texto)):
+        if palavra not in PALAVRAS_VAZIAS and palavra not in encontrados:
+            encontrados.append(palavra)
+    return encontrados
+
+
+def ocorrencias(nome, nome_categoria):
+    """
+    Pares (termo, campo) que indexam um produto com o nome e a categoria informados
+    """
+    return ([(termo, TermoProduto.NOME) for termo in termos(nome)] +
+            [(termo, TermoProduto.CATEGORIA) for termo in termos(nome_categoria)])
+
+
+def nativa():
+    """
+    O PostgreSQL usa a sua busca textual, e os demais bancos o índice invertido de TermoProduto
+    """
+    return connection.vendor == 'postgresql'
+
+
+def indexar_produtos(ids):
+    """
+    Refaz o índice invertido dos produtos informados, devendo ser chamada após gravá-los
+    """
+    if nativa():
+        return
+
+    TermoProduto.objects.filter(produto_id__in=ids).delete()
+    _gravar(Produto.objects.filter(id__in=ids).values_list('id', 'nome', 'categoria__nome'))
+
+
+def indexar_categoria(categoria):
+    """
+    Refaz os termos de categoria dos produtos da categoria, se o nome dela mudou
+    """
+    if nativa():
+        return
+
+    produto = Produto.objects.filter(categoria=categoria).values_list('id', flat=True).first()
+    if produto is None:
+        return
+    atuais = set(TermoProduto.objects.filter(produto=produto, campo=TermoProduto.CATEGORIA).values_list(
+        'termo', flat=True))
+    novos = termos(categoria.nome)
+    if atuais == set(novos):
+        return
+
+    TermoProduto.objects.filter(produto__categoria=categoria, campo=TermoProduto.CATEGORIA).delete()
+    Termo.objects.bulk_create([Termo(texto=termo) for termo in novos], ignore_conflicts=True)
+    lote = []
+    for produto_id in Produto.objects.filter(categoria=categoria).values_list('id', flat=True).iterator():
+        lote += [TermoProduto(termo=termo, produto_id=produto_id, campo=TermoProduto.CATEGORIA) for termo in novos]
+        if len(lote) >= 5000:
+            TermoProduto.objects.bulk_create(lote, batch_size=500)
+            lote = []
+    TermoProduto.objects.bulk_create(lote, batch_size=500)
+
+
+def reindexar():
+    """
+    Reconstrói todo o índice invertido a partir dos produtos cadastrados
+    """
+    if nativa():
+        return
+
+    TermoProduto.objects.all().delete()
+    Termo.objects.all().delete()
+    _gravar(Produto.objects.values_list('id', 'nome', 'categoria__nome').order_by('id').iterator())
+
+
+def _gravar(produtos):
+    vocabulario = set()
+    lote = []
+    for produto_id, nome, nome_categoria in produtos:
+        for termo, campo in ocorrencias(nome, nome_categoria):
+            lote.append(TermoProduto(termo=termo, produto_id=produto_id, campo=campo))
+            vocabulario.add(termo)
+        if len(lote) >= 5000:
+            TermoProduto.objects.bulk_create(lote, batch_size=500)
+            lote = []
+    TermoProduto.objects.bulk_create(lote, batch_size=500)
+    Termo.objects.bulk_create([Termo(texto=termo) for termo in vocabulario], batch_size=500, ignore_conflicts=True)
+
+
+def buscar(texto, limite):
+    """
+    Produtos cujo nome ou categoria contêm todas as palavras do texto, em ordem de relevância. Cada palavra
+    também encontra as que começam por ela e as que diferem por um erro de digitação (dois nas maiores)
+    """
+    buscados = termos(texto)[:MAXIMO_TERMOS]
+    if not buscados:
+        return []
+
+    if nativa():
+        ids = _buscar_nativa(buscados, limite)
+    else:
+        ids = _buscar_exatos(buscados, limite)
+        if len(ids) < limite:
+            ids = list(_buscar_indice(buscados, limite))
+    produtos = Produto.objects.in_bulk(ids)
+    return [produtos[produto_id] for produto_id in ids if produto_id in produtos]
+
+
+def _buscar_exatos(buscados, limite):
+    """
+    Produtos com todas as palavras no nome, exatamente como buscadas, que têm a maior relevância possível e são
+    ordenados pelo id. Percorre os produtos da primeira palavra pelo índice conferindo as demais, e para ao chegar
+    ao limite, sem passar por todos os produtos das palavras comuns
+    """
+    consulta = TermoProduto.objects.filter(termo=buscados[0], campo=TermoProduto.NOME)
+    for i, termo in enumerate(buscados[1:]):
+        contem = Exists(TermoProduto.objects.filter(termo=termo, campo=TermoProduto.NOME, produto=OuterRef('produto')))
+        consulta = consulta.annotate(**{'contem_%d' % i: contem}).filter(**{'contem_%d' % i: True})
+    return list(consulta.order_by('produto').values_list('produto', flat=True)[:limite])
+
+
+def _buscar_indice(buscados, limite):
+    """
+    Pontua os produtos pelo índice invertido. Se alguma palavra é rara, só os produtos que a contêm são
+    pontuados. Se todas são comuns, os produtos são pontuados em janelas crescentes de ids, parando quando já há
+    produtos suficientes com a maior relevância possível, já que os das janelas seguintes não podem passá-los.
+    O SQL é montado diretamente, pois é executado várias vezes por busca com condições diferentes
+    """
+    classes = [_classes(termo) for termo in buscados]
+    with connection.cursor() as cursor:
+        contagens = [_contar(cursor, classes_termo) for classes_termo in classes]
+
+        if min(contagens) < CANDIDATOS:
+            sql, parametros = _alguma(classes[contagens.index(min(contagens))])
+            restricao = 'produto_id IN (SELECT produto_id FROM api_termoproduto WHERE %s)' % sql
+            return [produto for produto, _ in _pontuar(cursor, classes, limite, restricao, parametros)]
+
+        maxima = sum(_maior_peso(cursor, classes_termo) for classes_termo in classes)
+        encontrados = []
+        inicio = 0
+        janela = JANELA
+        while True:
+            cursor.execute('SELECT id FROM api_produto WHERE id > %s ORDER BY id LIMIT 1 OFFSET %s',
+                           [inicio, janela - 1])
+            fim = cursor.fetchone()
+            if fim is None:
+                encontrados += _pontuar(cursor, classes, limite, 'produto_id > %s', [inicio])
+            else:
+                encontrados += _pontuar(cursor, classes, limite, 'produto_id > %s AND produto_id <= %s',
+                                        [inicio, fim[0]])
+            encontrados.sort(key=lambda encontrado: (-encontrado[1], encontrado[0]))
+            del encontrados[limite:]
+            if fim is None or len(encontrados) == limite and encontrados[-1][1] == maxima:
+                return [produto for produto, _ in encontrados]
+            inicio = fim[0]
+            janela *= 2
+
+
+def _pontuar(cursor, classes, limite, restricao, parametros_restricao):
+    """
+    Pares (produto, relevância) dos produtos que atendem à restrição e contêm todas as palavras. Cada palavra vale
+    os pontos da sua melhor correspondência no produto
+    """
+    colunas = []
+    parametros = []
+    for i, classes_termo in enumerate(classes):
+        colunas.append('MAX(CASE %s ELSE 0 END) AS pontos_%d' % (
+            ' '.join('WHEN %s THEN %d' % (sql, peso) for peso, sql, _ in classes_termo), i))
+        for _, _, parametros_classe in classes_termo:
+            parametros += parametros_classe
+    filtro, parametros_filtro = _alguma([classe for classes_termo in classes for classe in classes_termo])
+    pontos = ['pontos_%d' % i for i in range(len(classes))]
+
+    cursor.execute(
+        'SELECT produto_id, %s AS relevancia FROM ('
+        '    SELECT produto_id, %s FROM api_termoproduto WHERE (%s) AND %s GROUP BY produto_id'
+        ') t WHERE %s ORDER BY relevancia DESC, produto_id LIMIT %%s' % (
+            ' + '.join(pontos), ', '.join(colunas), filtro, restricao,
+            ' AND '.join('%s > 0' % nome for nome in pontos)),
+        parametros + parametros_filtro + parametros_restricao + [limite])
+    return cursor.fetchall()
+
+
+def _contar(cursor, classes):
+    """
+    Registros do índice que correspondem à palavra, contados até CANDIDATOS. Cada forma de correspondência é
+    contada separadamente, pois com as condições unidas por OR o SQLite reúne todos os registros antes do LIMIT
+    """
+    total = 0
+    for _, sql, parametros in classes:
+        cursor.execute('SELECT COUNT(*) FROM (SELECT 1 FROM api_termoproduto WHERE %s LIMIT %%s) t' % sql,
+                       parametros + [CANDIDATOS - total])
+        total += cursor.fetchone()[0]
+        if total >= CANDIDATOS:
+            break
+    return total
+
+
+def _maior_peso(cursor, classes):
+    for peso, sql, parametros in classes:
+        cursor.execute('SELECT 1 FROM api_termoproduto WHERE %s LIMIT 1' % sql, parametros)
+        if cursor.fetchone():
+            return peso
+    return 0
+
+
+def _classes(termo):
+    """
+    Trios (pontos, condição SQL, parâmetros) das formas como um termo do índice pode corresponder à palavra
+    buscada, da maior para a menor pontuação
+    """
+    correspondencias = {'exato': ('termo = %s', [termo])}
+    if len(termo) >= TAMANHO_PREFIXO:
+        complementos = list(Termo.objects.filter(texto__gt=termo, texto__lt=_sucessor(termo)).values_list(
+            'texto', flat=True)[:MAXIMO_COMPLEMENTOS + 1])
+        if len(complementos) > MAXIMO_COMPLEMENTOS:
+            correspondencias['prefixo'] = ('termo > %s AND termo < %s', [termo, _sucessor(termo)])
+        elif complementos:
+            correspondencias['prefixo'] = _entre(complementos)
+    parecidos = _parecidos(termo)
+    if parecidos:
+        correspondencias['parecido'] = _entre(parecidos)
+
+    classes = [(pesos[tipo], '(%s AND campo = %%s)' % sql, parametros + [campo])
+               for campo, pesos in PESOS.items() for tipo, (sql, parametros) in correspondencias.items()]
+    return sorted(classes, key=lambda classe: -classe[0])
+
+
+def _entre(termos_vocabulario):
+    return 'termo IN (%s)' % ', '.join(['%s'] * len(termos_vocabulario)), termos_vocabulario
+
+
+def _alguma(classes):
+    parametros = []
+    for _, _, parametros_classe in classes:
+        parametros += parametros_classe
+    return ' OR '.join(sql for _, sql, _ in classes), parametros
+
+
+def _sucessor(prefixo):
+    """
+    Menor texto maior que todos os que começam pelo prefixo, para buscá-los por faixa no índice
+    """
+    return prefixo[:-1] + chr(ord(prefixo[-1]) + 1)
+
+
+def _parecidos(termo):
+    """
+    Termos do vocabulário a até um erro de digitação do termo, ou dois nos termos maiores. Só são procurados
+    quando o termo não existe no vocabulário, e entre os que começam pelas mesmas duas letras
+    """
+    if len(termo) < TAMANHO_PARECIDO or Termo.objects.filter(texto=termo).exists():
+        return []
+
+    erros = 2 if len(termo) >= TAMANHO_DOIS_ERROS else 1
+    candidatos = Termo.objects.filter(texto__gte=termo[:2], texto__lt=_sucessor(termo[:2])).values_list(
+        'texto', flat=True)
+    encontrados = []
+    for candidato in candidatos.iterator():
+        if abs(len(candidato) - len(termo)) <= erros and not candidato.startswith(termo):
+            distancia = distancia_edicao(termo, candidato, erros)
+            if distancia <= erros:
+                encontrados.append((distancia, candidato))
+    return [candidato for _, candidato in sorted(encontrados)[:MAXIMO_PARECIDOS]]
+
+
+def distancia_edicao(origem, destino, limite):
+    """
+    Número de inserções, remoções, trocas e transposições de letras vizinhas que transformam a origem no destino.
+    Para de calcular assim que a distância passa do limite, retornando limite + 1
+    """
+    anterior = None
+    atual = list(range(len(destino) + 1))
+    for i in range(1, len(origem) + 1):
+        penultima, anterior, atual = anterior, atual, [i] + [0] * len(destino)
+        for j in range(1, len(destino) + 1):
+            custo = origem[i - 1] != destino[j - 1]
+            atual[j] = min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + custo)
+            if i > 1 and j > 1 and origem[i - 1] == destino[j - 2] and origem[i - 2] == destino[j - 1]:
+                atual[j] = min(atual[j], penultima[j - 2] + 1)
+        if min(atual) > limite:
+            return limite + 1
+    return atual[-1]
+
+
+def _buscar_nativa(buscados, limite):
+    """
+    Busca textual do PostgreSQL, com a configuração e os índices GIN das migrações 0003 e 0009, que removem os
+    acentos antes de separar as palavras.
+    Os candidatos são os produtos cujo nome ou categoria contêm alguma das palavras, e só ficam os que contêm
+    todas, em ordem de relevância. Sem resultados, procura nomes parecidos pelo índice de trigramas
+    """
+    vetor_produto = "to_tsvector('%s'::regconfig, sem_acento(p.nome))" % CONFIGURACAO
+    vetor_categoria = "to_tsvector('%s'::regconfig, sem_acento(c.nome))" % CONFIGURACAO
+    parametros = {
+        'todas': ' & '.join('%s:*' % termo for termo in buscados),
+        'alguma': ' | '.join('%s:*' % termo for termo in buscados),
+        'texto': ' '.join(buscados),
+        'limite': limite,
+    }
+    todas = "to_tsquery('%s'::regconfig, %%(todas)s)" % CONFIGURACAO
+    alguma = "to_tsquery('%s'::regconfig, %%(alguma)s)" % CONFIGURACAO
+    sql = '''
+        SELECT p.id
+        FROM api_produto p
+        JOIN api_categoria c ON c.id = p.categoria_id
+        WHERE p.id IN (
+            SELECT p.id FROM api_produto p WHERE {vetor_produto} @@ {alguma}
+            UNION
+            SELECT p.id FROM api_produto p JOIN api_categoria c ON c.id = p.categoria_id
+            WHERE {vetor_categoria} @@ {alguma}
+        )
+        AND {vetor_produto} || {vetor_categoria} @@ {todas}
+        ORDER BY ts_rank(setweight({vetor_produto}, 'A') || setweight({vetor_categoria}, 'B'), {todas}) DESC, p.id
+        LIMIT %(limite)s
+    '''.format(vetor_produto=vetor_produto, vetor_categoria=vetor_categoria,
+               todas=todas, alguma=alguma)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        ids = [linha[0] for linha in cursor.fetchall()]
+        if ids:
+            return ids
+
+        # O operador <% compara o texto com cada trecho do nome, usando o índice da migração 0002
+        cursor.execute('''
+            SELECT p.id FROM api_produto p
+            WHERE %(texto)s <%% UPPER(p.nome::text)
+            ORDER BY word_similarity(%(texto)s, UPPER(p.nome::text)) DESC, p.id
+            LIMIT %(limite)s
+        ''', parametros)
+        return [linha[0] for linha in cursor.fetchall()]
+
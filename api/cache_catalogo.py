@@ -0,0 +1,108 @@
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+from . import campos
+
+ALIAS = 'catalogo'
+# Formatos guardados no cache; os demais, como a API navegável, são sempre gerados
+FORMATOS_CACHE = ('json', 'msgpack')
+
+
+def versao(modelo):
+    """
+    Versão atual dos dados do modelo. Se a versão não estiver no cache, começa pelo horário atual, para que
+    respostas guardadas antes de ela ser descartada não sejam reaproveitadas
+    """
+    cache = caches[ALIAS]
+    chave = 'versao:%s' % modelo
+    atual = cache.get(chave)
+    if atual is None:
+        cache.add(chave, int(time.time() * 1000), timeout=None)
+        atual = cache.get(chave)
+    return atual
+
+
+def invalidar(*modelos):
+    """
+    Gera uma nova versão dos modelos após o commit da transação atual, invalidando as respostas guardadas
+    """
+    def incrementar():
+        cache = caches[ALIAS]
+        for modelo in modelos:
+            try:
+                cache.incr('versao:%s' % modelo)
+            except ValueError:
+                cache.set('versao:%s' % modelo, int(time.time() * 1000), timeout=None)
+
+    transaction.on_commit(incrementar)
+
+
+def papel(user):
+    """
+    Papel que define os campos visíveis nos serializers do catálogo
+    """
+    return 'restrito' if user.is_anonymous or user.is_client else 'completo'
+
+
+def corresponde(etag, if_none_match):
+    """
+    Confere o ETag com o cabeçalho If-None-Match, que pode ter vários ETags ou *. A comparação é fraca, como
+    exige o If-None-Match, então o prefixo W/ é ignorado
+    """
+    etags = parse_etags(if_none_match)
+    return etags == ['*'] or _sem_prefixo_fraco(etag) in {_sem_prefixo_fraco(tag) for tag in etags}
+
+
+def _sem_prefixo_fraco(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+class CacheCatalogoMixin:
+    """
+    Guarda a listagem renderizada em JSON ou MessagePack no cache, com chave formada pelo caminho, pelos
+    parâmetros, pelo formato, pelo papel do usuário e pela versão dos modelos em modelos_cache e dos expandidos.
+    Responde 304 quando o If-None-Match corresponde ao ETag
+    """
+    modelos_cache = ()
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format not in FORMATOS_CACHE:
+            return super(CacheCatalogoMixin, self).list(request, *args, **kwargs)
+
+        cache = caches[ALIAS]
+        chave = self.get_chave_cache(request)
+        guardado = cache.get(chave)
+        if guardado is None:
+            response = super(CacheCatalogoMixin, self).list(request, *args, **kwargs)
+            conteudo = request.accepted_renderer.render(response.data, request.accepted_media_type,
+                                                        self.get_renderer_context())
+            guardado = ('"%s"' % hashlib.md5(conteudo).hexdigest(), conteudo)
+            cache.set(chave, guardado)
+
+        etag, conteudo = guardado
+        if corresponde(etag, request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(conteudo, content_type=request.accepted_media_type)
+
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization', ))
+        return response
+
+    def get_chave_cache(self, request):
+        # As respostas trazem URLs absolutas, então o esquema e o host também fazem parte da chave
+        partes = [request.scheme, request.get_host(), request.path, request.accepted_media_type, papel(request.user)]
+        partes += sorted('%s=%s' % (parametro, valor) for parametro, valores in request.query_params.lists()
+                         for valor in valores)
+        modelos = set(self.modelos_cache)
+        if campos.parametro(request, 'expand'):
+            # Os objetos expandidos mudam junto com os seus próprios modelos
+            modelos |= campos.modelos_aninhados(self.get_serializer())
+        partes += ['%s:%s' % (modelo, versao(modelo)) for modelo in sorted(modelos)]
+        return 'catalogo:%s' % hashlib.md5('\n'.join(partes).encode()).hexdigest()
@@ -0,0 +1,169 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.query import ModelIterable
+from rest_framework import serializers
+
+# Métodos em que os parâmetros fields e expand são aplicados; nas gravações os campos não mudam
+METODOS = ('GET', 'HEAD')
+
+
+def parametro(request, nome):
+    """
+    Nomes separados por vírgula no parâmetro da requisição, ou None se ele não foi informado ou se a requisição
+    não é de leitura
+    """
+    if request is None or request.method not in METODOS:
+        return None
+    valor = getattr(request, 'query_params', request.GET).get(nome)
+    if valor is None:
+        return None
+    return {nome.strip() for nome in valor.split(',') if nome.strip()}
+
+
+class CamposMixin:
+    """
+    Campos escolhidos pelo cliente na leitura. O parâmetro fields limita os campos do serializer principal, e o
+    parâmetro expand troca os hyperlinks listados em expansoes, em qualquer nível, pelo objeto relacionado,
+    representado pelo serializer indicado. É aplicado depois dos campos de cada papel, então não mostra campos
+    que o papel não vê
+    """
+    expansoes = {}
+    # Colunas lidas junto com o campo quando o queryset é limitado com only(), por serem usadas na sua
+    # representação
+    colunas_dependentes = {}
+
+    def get_fields(self):
+        return self.escolher_campos(self.get_campos_disponiveis())
+
+    def get_campos_disponiveis(self):
+        return super(CamposMixin, self).get_fields()
+
+    def escolher_campos(self, campos):
+        request = self.context.get('request')
+        expandidos = parametro(request, 'expand')
+        if expandidos:
+            expansoes = self.expansoes_permitidas(request)
+            for nome in expandidos & set(expansoes) & set(campos):
+                source = campos[nome].source
+                kwargs = {'source': source} if source and source != nome else {}
+                campos[nome] = expansoes[nome](read_only=True, **kwargs)
+
+        escolhidos = parametro(request, 'fields')
+        if escolhidos is not None and self.principal:
+            for nome in set(campos) - escolhidos:
+                del campos[nome]
+        return campos
+
+    def expansoes_permitidas(self, request):
+        """
+        Expansões que o usuário da requisição pode pedir; as demais continuam como hyperlinks
+        """
+        return self.expansoes
+
+    @property
+    def principal(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+
+def campo_modelo(modelo, nome):
+    """
+    Campo do modelo pelo nome do atributo, incluindo as relações reversas pelo nome do acessor, ou None
+    """
+    try:
+        return modelo._meta.get_field(nome)
+    except FieldDoesNotExist:
+        for relacao in modelo._meta.related_objects:
+            if relacao.get_accessor_name() == nome:
+                return relacao
+    return None
+
+
+def planejar(serializer):
+    """
+    Colunas lidas pelos campos do serializer, ou None se algum campo depende de algo além delas, e as relações
+    aninhadas ou expandidas, como pares (campo do modelo, serializer)
+    """
+    modelo = serializer.Meta.model
+    colunas = {modelo._meta.pk.name}
+    relacoes = []
+    for field in serializer._readable_fields:
+        if isinstance(field, serializers.HyperlinkedIdentityField):
+            continue
+        campo = campo_modelo(modelo, field.source_attrs[0]) if len(field.source_attrs) == 1 else None
+        if campo is None:
+            colunas = None
+            continue
+
+        if isinstance(field, serializers.BaseSerializer):
+            relacoes.append((campo, getattr(field, 'child', field)))
+        if campo.concrete and colunas is not None:
+            colunas.add(campo.name)
+            colunas.update(serializer.colunas_dependentes.get(field.source, ()))
+    return colunas, relacoes
+
+
+def preparar(queryset, serializer, extras=()):
+    """
+    Limita as colunas do queryset às lidas pelo serializer e carrega junto as relações aninhadas ou expandidas:
+    com select_related as chaves estrangeiras e com prefetch_related, que também limita as colunas, as relações
+    reversas e os modelos cujo queryset substitui o carregamento padrão. Os prefetch_related anteriores são
+    descartados. Em listas já carregadas, apenas busca as relações
+    """
+    colunas, relacoes = planejar(serializer)
+    caminhos, buscas = [], []
+    for campo, filho in relacoes:
+        relacionado = campo.related_model._default_manager.all()
+        if campo.one_to_many:
+            buscas.append(Prefetch(campo.get_accessor_name(),
+                                   queryset=preparar(relacionado, filho, (campo.field.name, ))))
+            continue
+
+        colunas_filho, relacoes_filho = planejar(filho)
+        if relacionado._iterable_class is ModelIterable and colunas_filho is not None and not relacoes_filho:
+            caminhos.append(campo.name)
+            if colunas is not None:
+                colunas.update('%s__%s' % (campo.name, coluna) for coluna in colunas_filho)
+        else:
+            buscas.append(Prefetch(campo.name, queryset=preparar(relacionado, filho)))
+
+    if isinstance(queryset, list):
+        prefetch_related_objects(queryset, *caminhos, *buscas)
+        return queryset
+
+    if colunas is not None:
+        extras = [campo_modelo(queryset.model, extra) for extra in extras]
+        queryset = queryset.only(*colunas, *[extra.name for extra in extras if extra is not None and extra.concrete])
+    if caminhos:
+        queryset = queryset.select_related(*caminhos)
+    return queryset.prefetch_related(None).prefetch_related(*buscas)
+
+
+def modelos_aninhados(serializer):
+    """
+    Nomes dos modelos representados pelos serializers aninhados ou expandidos, em qualquer nível
+    """
+    modelos = set()
+    for campo, filho in planejar(serializer)[1]:
+        modelos.add(campo.related_model._meta.model_name)
+        modelos |= modelos_aninhados(filho)
+    return modelos
+
+
+class CamposViewMixin:
+    """
+    Prepara o queryset da leitura para os campos pedidos com fields e expand: lê apenas as colunas usadas e carrega
+    as relações expandidas na mesma consulta ou em uma consulta a mais por relação
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super(CamposViewMixin, self).filter_queryset(queryset)
+        request = self.request
+        if parametro(request, 'fields') is None and parametro(request, 'expand') is None:
+            return queryset
+
+        # As colunas da ordenação são lidas pela paginação para montar o cursor
+        ordenacao = [campo.lstrip('-') for campo in request.query_params.get('ordering', '').split(',')]
+        return preparar(queryset, self.get_serializer(), extras=[campo for campo in ordenacao if campo])
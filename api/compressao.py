@@ -0,0 +1,95 @@
+import gzip
+import re
+from functools import wraps
+
+import brotli
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+# Tipos que vale a pena comprimir; imagens e arquivos já comprimidos ficam de fora
+TIPOS_COMPRIMIVEIS = ('text/', 'application/json', 'application/x-msgpack', 'application/javascript',
+                      'application/xml', 'application/x-ndjson')
+re_codificacao = re.compile(r'\s*([a-z*]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$', re.IGNORECASE)
+
+
+def codificacoes_aceitas(cabecalho):
+    """
+    Peso de cada codificação do Accept-Encoding, sem as recusadas com q=0
+    """
+    aceitas = {}
+    for parte in cabecalho.split(','):
+        encontrado = re_codificacao.match(parte)
+        if encontrado is None:
+            continue
+        try:
+            peso = float(encontrado.group(2) or 1)
+        except ValueError:
+            continue
+        if peso > 0:
+            aceitas[encontrado.group(1).lower()] = peso
+    return aceitas
+
+
+def comprimir(conteudo, codificacao):
+    if codificacao == 'br':
+        return brotli.compress(conteudo, quality=settings.COMPRESSAO['nivel_brotli'])
+    return gzip.compress(conteudo, compresslevel=settings.COMPRESSAO['nivel_gzip'], mtime=0)
+
+
+def sem_compressao(view):
+    """
+    Marca as respostas da view para não serem comprimidas. Usado nas respostas com segredos, como os tokens, em
+    que o tamanho comprimido revelaria o segredo aos poucos quando parte da resposta vem da requisição (BREACH)
+    """
+    @wraps(view)
+    def view_sem_compressao(*args, **kwargs):
+        response = view(*args, **kwargs)
+        response.sem_compressao = True
+        return response
+
+    return view_sem_compressao
+
+
+class CompressaoMiddleware:
+    """
+    Comprime com brotli ou gzip, conforme o Accept-Encoding, as respostas de tipos comprimíveis com pelo menos
+    COMPRESSAO['minimo'] bytes, exceto as das views marcadas com sem_compressao. Os arquivos estáticos continuam
+    com o WhiteNoise, que já os serve comprimidos
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        opcoes = settings.COMPRESSAO
+        if not opcoes['ativa'] or response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if getattr(response, 'sem_compressao', False):
+            return response
+        if not response.get('Content-Type', '').startswith(TIPOS_COMPRIMIVEIS):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        if len(response.content) < opcoes['minimo']:
+            return response
+
+        aceitas = codificacoes_aceitas(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        # Com pesos iguais o brotli é preferido, por gerar respostas menores no mesmo tempo
+        brotli_peso, gzip_peso = aceitas.get('br', 0), aceitas.get('gzip', aceitas.get('*', 0))
+        if not brotli_peso and not gzip_peso:
+            return response
+        codificacao = 'br' if brotli_peso >= gzip_peso else 'gzip'
+
+        comprimido = comprimir(response.content, codificacao)
+        if len(comprimido) >= len(response.content):
+            return response
+
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+        response['Content-Encoding'] = codificacao
+        # O corpo enviado muda com a codificação, então o ETag deixa de ser forte, como no GZipMiddleware
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
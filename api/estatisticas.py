@@ -0,0 +1,164 @@
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import (EstatisticaPagamento,
+                     EstatisticaPagamentoDiaria,
+                     EstatisticaPendente,
+                     EstatisticaProduto,
+                     EstatisticaProdutoDiaria,
+                     ProdutoVenda,
+                     Venda,
+                     )
+
+# Chaves atualizadas por UPDATE na consolidação
+TAMANHO_INCREMENTO = 200
+
+
+def registrar_vendas(vendas, itens, sinal=1):
+    """
+    Registra a variação das estatísticas causada pelas vendas informadas e seus ProdutoVenda, devendo ser chamada
+    dentro da mesma transação que grava as vendas. Com sinal=-1 desconta as vendas, usado quando elas são excluídas.
+    A variação é apenas inserida em EstatisticaPendente, sem atualizar as estatísticas de cada produto e pagamento,
+    para que vendas simultâneas dos mesmos produtos ou pagamentos não esperem umas pelas outras. As estatísticas são
+    atualizadas por consolidar
+    """
+    datas = {}
+    pagamentos = {}
+    for venda in vendas:
+        datas[venda.pk] = venda.data_venda
+        _somar(pagamentos, (venda.pagamento_id, venda.data_venda), (sinal, sinal * venda.valor_venda))
+
+    produtos = {}
+    for item in itens:
+        _somar(produtos, (item.produto_id, datas[item.venda_id]),
+               (sinal * item.quantidade,
+                sinal * item.quantidade * item.preco_venda,
+                sinal * item.quantidade * (item.preco_venda - item.preco_compra)))
+
+    EstatisticaPendente.objects.bulk_create(
+        [EstatisticaPendente(produto_id=produto_id, data=data, unidades=valores[0], receita=valores[1],
+                             margem=valores[2]) for (produto_id, data), valores in produtos.items()] +
+        [EstatisticaPendente(pagamento_id=pagamento_id, data=data, vendas=valores[0], valor=valores[1])
+         for (pagamento_id, data), valores in pagamentos.items()])
+
+
+def consolidar(lote=5000):
+    """
+    Soma as variações pendentes às estatísticas de produtos e pagamentos e as remove, em transações de até 'lote'
+    variações. As variações bloqueadas por outra consolidação em andamento são ignoradas. Retorna a quantidade de
+    variações consolidadas
+    """
+    skip_locked = connections[router.db_for_write(EstatisticaPendente)].features.has_select_for_update_skip_locked
+    total = 0
+    while True:
+        with transaction.atomic():
+            pendentes = list(EstatisticaPendente.objects.select_for_update(skip_locked=skip_locked)
+                             .order_by('id')[:lote])
+            if not pendentes:
+                return total
+
+            produtos = {}
+            produtos_dia = {}
+            pagamentos = {}
+            pagamentos_dia = {}
+            for pendente in pendentes:
+                if pendente.produto_id is not None:
+                    valores = (pendente.unidades, pendente.receita, pendente.margem)
+                    _somar(produtos, (pendente.produto_id, ), valores)
+                    _somar(produtos_dia, (pendente.produto_id, pendente.data), valores)
+                else:
+                    valores = (pendente.vendas, pendente.valor)
+                    _somar(pagamentos, (pendente.pagamento_id, ), valores)
+                    _somar(pagamentos_dia, (pendente.pagamento_id, pendente.data), valores)
+
+            _incrementar(EstatisticaProduto, ('produto_id', ), ('unidades', 'receita', 'margem'), produtos)
+            _incrementar(EstatisticaProdutoDiaria, ('produto_id', 'data'), ('unidades', 'receita', 'margem'),
+                         produtos_dia)
+            _incrementar(EstatisticaPagamento, ('pagamento_id', ), ('vendas', 'valor'), pagamentos)
+            _incrementar(EstatisticaPagamentoDiaria, ('pagamento_id', 'data'), ('vendas', 'valor'), pagamentos_dia)
+            EstatisticaPendente.objects.filter(id__in=[pendente.id for pendente in pendentes]).delete()
+
+        total += len(pendentes)
+        if len(pendentes) < lote:
+            return total
+
+
+def recalcular():
+    """
+    Reconstrói todas as estatísticas a partir das vendas registradas, descartando as variações pendentes, que já
+    estão incluídas nas vendas. Vendas anteriores ao registro do preço em
+    ProdutoVenda usam o preço atual do produto
+    """
+    preco_venda = Coalesce('preco_venda', 'produto__preco_venda')
+    preco_compra = Coalesce('preco_compra', 'produto__preco_compra')
+    produtos = ProdutoVenda.objects.values('produto_id', data=F('venda__data_venda')).annotate(
+        total_unidades=Sum('quantidade'),
+        total_receita=Sum(ExpressionWrapper(F('quantidade') * preco_venda, output_field=DecimalField())),
+        total_margem=Sum(ExpressionWrapper(F('quantidade') * (preco_venda - preco_compra),
+                                           output_field=DecimalField())),
+    ).order_by()
+    pagamentos = Venda.objects.values('pagamento_id', data=F('data_venda')).annotate(
+        total_vendas=Count('id'),
+        total_valor=Sum('valor_venda'),
+    ).order_by()
+
+    for model in (EstatisticaPendente, EstatisticaProduto, EstatisticaProdutoDiaria, EstatisticaPagamento,
+                  EstatisticaPagamentoDiaria):
+        model.objects.all().delete()
+
+    totais = {}
+    diarias = []
+    for linha in produtos.iterator():
+        valores = (linha['total_unidades'], linha['total_receita'], linha['total_margem'])
+        _somar(totais, (linha['produto_id'], ), valores)
+        diarias.append(EstatisticaProdutoDiaria(produto_id=linha['produto_id'], data=linha['data'],
+                                                unidades=valores[0], receita=valores[1], margem=valores[2]))
+    EstatisticaProdutoDiaria.objects.bulk_create(diarias, batch_size=500)
+    EstatisticaProduto.objects.bulk_create([EstatisticaProduto(produto_id=produto_id, unidades=valores[0],
+                                                               receita=valores[1], margem=valores[2])
+                                            for (produto_id, ), valores in totais.items()], batch_size=500)
+
+    totais = {}
+    diarias = []
+    for linha in pagamentos.iterator():
+        valores = (linha['total_vendas'], linha['total_valor'])
+        _somar(totais, (linha['pagamento_id'], ), valores)
+        diarias.append(EstatisticaPagamentoDiaria(pagamento_id=linha['pagamento_id'], data=linha['data'],
+                                                  vendas=valores[0], valor=valores[1]))
+    EstatisticaPagamentoDiaria.objects.bulk_create(diarias, batch_size=500)
+    EstatisticaPagamento.objects.bulk_create([EstatisticaPagamento(pagamento_id=pagamento_id, vendas=valores[0],
+                                                                   valor=valores[1])
+                                              for (pagamento_id, ), valores in totais.items()], batch_size=500)
+
+
+def _somar(acumulado, chave, valores):
+    if chave in acumulado:
+        acumulado[chave] = tuple(atual + valor for atual, valor in zip(acumulado[chave], valores))
+    else:
+        acumulado[chave] = tuple(valores)
+
+
+def _incrementar(model, campos_chave, campos_valor, incrementos):
+    if not incrementos:
+        return
+
+    model.objects.bulk_create([model(**dict(zip(campos_chave, chave))) for chave in incrementos],
+                              batch_size=500, ignore_conflicts=True)
+
+    # Cada chave acrescenta um termo ao OR e um When ao Case, e o SQLite recusa expressões com mais de 1000 níveis,
+    # então as chaves são atualizadas em UPDATEs de até TAMANHO_INCREMENTO
+    itens = list(incrementos.items())
+    for inicio in range(0, len(itens), TAMANHO_INCREMENTO):
+        lote = itens[inicio:inicio + TAMANHO_INCREMENTO]
+        condicoes = [Q(**dict(zip(campos_chave, chave))) for chave, _ in lote]
+        filtro = Q()
+        for condicao in condicoes:
+            filtro |= condicao
+
+        model.objects.filter(filtro).update(**{
+            campo: F(campo) + Case(*[When(condicao, then=Value(valores[posicao]))
+                                     for condicao, (_, valores) in zip(condicoes, lote)],
+                                   default=Value(0), output_field=model._meta.get_field(campo).clone())
+            for posicao, campo in enumerate(campos_valor)
+        })
@@ -0,0 +1,20 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class EstoqueInsuficiente(APIException):
+    """
+    O estoque de um ou mais produtos foi consumido por outra venda antes desta ser concluída
+    """
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Um ou mais produtos não possuem mais estoque suficiente para esta venda'
+    default_code = 'estoque_insuficiente'
+
+
+class LoginSobrecarregado(APIException):
+    """
+    Todas as vagas para calcular hashes de senha do processo estão ocupadas
+    """
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Muitos logins em andamento, tente novamente em instantes'
+    default_code = 'login_sobrecarregado'
@@ -0,0 +1,64 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ProdutoVenda
+
+CAMPOS_VENDA = ('id', 'data_venda', 'pagamento_id', 'vendedor_id', 'cliente_id', 'valor_venda')
+CABECALHO_CSV = ('venda', 'data_venda', 'pagamento', 'vendedor', 'cliente', 'valor_venda', 'produto', 'quantidade')
+
+
+def iterar_vendas(queryset, tamanho_lote=1000):
+    """
+    Percorre as vendas do queryset em lotes ordenados por id, buscando os produtos de cada lote com uma única
+    consulta. A memória usada depende apenas do tamanho do lote, e não da quantidade de vendas
+    """
+    queryset = queryset.prefetch_related(None).order_by('id').values(*CAMPOS_VENDA)
+    ultimo = 0
+    while True:
+        vendas = list(queryset.filter(id__gt=ultimo)[:tamanho_lote])
+        if not vendas:
+            return
+
+        produtos = {}
+        for venda_id, produto_id, quantidade in ProdutoVenda.objects.filter(
+                venda_id__in=[venda['id'] for venda in vendas]).order_by('id').values_list(
+                'venda_id', 'produto_id', 'quantidade'):
+            produtos.setdefault(venda_id, []).append((produto_id, quantidade))
+
+        for venda in vendas:
+            yield venda, produtos.get(venda['id'], [])
+
+        ultimo = vendas[-1]['id']
+
+
+def exportar_ndjson(vendas):
+    for venda, produtos in vendas:
+        yield json.dumps({'id': venda['id'],
+                          'data_venda': venda['data_venda'],
+                          'pagamento': venda['pagamento_id'],
+                          'vendedor': venda['vendedor_id'],
+                          'cliente': venda['cliente_id'],
+                          'valor_venda': venda['valor_venda'],
+                          'produtos': [{'produto': produto, 'quantidade': quantidade}
+                                       for produto, quantidade in produtos]},
+                         cls=DjangoJSONEncoder, separators=(',', ':')) + '\n'
+
+
+def exportar_csv(vendas):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CABECALHO_CSV)
+    for venda, produtos in vendas:
+        for produto, quantidade in produtos:
+            yield writer.writerow((venda['id'], venda['data_venda'], venda['pagamento_id'], venda['vendedor_id'],
+                                   venda['cliente_id'], venda['valor_venda'], produto, quantidade))
+
+
+class Echo:
+    """
+    Buffer que apenas devolve o que é escrito, para que o csv.writer gere as linhas sob demanda
+    """
+
+    def write(self, value):
+        return value
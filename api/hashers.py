@@ -0,0 +1,58 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth.hashers import (Argon2PasswordHasher,
+                                         BCryptSHA256PasswordHasher,
+                                         PBKDF2PasswordHasher,
+                                         )
+
+from .exceptions import LoginSobrecarregado
+
+vagas = threading.BoundedSemaphore(settings.SENHAS['workers'])
+
+
+def calcular(funcao, *args):
+    """
+    Calcula o hash na própria thread da requisição, limitando quantos hashes o processo calcula ao mesmo tempo.
+    Sem vaga livre, recusa o login na hora em vez de deixar a requisição esperando por uma
+    """
+    if not vagas.acquire(blocking=False):
+        raise LoginSobrecarregado()
+    try:
+        return funcao(*args)
+    finally:
+        vagas.release()
+
+
+class PBKDF2Configuravel(PBKDF2PasswordHasher):
+    """
+    PBKDF2 com o número de iterações de settings.SENHAS. Senhas gravadas com outro número de iterações são
+    recalculadas no próximo login
+    """
+    iterations = settings.SENHAS['iteracoes']
+
+    def encode(self, password, salt, iterations=None):
+        return calcular(super(PBKDF2Configuravel, self).encode, password, salt, iterations)
+
+
+class Argon2Configuravel(Argon2PasswordHasher):
+    """
+    Argon2 com o custo de tempo de settings.SENHAS, requer o pacote argon2-cffi
+    """
+    time_cost = settings.SENHAS['iteracoes_argon2']
+
+    def encode(self, password, salt):
+        return calcular(super(Argon2Configuravel, self).encode, password, salt)
+
+    def verify(self, password, encoded):
+        return calcular(super(Argon2Configuravel, self).verify, password, encoded)
+
+
+class BCryptConfiguravel(BCryptSHA256PasswordHasher):
+    """
+    BCrypt com o fator de custo de settings.SENHAS, requer o pacote bcrypt
+    """
+    rounds = settings.SENHAS['rodadas_bcrypt']
+
+    def encode(self, password, salt):
+        return calcular(super(BCryptConfiguravel, self).encode, password, salt)
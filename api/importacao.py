@@ -0,0 +1,228 @@
+import codecs
+import csv
+import json
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Value
+from django.db.models.functions import Cast, Greatest, Round
+
+from . import autocompletar, busca, cache_catalogo
+from .models import Categoria, ParticaoEstoque, Produto
+
+TAMANHO_LOTE = 1000
+# Erros detalhados na resposta; os demais são apenas contados
+LIMITE_ERROS = 100
+
+CAMPOS_IMPORTACAO = {
+    'codigo': Produto._meta.get_field('codigo'),
+    'nome': Produto._meta.get_field('nome'),
+    'categoria': Categoria._meta.get_field('nome'),
+    'preco_compra': Produto._meta.get_field('preco_compra'),
+    'preco_venda': Produto._meta.get_field('preco_venda'),
+    'quantidade': Produto._meta.get_field('quantidade'),
+}
+CAMPOS_GRAVADOS = ('nome', 'categoria_id', 'preco_compra', 'preco_venda', 'quantidade', 'disponivel')
+CAMPOS_PRECO = ('preco_venda', 'preco_compra')
+
+
+def ler_csv(linhas):
+    """
+    Pares (número da linha, dicionário) de um CSV com cabeçalho, lido de um iterável de linhas em bytes
+    """
+    leitor = csv.DictReader(codecs.iterdecode(linhas, 'utf-8-sig'))
+    for dados in leitor:
+        yield leitor.line_num, dados
+
+
+def ler_ndjson(linhas):
+    """
+    Pares (número da linha, objeto) de um NDJSON, lido de um iterável de linhas em bytes. Linhas que não são JSON
+    válido geram o objeto None, recusado na validação
+    """
+    for numero, linha in enumerate(codecs.iterdecode(linhas, 'utf-8-sig'), 1):
+        if not linha.strip():
+            continue
+        try:
+            yield numero, json.loads(linha)
+        except ValueError:
+            yield numero, None
+
+
+LEITORES = {
+    'csv': ler_csv,
+    'ndjson': ler_ndjson,
+}
+TIPOS_IMPORTACAO = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+}
+
+
+def validar(dados):
+    """
+    Valores da linha convertidos e conferidos pelos próprios campos dos modelos, com as mesmas regras da API
+    """
+    if not isinstance(dados, dict):
+        raise ValidationError({'non_field_errors': ['A linha deve ter os campos %s' %
+                                                    ', '.join(CAMPOS_IMPORTACAO)]})
+
+    valores = {}
+    erros = {}
+    for campo, field in CAMPOS_IMPORTACAO.items():
+        valor = dados.get(campo)
+        if isinstance(valor, str):
+            valor = valor.strip()
+        try:
+            if campo == 'codigo' and not valor:
+                raise ValidationError('O código é obrigatório na importação')
+            valores[campo] = field.clean(valor, None)
+        except ValidationError as exc:
+            erros[campo] = exc.messages
+    if erros:
+        raise ValidationError(erros)
+    return valores
+
+
+def importar(linhas, formato, tamanho_lote=TAMANHO_LOTE):
+    """
+    Cria ou atualiza os produtos lidos de linhas, um iterável de linhas em bytes no formato csv ou ndjson,
+    identificando-os pelo código. As categorias que não existem são criadas. Cada lote é gravado na sua própria
+    transação, com um INSERT e um UPDATE, então a memória usada depende apenas do tamanho do lote. Linhas
+    inválidas são ignoradas e informadas no resumo retornado
+    """
+    resumo = {'criados': 0, 'atualizados': 0, 'inalterados': 0, 'categorias_criadas': 0, 'invalidos': 0,
+              'erros': []}
+    lote = {}
+    for numero, dados in LEITORES[formato](linhas):
+        try:
+            valores = validar(dados)
+        except ValidationError as exc:
+            resumo['invalidos'] += 1
+            if len(resumo['erros']) < LIMITE_ERROS:
+                resumo['erros'].append({'linha': numero, 'erros': exc.message_dict})
+            continue
+
+        # Códigos repetidos no mesmo lote ficam com a última linha, como aconteceria gravando um por vez
+        lote[valores['codigo']] = valores
+        if len(lote) == tamanho_lote:
+            gravar_lote(lote, resumo)
+            lote = {}
+    if lote:
+        gravar_lote(lote, resumo)
+    return resumo
+
+
+@transaction.atomic
+def gravar_lote(lote, resumo):
+    categorias = {}
+    for valores in lote.values():
+        categoria = Categoria(nome=valores['categoria'])
+        categoria.normalizar()
+        valores['categoria'] = categoria.nome
+        categorias.setdefault(categoria.nome, categoria)
+
+    ids_categorias = dict(Categoria.objects.filter(nome__in=categorias).values_list('nome', 'id'))
+    novas = [categoria for nome, categoria in categorias.items() if nome not in ids_categorias]
+    criadas = 0
+    if novas:
+        try:
+            with transaction.atomic():
+                Categoria.objects.bulk_create(novas)
+            criadas = len(novas)
+        except IntegrityError:
+            # Outra importação criou alguma das categorias ao mesmo tempo. Cada uma é criada à parte, para que o
+            # resumo conte apenas as inseridas por esta importação
+            criadas = sum(Categoria.objects.get_or_create(nome=categoria.nome)[1] for categoria in novas)
+        ids_categorias.update(Categoria.objects.filter(nome__in=[categoria.nome for categoria in novas])
+                              .values_list('nome', 'id'))
+        resumo['categorias_criadas'] += criadas
+
+    existentes = Produto.objects.in_bulk(list(lote), field_name='codigo')
+    criados, alterados, indexados, redistribuidos = [], [], [], []
+    autocompletar_alterado = False
+    for codigo, valores in lote.items():
+        produto = existentes.get(codigo)
+        if produto is None:
+            produto = Produto(codigo=codigo)
+            anterior = None
+        else:
+            anterior = tuple(getattr(produto, campo) for campo in CAMPOS_GRAVADOS)
+
+        produto.nome = valores['nome']
+        produto.categoria_id = ids_categorias[valores['categoria']]
+        produto.preco_compra = valores['preco_compra']
+        produto.preco_venda = valores['preco_venda']
+        produto.quantidade = valores['quantidade']
+        produto.normalizar()
+
+        if anterior is None:
+            criados.append(produto)
+            indexados.append(codigo)
+            continue
+        if anterior == tuple(getattr(produto, campo) for campo in CAMPOS_GRAVADOS):
+            resumo['inalterados'] += 1
+            continue
+
+        produto.versao = None
+        alterados.append(produto)
+        if anterior[:2] != (produto.nome, produto.categoria_id):
+            indexados.append(codigo)
+        if produto.nome_disponivel_alterados:
+            autocompletar_alterado = True
+        # A quantidade lida dos produtos particionados é a soma das partições, que precisam ser refeitas
+        if produto.particoes_estoque and anterior[4] != produto.quantidade:
+            redistribuidos.append(produto)
+
+    Produto.objects.bulk_create(criados)
+    Produto.objects.bulk_update(alterados, CAMPOS_GRAVADOS + ('versao', ))
+    for produto in redistribuidos:
+        ParticaoEstoque.objects.distribuir(produto.pk, produto.quantidade, produto.particoes_estoque)
+    resumo['criados'] += len(criados)
+    resumo['atualizados'] += len(alterados)
+
+    # As gravações em massa não disparam os sinais. Se mudaram os nomes ou a disponibilidade, uma única versão nova
+    # do índice de autocompletar faz os processos o reconstruírem em segundo plano
+    if indexados:
+        busca.indexar_produtos(list(Produto.objects.filter(codigo__in=indexados).values_list('id', flat=True)))
+    if criados or alterados:
+        cache_catalogo.invalidar('produto')
+    if criados or autocompletar_alterado:
+        transaction.on_commit(autocompletar.produtos.invalidar)
+    if criadas:
+        cache_catalogo.invalidar('categoria')
+        transaction.on_commit(autocompletar.categorias.invalidar)
+
+
+def reajustar(queryset, campo='preco_venda', percentual=None, valor=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Reajusta o preço em campo dos produtos do queryset por um percentual ou somando um valor, ambos podendo ser
+    negativos, arredondando para centavos e sem deixar o preço abaixo de 0,01. Cada lote de ids é alterado com um
+    único UPDATE na sua própria transação, para que as vendas não esperem pelo reajuste do catálogo inteiro.
+    Retorna a quantidade de produtos alterados
+    """
+    if campo not in CAMPOS_PRECO:
+        raise ValueError('Campo de preço inválido: %s' % campo)
+
+    if percentual is not None:
+        novo = Round(F(campo) * (Decimal('100') + percentual)) / Decimal('100')
+    else:
+        novo = F(campo) + valor
+    preco = DecimalField(max_digits=20, decimal_places=2)
+    # O mínimo é convertido no banco, já que o SQLite recebe decimais como texto e os compararia como tal
+    novo = Greatest(ExpressionWrapper(novo, output_field=preco), Cast(Value(Decimal('0.01')), preco))
+
+    ids = queryset.order_by('id').values_list('id', flat=True)
+    alterados = 0
+    ultimo = 0
+    while True:
+        lote = list(ids.filter(id__gt=ultimo)[:tamanho_lote])
+        if not lote:
+            return alterados
+
+        with transaction.atomic():
+            alterados += Produto.objects.filter(id__in=lote).update(versao=None, **{campo: novo})
+            cache_catalogo.invalidar('produto')
+        ultimo = lote[-1]
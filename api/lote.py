@@ -0,0 +1,146 @@
+from django.db import IntegrityError, OperationalError, transaction
+from rest_framework import status
+
+from . import estatisticas
+from .exceptions import EstoqueInsuficiente
+from .models import (Pagamento,
+                     Produto,
+                     ProdutoVenda,
+                     User,
+                     Venda,
+                     )
+
+# Código do PostgreSQL para o impasse entre transações
+IMPASSE = '40P01'
+TENTATIVAS = 3
+
+
+def registrar_lote(vendedor, vendas):
+    """
+    Registra um lote de vendas já validadas pelo VendaLoteSerializer.
+    Todos os objetos referenciados são buscados de uma vez, dentro de uma única transação, e cada venda é gravada
+    no seu próprio savepoint, para que a falta de estoque ou uma chave registrada ao mesmo tempo por outra
+    requisição recuse só aquela venda. Retorna, na ordem do lote, um dicionário por venda com a chave, o status e
+    o id da venda criada (ou já registrada anteriormente com a mesma chave), ou os erros encontrados.
+    As partições bloqueadas pelas vendas anteriores do lote continuam bloqueadas até o fim da transação, então
+    dois lotes que esgotam as mesmas partições podem entrar em impasse; o banco desfaz um deles, que é repetido
+    """
+    if not vendas:
+        return []
+
+    for tentativa in range(TENTATIVAS):
+        try:
+            with transaction.atomic():
+                return _registrar_lote(vendedor, vendas)
+        except OperationalError as exc:
+            if getattr(exc.__cause__, 'pgcode', None) != IMPASSE or tentativa == TENTATIVAS - 1:
+                raise
+
+
+def _registrar_lote(vendedor, vendas):
+    registradas = dict(Venda.objects.filter(vendedor=vendedor, chave__in=[venda['chave'] for venda in vendas])
+                       .values_list('chave', 'id'))
+    pagamentos = Pagamento.objects.in_bulk({venda['pagamento'] for venda in vendas})
+    clientes = User.objects.in_bulk({venda['cliente'] for venda in vendas})
+    # Os produtos com estoque particionado não são bloqueados, para que lotes e vendas simultâneos não esperem
+    # pela linha do produto; a baixa nas partições confere o estoque
+    ids = {item['produto'] for venda in vendas for item in venda['produtos']}
+    produtos = Produto.objects.select_for_update().filter(particoes_estoque=0).order_by('id').in_bulk(ids)
+    if len(produtos) < len(ids):
+        produtos.update(Produto.objects.in_bulk(ids - produtos.keys()))
+
+    estoque = {produto.id: produto.quantidade for produto in produtos.values()}
+    resultados = []
+    gravadas = []
+    linhas = []
+
+    for venda in vendas:
+        chave = venda['chave']
+        if chave in registradas:
+            resultados.append({'chave': chave, 'status': status.HTTP_200_OK, 'venda': registradas[chave]})
+            continue
+
+        erros = _validar(venda, pagamentos, clientes, produtos, estoque)
+        if erros:
+            resultados.append({'chave': chave, 'status': status.HTTP_400_BAD_REQUEST, 'erros': erros})
+            continue
+
+        try:
+            with transaction.atomic():
+                instance, itens = _gravar(vendedor, venda, pagamentos, clientes, produtos)
+        except EstoqueInsuficiente as exc:
+            resultados.append({'chave': chave, 'status': exc.status_code,
+                               'erros': {'produtos': [exc.detail]}})
+            continue
+        except IntegrityError:
+            # Outra requisição registrou a mesma chave depois da consulta inicial
+            registrada = Venda.objects.filter(vendedor=vendedor, chave=chave).values_list('id', flat=True).first()
+            if registrada is None:
+                raise
+            registradas[chave] = registrada
+            resultados.append({'chave': chave, 'status': status.HTTP_200_OK, 'venda': registrada})
+            continue
+
+        for item in venda['produtos']:
+            estoque[item['produto']] -= item['quantidade']
+        registradas[chave] = instance.pk
+        gravadas.append(instance)
+        linhas.extend(itens)
+        resultados.append({'chave': chave, 'status': status.HTTP_201_CREATED, 'venda': instance.pk})
+
+    if gravadas:
+        estatisticas.registrar_vendas(gravadas, linhas)
+
+    return resultados
+
+
+def _gravar(vendedor, venda, pagamentos, clientes, produtos):
+    pagamento = pagamentos[venda['pagamento']]
+    instance = Venda.objects.create(pagamento=pagamento,
+                                    cliente=clientes[venda['cliente']],
+                                    vendedor=vendedor,
+                                    chave=venda['chave'],
+                                    valor_venda=Venda.calcular_valor(
+                                        pagamento, [(produtos[item['produto']], item['quantidade'])
+                                                    for item in venda['produtos']]))
+
+    linhas = ProdutoVenda.objects.bulk_create([ProdutoVenda(venda=instance,
+                                                            produto=produtos[item['produto']],
+                                                            quantidade=item['quantidade'],
+                                                            preco_venda=produtos[item['produto']].preco_venda,
+                                                            preco_compra=produtos[item['produto']].preco_compra)
+                                               for item in venda['produtos']])
+
+    baixa = {}
+    for item in venda['produtos']:
+        baixa[item['produto']] = baixa.get(item['produto'], 0) + item['quantidade']
+    particoes = {produto_id: produtos[produto_id].particoes_estoque for produto_id in baixa
+                 if produtos[produto_id].particoes_estoque}
+    if Produto.objects.baixar_estoque(baixa, particoes) != len(baixa):
+        raise EstoqueInsuficiente()
+
+    return instance, linhas
+
+
+def _validar(venda, pagamentos, clientes, produtos, estoque):
+    erros = {}
+    if venda['pagamento'] not in pagamentos:
+        erros['pagamento'] = ['Pagamento não encontrado']
+    if venda['cliente'] not in clientes:
+        erros['cliente'] = ['Cliente não encontrado']
+
+    requisitado = {}
+    for item in venda['produtos']:
+        requisitado[item['produto']] = requisitado.get(item['produto'], 0) + item['quantidade']
+
+    for produto_id, quantidade in requisitado.items():
+        produto = produtos.get(produto_id)
+        if produto is None:
+            erros.setdefault('produtos', []).append('Produto não encontrado')
+        elif not produto.disponivel:
+            erros.setdefault('produtos', []).append('O produto %s não está disponível' % produto.nome)
+        elif quantidade > estoque[produto_id]:
+            erros.setdefault('produtos', []).append(
+                'O produto %s possui apenas %d em estoque' % (produto.nome, estoque[produto_id]))
+
+    return erros
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from api import estatisticas, resumos
+
+
+class Command(BaseCommand):
+    help = ('Consolida as estatísticas pendentes das vendas e atualiza os resumos diários de vendas usados por '
+            'stats/series, continuando do último dia resumido. Deve ser agendado periodicamente')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Refaz os resumos a partir desta data, no formato AAAA-MM-DD')
+
+    def handle(self, *args, **options):
+        desde = None
+        if options['desde']:
+            desde = parse_date(options['desde'])
+            if desde is None:
+                raise CommandError('Informe a data no formato AAAA-MM-DD')
+
+        consolidadas = estatisticas.consolidar()
+        with transaction.atomic():
+            quantidade = resumos.atualizar(desde)
+
+        self.stdout.write(self.style.SUCCESS('%d estatísticas consolidadas, %d resumos gravados'
+                                             % (consolidadas, quantidade)))
@@ -0,0 +1,393 @@
+import asyncio
+import json
+import subprocess
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import busca
+from api.management.commands import benchmark_servidor
+from api.management.dados import HOST, SEM_CACHE, SEM_LIMITES, banco_descartavel
+from api.management.commands.numerar_sincronizacao import numerar_todas
+from api.management.commands.verificar_indices import semear_volume
+from api.models import Categoria, Pagamento, Produto, User, Venda
+from api.serializers import ObterTokenSerializer
+
+SENHA = 'P@ssw0rD-benchmark'
+# JSON nas listagens, sem impedir as rotas que escolhem outro formato pelo parâmetro format
+ACEITOS = 'application/json, */*;q=0.1'
+# Corpos em bytes são enviados como NDJSON, como na importação de catálogo
+TIPO_BRUTO = 'application/x-ndjson'
+MODOS = ('cliente', 'servidor')
+
+
+class Command(BaseCommand):
+    help = ('Cria um volume de dados parametrizado e mede cada rota da API, pelo cliente de testes do Django e por '
+            'um servidor gunicorn local: requisições por segundo, latências p50, p95 e p99, consultas ao banco e '
+            'pico de memória por requisição. Os resultados são gravados em JSON, para comparar versões. Os dados '
+            'são criados em um banco descartável, destruído ao final')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categorias', type=int, default=50)
+        parser.add_argument('--produtos', type=int, default=10000)
+        parser.add_argument('--vendedores', type=int, default=20)
+        parser.add_argument('--clientes', type=int, default=200)
+        parser.add_argument('--vendas', type=int, default=20000)
+        parser.add_argument('--itens', type=int, default=3, help='Quantidade máxima de produtos por venda')
+        parser.add_argument('--requisicoes', type=int, default=200, help='Requisições por rota em cada modo')
+        parser.add_argument('--modos', default=','.join(MODOS),
+                            help='Modos separados por vírgula: cliente, servidor')
+        parser.add_argument('--rotas', help='Nomes das rotas medidas, separados por vírgula. Por padrão, todas')
+        parser.add_argument('--servidor', default='sync', choices=sorted(benchmark_servidor.MODOS))
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concorrencia', type=int, default=10)
+        parser.add_argument('--porta', type=int, default=8766)
+        parser.add_argument('--saida', default='benchmark_api.json')
+        parser.add_argument('--comparar', help='JSON de uma execução anterior, para mostrar as diferenças')
+
+    def handle(self, *args, **options):
+        modos = options['modos'].split(',')
+        if set(modos) - set(MODOS):
+            raise CommandError('Modos disponíveis: %s' % ', '.join(MODOS))
+
+        with banco_descartavel() as ambiente:
+            inicio = time.perf_counter()
+            dados = preparar(options)
+            self.stdout.write('Dados criados em %.1f s' % (time.perf_counter() - inicio))
+
+            lista = cenarios(dados)
+            cobertas = {rota for rota, _, _, _ in lista}
+            sem_cenario = [rota for rota in listar_rotas() if rota not in cobertas]
+            if sem_cenario:
+                self.stderr.write('Rotas sem cenário: %s' % ', '.join(sem_cenario))
+            if options['rotas']:
+                lista = [cenario for cenario in lista if cenario[0] in options['rotas'].split(',')]
+
+            resultados = {}
+            for modo in modos:
+                if modo == 'cliente':
+                    resultados[modo] = medir_cliente(lista, dados['tokens'], options['requisicoes'])
+                else:
+                    servidor = benchmark_servidor.iniciar_servidor(options['servidor'], options['workers'],
+                                                                   options['porta'], ambiente)
+                    try:
+                        resultados[modo] = asyncio.run(medir_servidor(lista, dados['tokens'], options))
+                    finally:
+                        servidor.terminate()
+                        servidor.wait()
+                self.escrever(modo, resultados[modo])
+
+        relatorio = {
+            'versao': versao_codigo(),
+            'data': timezone.now().isoformat(),
+            'banco': connection.vendor,
+            'parametros': {parametro: options[parametro] for parametro in (
+                'categorias', 'produtos', 'vendedores', 'clientes', 'vendas', 'itens', 'requisicoes', 'servidor',
+                'workers', 'concorrencia')},
+            'sem_cenario': sem_cenario,
+            'resultados': resultados,
+        }
+        with open(options['saida'], 'w') as arquivo:
+            json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS('Resultados gravados em %s' % options['saida']))
+
+        if options['comparar']:
+            with open(options['comparar']) as arquivo:
+                self.comparar(json.load(arquivo), relatorio)
+
+    def escrever(self, modo, resultados):
+        self.stdout.write('\n%s' % modo)
+        self.stdout.write('%-40s %9s %9s %9s %9s %9s %11s %6s' % (
+            'rota', 'req/s', 'p50 (ms)', 'p95 (ms)', 'p99 (ms)', 'consultas', 'memória (KB)', 'erros'))
+        for chave, resultado in resultados.items():
+            self.stdout.write('%-40s %9.1f %9.2f %9.2f %9.2f %9s %11s %6d' % (
+                chave, resultado['requisicoes_por_segundo'], resultado['p50_ms'], resultado['p95_ms'],
+                resultado['p99_ms'], resultado['consultas'] if resultado['consultas'] is not None else '-',
+                resultado['memoria_pico_kb'] if resultado['memoria_pico_kb'] is not None else '-',
+                resultado['erros']))
+
+    def comparar(self, anterior, atual):
+        self.stdout.write('\nComparação com %s (%s)' % (anterior.get('versao'), anterior.get('data')))
+        self.stdout.write('%-9s %-40s %10s %10s %10s' % ('modo', 'rota', 'p50 antes', 'p50 agora', 'req/s'))
+        for modo, resultados in atual['resultados'].items():
+            for chave, resultado in resultados.items():
+                antes = anterior.get('resultados', {}).get(modo, {}).get(chave)
+                if antes is None:
+                    continue
+                self.stdout.write('%-9s %-40s %10.2f %10.2f %+9.1f%%' % (
+                    modo, chave, antes['p50_ms'], resultado['p50_ms'],
+                    (resultado['requisicoes_por_segundo'] / antes['requisicoes_por_segundo'] - 1) * 100))
+
+
+def listar_rotas(resolver=None, prefixo=''):
+    """
+    Nomes das rotas do projeto, ou o caminho das que não têm nome, exceto as do admin do Django
+    """
+    resolver = resolver or get_resolver()
+    rotas = []
+    for padrao in resolver.url_patterns:
+        caminho = prefixo + str(padrao.pattern)
+        if isinstance(padrao, URLResolver):
+            if padrao.app_name != 'admin':
+                rotas += listar_rotas(padrao, caminho)
+        else:
+            rotas.append(padrao.name or '/' + caminho)
+    return rotas
+
+
+def preparar(options):
+    """
+    Cria o volume de dados e os usuários autenticados nos cenários, e retorna os objetos usados nas requisições
+    """
+    vendedor = semear_volume(options['produtos'], options['vendas'], options['vendedores'], options['clientes'],
+                             categorias=options['categorias'], itens=options['itens'])
+    vendedor.set_password(SENHA)
+    vendedor.save()
+    admin = User.objects.create_user('volume_admin', is_staff=True)
+    cliente = User.objects.filter(username__startswith='volume_cliente_').order_by('id').first()
+    busca.reindexar()
+    numerar_todas()
+
+    refresh = ObterTokenSerializer.get_token(vendedor)
+    return {
+        'vendedor': vendedor,
+        'cliente': cliente,
+        'produto': Produto.objects.filter(nome__startswith='VOLUME ', disponivel=True).order_by('id').first(),
+        'estoque': list(Produto.objects.filter(nome__startswith='VOLUME ', quantidade__gte=50).order_by(
+            'id').values_list('id', flat=True)),
+        'categoria': Categoria.objects.filter(nome__startswith='VOLUME ').order_by('id').first(),
+        'pagamento': Pagamento.objects.filter(nome__startswith='volume ').order_by('id').first(),
+        'venda': Venda.objects.filter(vendedor=vendedor).order_by('id').first(),
+        'tokens': {
+            'vendedor': str(refresh.access_token),
+            'cliente': str(ObterTokenSerializer.get_token(cliente).access_token),
+            'admin': str(ObterTokenSerializer.get_token(admin).access_token),
+            'metricas': settings.METRICAS['token'],
+            None: None,
+        },
+        'refresh': str(refresh),
+    }
+
+
+def cenarios(dados):
+    """
+    Quádruplas (rota, método, usuário, gerar), em que gerar recebe o número da requisição e o modo e retorna a
+    URL e o corpo. As gravações usam nomes e chaves diferentes a cada requisição
+    """
+    vendedor, cliente, produto = dados['vendedor'], dados['cliente'], dados['produto']
+    estoque = dados['estoque']
+
+    def fixo(url, corpo=None):
+        return lambda i, modo: (url, corpo)
+
+    def catalogo(i, modo):
+        # Metade das linhas cria produtos novos a cada requisição e a outra metade atualiza sempre os mesmos
+        linhas = [{'codigo': 'volume-%s-%d-%d' % (modo, i, n) if n % 2 else 'volume-%s-%d' % (modo, n),
+                   'nome': 'VOLUME IMPORTACAO %s %d %d' % (modo, i, n), 'categoria': 'VOLUME IMPORTACAO',
+                   'preco_compra': '10.00', 'preco_venda': '13.00', 'quantidade': i % 50}
+                  for n in range(100)]
+        return reverse('produto-importar'), ''.join(json.dumps(linha) + '\n' for linha in linhas).encode()
+
+    def venda(i, modo):
+        return {
+            'pagamento': reverse('pagamento-detail', args=[dados['pagamento'].id]),
+            'produtos': [{'produto': reverse('produto-detail', args=[estoque[i % len(estoque)]]), 'quantidade': 1}],
+            'cliente': reverse('user-detail', args=[cliente.id]),
+            'vendedor': reverse('user-detail', args=[vendedor.id]),
+        }
+
+    return [
+        ('api-root', 'GET', 'vendedor', fixo(reverse('api-root'))),
+        ('/', 'GET', None, fixo('/')),
+        ('schema-swagger-ui', 'GET', None, fixo(reverse('schema-swagger-ui') + '?format=openapi')),
+        ('token_obtain_pair', 'POST', None, fixo(reverse('token_obtain_pair'),
+                                                 {'username': vendedor.username, 'password': SENHA})),
+        ('token_verify', 'POST', None, fixo(reverse('token_verify'), {'token': dados['tokens']['vendedor']})),
+        ('token_refresh', 'POST', None, fixo(reverse('token_refresh'), {'refresh': dados['refresh']})),
+        ('categoria', 'GET', 'vendedor', fixo(reverse('categoria'))),
+        ('categoria', 'POST', 'vendedor', lambda i, modo: (
+            reverse('categoria'), {'nome': 'VOLUME BENCHMARK %s %d' % (modo, i)})),
+        ('categoria-detail', 'GET', 'vendedor', fixo(reverse('categoria-detail', args=[dados['categoria'].id]))),
+        ('pagamento', 'GET', 'vendedor', fixo(reverse('pagamento'))),
+        ('pagamento-detail', 'GET', 'vendedor', fixo(reverse('pagamento-detail', args=[dados['pagamento'].id]))),
+        ('produto', 'GET', 'vendedor', fixo(reverse('produto'))),
+        ('produto', 'GET', None, fixo(reverse('produto') + '?disponivel=true&ordering=preco_venda')),
+        ('produto', 'POST', 'vendedor', lambda i, modo: (reverse('produto'), {
+            'nome': 'VOLUME BENCHMARK %s %d' % (modo, i), 'preco_compra': '10.00', 'preco_venda': '13.00',
+            'quantidade': 10, 'categoria': reverse('categoria-detail', args=[dados['categoria'].id])})),
+        ('produto-detail', 'GET', 'vendedor', fixo(reverse('produto-detail', args=[produto.id]))),
+        ('produto-importar', 'POST', 'vendedor', catalogo),
+        # Alterna acréscimos e descontos, para que os preços não mudem ao longo das requisições
+        ('produto-reajuste', 'POST', 'vendedor', lambda i, modo: (
+            reverse('produto-reajuste') + '?categoria=%d' % dados['categoria'].id,
+            {'valor': '0.01' if i % 2 else '-0.01'})),
+        ('produto-busca', 'GET', None, fixo(reverse('produto-busca') + '?q=%s' % produto.nome.split()[1].lower())),
+        ('autocompletar', 'GET', None, fixo(reverse('autocompletar') + '?q=volume%20a')),
+        ('sincronizacao', 'GET', 'vendedor', fixo(reverse('sincronizacao') + '?since=0')),
+        ('venda', 'GET', 'vendedor', fixo(reverse('venda'))),
+        ('venda', 'GET', 'cliente', fixo(reverse('venda'))),
+        ('venda', 'POST', 'vendedor', lambda i, modo: (reverse('venda'), venda(i, modo))),
+        ('venda-detail', 'GET', 'vendedor', fixo(reverse('venda-detail', args=[dados['venda'].id]))),
+        ('venda-lote', 'POST', 'vendedor', lambda i, modo: (
+            reverse('venda-lote'), [dict(venda(i, modo), chave='volume-benchmark-%s-%d' % (modo, i))])),
+        ('venda-exportar', 'GET', 'vendedor', fixo(reverse('venda-exportar') + '?formato=ndjson')),
+        ('user', 'GET', 'vendedor', fixo(reverse('user'))),
+        ('user-detail', 'GET', 'vendedor', fixo(reverse('user-detail', args=[cliente.id]))),
+        ('produto-mais-vendido', 'GET', None, fixo(reverse('produto-mais-vendido'))),
+        ('pagamento-mais-utilizado', 'GET', None, fixo(reverse('pagamento-mais-utilizado'))),
+        ('produtos-mais-vendidos', 'GET', None, fixo(reverse('produtos-mais-vendidos'))),
+        ('pagamentos-mais-utilizados', 'GET', None, fixo(reverse('pagamentos-mais-utilizados'))),
+        ('serie-vendas', 'GET', 'vendedor', fixo(reverse('serie-vendas'))),
+        ('saude-banco', 'GET', 'admin', fixo(reverse('saude-banco'))),
+        ('metricas', 'GET', 'metricas', fixo(reverse('metricas'))),
+    ]
+
+
+def chave(rota, metodo, usuario):
+    return '%s %s%s' % (metodo, rota, ' (%s)' % usuario if usuario else '')
+
+
+def medir_cliente(lista, tokens, requisicoes):
+    """
+    Mede cada cenário pelo cliente de testes, no mesmo processo. As consultas e a memória são medidas em uma
+    requisição a mais, sem os caches, para que não dependam de a resposta já estar guardada
+    """
+    client = APIClient(SERVER_NAME=HOST)
+    resultados = {}
+    for rota, metodo, usuario, gerar in lista:
+        credenciais = {'HTTP_ACCEPT': ACEITOS}
+        if usuario:
+            credenciais['HTTP_AUTHORIZATION'] = 'Bearer %s' % tokens[usuario]
+        latencias = []
+        respostas = Counter()
+        with override_settings(LIMITES=SEM_LIMITES):
+            # A primeira requisição de cada rota carrega módulos e monta caches, e não entra na medição
+            requisitar(client, metodo, *gerar(-1, 'cliente'), credenciais)
+            inicio = time.perf_counter()
+            for i in range(requisicoes):
+                url, corpo = gerar(i, 'cliente')
+                antes = time.perf_counter()
+                respostas[requisitar(client, metodo, url, corpo, credenciais)] += 1
+                latencias.append(time.perf_counter() - antes)
+            duracao = time.perf_counter() - inicio
+
+        url, corpo = gerar(requisicoes, 'cliente')
+        with override_settings(CACHES=SEM_CACHE, LIMITES=SEM_LIMITES), ExitStack() as pilha:
+            capturas = [pilha.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            tracemalloc.start()
+            requisitar(client, metodo, url, corpo, credenciais)
+            memoria = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        resultados[chave(rota, metodo, usuario)] = resumir(latencias, duracao, respostas, metodo, url,
+                                                           sum(len(captura) for captura in capturas),
+                                                           memoria // 1024)
+    return resultados
+
+
+def requisitar(client, metodo, url, corpo, credenciais):
+    if metodo == 'GET':
+        response = client.get(url, **credenciais)
+    elif isinstance(corpo, bytes):
+        response = client.generic(metodo, url, corpo, content_type=TIPO_BRUTO, **credenciais)
+    else:
+        response = getattr(client, metodo.lower())(url, corpo, format='json', **credenciais)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response.status_code
+
+
+async def medir_servidor(lista, tokens, options):
+    """
+    Mede cada cenário por requisições HTTP concorrentes ao servidor local. Consultas e memória só são medidas
+    pelo cliente de testes, que roda no mesmo processo da aplicação
+    """
+    resultados = {}
+    for rota, metodo, usuario, gerar in lista:
+        vagas = asyncio.Semaphore(options['concorrencia'])
+        latencias = []
+        respostas = Counter()
+
+        async def medir(i):
+            url, corpo = gerar(i, 'servidor')
+            async with vagas:
+                antes = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(enviar(options['porta'], metodo, url, tokens[usuario], corpo),
+                                                    benchmark_servidor.TEMPO_LIMITE)
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                    status = 0
+                latencias.append(time.perf_counter() - antes)
+                respostas[status] += 1
+
+        # Aquece os workers, que carregam módulos e abrem conexões na primeira requisição de cada rota
+        await asyncio.gather(*[medir(-1 - i) for i in range(options['concorrencia'])])
+        latencias.clear()
+        respostas.clear()
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*[medir(i) for i in range(options['requisicoes'])])
+        duracao = time.perf_counter() - inicio
+        resultados[chave(rota, metodo, usuario)] = resumir(latencias, duracao, respostas, metodo,
+                                                           gerar(0, 'servidor')[0], None, None)
+    return resultados
+
+
+async def enviar(porta, metodo, url, token, corpo):
+    reader, writer = await asyncio.open_connection(benchmark_servidor.HOST, porta)
+    conteudo = corpo if isinstance(corpo, bytes) else json.dumps(corpo).encode() if corpo is not None else b''
+    cabecalhos = ['%s %s HTTP/1.1' % (metodo, url), 'Host: localhost', 'Accept: %s' % ACEITOS,
+                  'Connection: close']
+    if token:
+        cabecalhos.append('Authorization: Bearer %s' % token)
+    if corpo is not None:
+        cabecalhos += ['Content-Type: %s' % (TIPO_BRUTO if isinstance(corpo, bytes) else 'application/json'),
+                       'Content-Length: %d' % len(conteudo)]
+    writer.write(('\r\n'.join(cabecalhos) + '\r\n\r\n').encode() + conteudo)
+    status = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status.split(b' ')[1])
+
+
+def resumir(latencias, duracao, respostas, metodo, url, consultas, memoria_kb):
+    """
+    Resultado de um cenário. Respostas conta as requisições por status HTTP, com 0 para as que falharam sem
+    resposta, e erros são as com status 0 ou a partir de 400
+    """
+    latencias = sorted(latencias)
+    return {
+        'metodo': metodo,
+        'url': url,
+        'requisicoes': len(latencias),
+        'erros': sum(quantidade for status, quantidade in respostas.items() if not 0 < status < 400),
+        'respostas': {str(status): quantidade for status, quantidade in sorted(respostas.items())},
+        'requisicoes_por_segundo': round(len(latencias) / duracao, 1),
+        'p50_ms': round(percentil(latencias, 0.5) * 1000, 3),
+        'p95_ms': round(percentil(latencias, 0.95) * 1000, 3),
+        'p99_ms': round(percentil(latencias, 0.99) * 1000, 3),
+        'consultas': consultas,
+        'memoria_pico_kb': memoria_kb,
+    }
+
+
+def percentil(ordenadas, fracao):
+    return ordenadas[max(int(len(ordenadas) * fracao) - 1, 0)]
+
+
+def versao_codigo():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
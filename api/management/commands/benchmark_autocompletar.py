@@ -0,0 +1,67 @@
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api import autocompletar
+from api.management.commands.benchmark_busca import semear_catalogo
+from api.management.dados import HOST, SEM_LIMITES
+from api.models import Produto
+
+
+class Command(BaseCommand):
+    help = ('Cria um catálogo, constrói o índice de autocompletar e mede a memória ocupada, a latência das buscas '
+            'por prefixo no índice e as requisições por segundo do endpoint. Os dados são criados dentro de uma '
+            'transação que é desfeita ao final')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=100000)
+        parser.add_argument('--buscas', type=int, default=20000)
+        parser.add_argument('--requisicoes', type=int, default=2000)
+        parser.add_argument('--limite', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            semear_catalogo(options['produtos'])
+            aleatorio = random.Random(0)
+            nomes = list(Produto.objects.values_list('nome', flat=True)[:1000])
+            prefixos = [nome[:aleatorio.randint(1, 8)].lower() for nome in nomes]
+
+            tracemalloc.start()
+            inicio = time.perf_counter()
+            autocompletar.produtos.reconstruir(autocompletar.produtos.versao_atual())
+            autocompletar.categorias.reconstruir(autocompletar.categorias.versao_atual())
+            construcao = time.perf_counter() - inicio
+            memoria = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            self.stdout.write('Índice de %d produtos construído em %.2f s, ocupando %.1f MB' % (
+                options['produtos'], construcao, memoria / 1024 / 1024))
+
+            latencias = []
+            for i in range(options['buscas']):
+                inicio = time.perf_counter()
+                autocompletar.produtos.buscar(prefixos[i % len(prefixos)], options['limite'])
+                latencias.append(time.perf_counter() - inicio)
+            latencias.sort()
+            self.stdout.write('Busca no índice: p50 %.1f us, p99 %.1f us, %.0f buscas/s' % (
+                statistics.median(latencias) * 10 ** 6, latencias[int(len(latencias) * 0.99) - 1] * 10 ** 6,
+                len(latencias) / sum(latencias)))
+
+            client = APIClient(SERVER_NAME=HOST)
+            url = reverse('autocompletar')
+            with override_settings(LIMITES=SEM_LIMITES):
+                inicio = time.perf_counter()
+                for i in range(options['requisicoes']):
+                    response = client.get(url, {'q': prefixos[i % len(prefixos)], 'limite': options['limite']})
+                    assert response.status_code == 200, response.status_code
+                duracao = time.perf_counter() - inicio
+            self.stdout.write('Endpoint: %.0f requisições/s em uma thread, %.2f ms por requisição' % (
+                options['requisicoes'] / duracao, duracao / options['requisicoes'] * 1000))
+
+            transaction.set_rollback(True)
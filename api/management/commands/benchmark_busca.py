@@ -0,0 +1,94 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api import busca
+from api.models import Categoria, Produto
+
+TIPOS = ('CAMISA', 'CAMISETA', 'CALÇA', 'BERMUDA', 'TÊNIS', 'SANDÁLIA', 'BOTA', 'MEIA', 'BONÉ', 'JAQUETA',
+         'MOLETOM', 'VESTIDO', 'SAIA', 'BLUSA', 'PIJAMA', 'CINTO', 'MOCHILA', 'BOLSA', 'CARTEIRA', 'RELÓGIO',
+         'ÓCULOS', 'CHINELO', 'SAPATO', 'LUVA', 'CACHECOL', 'GORRO', 'MAIÔ', 'BIQUÍNI', 'SUNGA', 'REGATA')
+CORES = ('AZUL', 'PRETO', 'BRANCO', 'VERMELHO', 'VERDE', 'AMARELO', 'CINZA', 'ROSA', 'MARROM', 'BEGE')
+MATERIAIS = ('ALGODÃO', 'COURO', 'JEANS', 'LINHO', 'SEDA', 'LÃ', 'POLIÉSTER', 'NYLON', 'CAMURÇA', 'MALHA')
+SILABAS = ('BA', 'CO', 'DI', 'FU', 'GA', 'LE', 'MI', 'NO', 'PA', 'RE', 'SI', 'TO', 'VA', 'XE', 'ZU')
+SECOES = ('MASCULINO', 'FEMININO', 'INFANTIL', 'ESPORTE', 'PRAIA', 'INVERNO', 'SOCIAL', 'CASUAL', 'ACESSÓRIOS',
+          'CALÇADOS')
+CONSULTAS = (
+    ('palavra', 'camisa'),
+    ('duas palavras', 'camisa azul'),
+    ('prefixo', 'cami'),
+    ('sem acento', 'calca jeans'),
+    ('erro de digitação', 'camsia algodao'),
+    ('categoria', 'calcados couro'),
+    ('marca', None),
+    ('código', None),
+)
+
+
+class Command(BaseCommand):
+    help = ('Cria um catálogo com nomes de produtos variados e mede a latência da busca de produtos para palavras '
+            'inteiras, prefixos, erros de digitação e palavras da categoria. Os dados são criados dentro de uma '
+            'transação que é desfeita ao final')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=100000)
+        parser.add_argument('--repeticoes', type=int, default=20)
+        parser.add_argument('--limite', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            inicio = time.perf_counter()
+            marca, codigo = semear_catalogo(options['produtos'])
+            busca.reindexar()
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write('%d produtos criados e indexados em %.1f s (busca %s)' % (
+                options['produtos'], time.perf_counter() - inicio, 'nativa' if busca.nativa() else 'por índice'))
+
+            self.stdout.write('%-20s %-22s %10s %10s %10s %10s' % ('consulta', 'texto', 'resultados', 'p50 (ms)',
+                                                                   'p99 (ms)', 'max (ms)'))
+            for nome, texto in CONSULTAS:
+                texto = texto or {'marca': marca, 'código': codigo}[nome]
+                latencias = []
+                for _ in range(options['repeticoes']):
+                    inicio = time.perf_counter()
+                    resultados = busca.buscar(texto, options['limite'])
+                    latencias.append(time.perf_counter() - inicio)
+                latencias.sort()
+                self.stdout.write('%-20s %-22s %10d %10.1f %10.1f %10.1f' % (
+                    nome, texto, len(resultados), statistics.median(latencias) * 1000,
+                    latencias[max(int(len(latencias) * 0.99) - 1, 0)] * 1000, latencias[-1] * 1000))
+
+            transaction.set_rollback(True)
+
+
+def semear_catalogo(produtos):
+    """
+    Cria categorias e produtos com nomes formados por tipo, cor, material, marca e código. Retorna uma marca e um
+    código existentes, para serem buscados
+    """
+    aleatorio = random.Random(0)
+    Categoria.objects.bulk_create([Categoria(nome='%s %s' % (secao, tipo)) for secao in SECOES for tipo in TIPOS[:5]])
+    categorias = list(Categoria.objects.filter(nome__in=['%s %s' % (secao, tipo) for secao in SECOES
+                                                          for tipo in TIPOS[:5]]).values_list('id', flat=True))
+    marcas = sorted({''.join(aleatorio.choice(SILABAS) for _ in range(aleatorio.randint(2, 4)))
+                     for _ in range(2000)})
+
+    novos = []
+    for i in range(produtos):
+        preco_compra = Decimal(aleatorio.randint(100, 100000)) / 100
+        quantidade = aleatorio.randint(0, 100)
+        nome = '%s %s %s %s REF%06d' % (aleatorio.choice(TIPOS), aleatorio.choice(CORES),
+                                        aleatorio.choice(MATERIAIS), aleatorio.choice(marcas), i)
+        novos.append(Produto(nome=nome, preco_compra=preco_compra, preco_venda=preco_compra * 2,
+                             quantidade=quantidade, disponivel=quantidade > 0,
+                             categoria_id=aleatorio.choice(categorias)))
+        if len(novos) >= 5000:
+            Produto.objects.bulk_create(novos)
+            novos = []
+    Produto.objects.bulk_create(novos)
+    return marcas[len(marcas) // 2].lower(), 'ref%06d' % (produtos // 2)
@@ -0,0 +1,80 @@
+import gzip
+import time
+
+import brotli
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.management.dados import HOST
+from api.management.commands.verificar_indices import semear_volume
+from api.models import Produto, Venda
+from api.renderers import JSONRapidoRenderer, MessagePackRenderer
+from api.serializers import ProdutoSerializer, VendaSerializer
+
+RENDERERS = (
+    ('json drf', JSONRenderer()),
+    ('json orjson', JSONRapidoRenderer()),
+    ('msgpack', MessagePackRenderer()),
+)
+COMPRESSOES = (
+    ('identity', lambda conteudo: conteudo),
+    ('gzip 1', lambda conteudo: gzip.compress(conteudo, compresslevel=1, mtime=0)),
+    ('gzip 6', lambda conteudo: gzip.compress(conteudo, compresslevel=6, mtime=0)),
+    ('br 4', lambda conteudo: brotli.compress(conteudo, quality=4)),
+    ('br 9', lambda conteudo: brotli.compress(conteudo, quality=9)),
+)
+
+
+class Command(BaseCommand):
+    help = ('Serializa listagens grandes de vendas e de produtos e mede, para cada formato e compressão, os bytes '
+            'enviados e os tempos de codificação e de compressão. Os dados são criados dentro de uma transação '
+            'que é desfeita ao final')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vendas', type=int, default=5000)
+        parser.add_argument('--produtos', type=int, default=20000)
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            vendedor = semear_volume(options['produtos'], options['vendas'])
+            request = Request(APIRequestFactory().get('/', SERVER_NAME=HOST))
+            request.user = vendedor
+            contexto = {'request': request}
+
+            vendas = Venda.objects.filter(chave__startswith='volume-').prefetch_related('produtovenda_set')
+            listagens = (
+                ('vendas', VendaSerializer(vendas, many=True, context=contexto).data),
+                ('produtos', ProdutoSerializer(Produto.objects.filter(nome__startswith='VOLUME '), many=True,
+                                               context=contexto).data),
+            )
+            transaction.set_rollback(True)
+
+        self.stdout.write('%-9s %-12s %-9s %12s %9s %12s %12s' % (
+            'listagem', 'formato', 'compressao', 'bytes', '% json', 'codificar ms', 'comprimir ms'))
+        for nome, dados in listagens:
+            referencia = None
+            for formato, renderer in RENDERERS:
+                codificar, conteudo = medir(lambda: renderer.render(dados), options['repeticoes'])
+                referencia = referencia or len(conteudo)
+                for compressao, comprimir in COMPRESSOES:
+                    tempo, comprimido = medir(lambda: comprimir(conteudo), options['repeticoes'])
+                    self.stdout.write('%-9s %-12s %-9s %12d %8.1f%% %12.2f %12.2f' % (
+                        nome, formato, compressao, len(comprimido), len(comprimido) * 100 / referencia,
+                        codificar * 1000, tempo * 1000))
+
+
+def medir(funcao, repeticoes):
+    """
+    Menor tempo entre as repetições e o resultado da função
+    """
+    melhor = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        decorrido = time.perf_counter() - inicio
+        melhor = decorrido if melhor is None else min(melhor, decorrido)
+    return melhor, resultado
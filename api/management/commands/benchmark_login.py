@@ -0,0 +1,70 @@
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
+
+from api.models import User
+from api.views import ObterJWTToken, RefreshJWTToken
+
+HOST = 'localhost'
+SENHA = 'P@ssw0rD-benchmark'
+
+
+class Command(BaseCommand):
+    help = ('Dispara logins concorrentes contra /auth/token/ e renovações contra /auth/token/refresh/, informando '
+            'logins por segundo, por núcleo e a latência. Usa o hasher e o custo configurados em settings.SENHAS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--usuarios', type=int, default=20)
+
+    def handle(self, *args, **options):
+        usuarios = [User.objects.create_user('benchmark_login_%d' % i, password=SENHA, is_client=True)
+                    for i in range(options['usuarios'])]
+        try:
+            self.stdout.write('Hasher: %s (%s), hashes simultâneos: %d, núcleos: %d' % (
+                settings.PASSWORD_HASHERS[0], get_hasher().algorithm, settings.SENHAS['workers'],
+                os.cpu_count() or 1))
+            status, respostas = self.disparar(options, ObterJWTToken, reverse('token_obtain_pair'),
+                                              lambda i: {'username': usuarios[i % len(usuarios)].username,
+                                                         'password': SENHA})
+            refresh = [resposta['refresh'] for codigo, resposta in zip(status, respostas) if codigo == 200]
+            if refresh:
+                self.disparar(options, RefreshJWTToken, reverse('token_refresh'),
+                              lambda i: {'refresh': refresh[i % len(refresh)]})
+        finally:
+            User.objects.filter(id__in=[user.id for user in usuarios]).delete()
+
+    def disparar(self, options, view_class, caminho, dados):
+        factory = APIRequestFactory()
+        view = view_class.as_view(throttle_classes=())
+
+        def requisitar(i):
+            try:
+                inicio = time.perf_counter()
+                response = view(factory.post(caminho, dados(i), format='json', SERVER_NAME=HOST))
+                return time.perf_counter() - inicio, response.status_code, response.data
+            finally:
+                connection.close()
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            resultados = list(executor.map(requisitar, range(options['logins'])))
+        duracao = time.perf_counter() - inicio
+
+        latencias = sorted(resultado[0] for resultado in resultados)
+        status = [resultado[1] for resultado in resultados]
+        sucesso = status.count(200)
+        por_segundo = sucesso / duracao
+        self.stdout.write('%-24s %6d ok %6d recusados %10.1f/s %10.1f/s por núcleo  p50 %7.1f ms  p99 %7.1f ms' % (
+            caminho, sucesso, len(status) - sucesso, por_segundo, por_segundo / (os.cpu_count() or 1),
+            statistics.median(latencias) * 1000, latencias[int(len(latencias) * 0.99) - 1] * 1000))
+        return status, [resultado[2] for resultado in resultados]
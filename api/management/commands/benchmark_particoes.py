@@ -0,0 +1,115 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import estatisticas
+from api.management.dados import HOST, SEM_LIMITES, banco_descartavel
+from api.models import Categoria, EstatisticaProduto, Pagamento, Produto, User
+from api.views import VendaList
+
+MODOS = ('venda', 'estoque')
+
+
+class Command(BaseCommand):
+    help = ('Mede as vendas por segundo de um único produto disputado por várias threads, com o estoque na linha do '
+            'produto e dividido em partições. No modo venda cada venda passa pelo VendaList, com a baixa do estoque '
+            'e o registro das estatísticas, que são consolidadas e conferidas ao final de cada rodada; no modo '
+            'estoque cada transação apenas baixa o estoque e o mantém bloqueado por --trabalho milissegundos, '
+            'simulando o restante da venda. Os dados são criados em um banco descartável, destruído ao final')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--particoes', default='0,1,8',
+                            help='Partições a comparar, separadas por vírgula; zero mantém o estoque no produto')
+        parser.add_argument('--modo', choices=MODOS, default='venda')
+        parser.add_argument('--threads', type=int, default=12,
+                            help='Abaixo do tamanho do pool de conexões, para que nenhuma venda espere por uma')
+        parser.add_argument('--vendas', type=int, default=1000)
+        parser.add_argument('--quantidade', type=int, default=1)
+        parser.add_argument('--trabalho', type=float, default=5, help='Milissegundos por transação no modo estoque')
+
+    def handle(self, *args, **options):
+        with banco_descartavel():
+            vendedor = User.objects.create_user('particoes_vendedor', is_seller=True)
+            cliente = User.objects.create_user('particoes_cliente', is_client=True)
+            categoria = Categoria.objects.create(nome='particoes')
+            pagamento = Pagamento.objects.create(nome='particoes', juros=Decimal('0'))
+            estoque = options['vendas'] * options['quantidade']
+
+            self.stdout.write('%10s %10s %10s %12s %10s %18s' % ('particoes', 'vendas/s', 'concluidas', 'recusadas',
+                                                                 'estoque', 'consolidacao (ms)'))
+            for particoes in [int(valor) for valor in options['particoes'].split(',')]:
+                produto = Produto.objects.create(nome='particoes %d' % particoes, preco_compra=Decimal('1'),
+                                                 preco_venda=Decimal('1'), quantidade=estoque, categoria=categoria,
+                                                 particoes_estoque=particoes)
+                with override_settings(LIMITES=SEM_LIMITES):
+                    inicio = time.perf_counter()
+                    status = self.disparar(options, vendedor, cliente, pagamento, produto)
+                    duracao = time.perf_counter() - inicio
+
+                inicio = time.perf_counter()
+                estatisticas.consolidar()
+                consolidacao = time.perf_counter() - inicio
+
+                produto = Produto.objects.get(id=produto.id)
+                sucesso = status.count(201)
+                self.stdout.write('%10d %10.1f %10d %12s %10d %18.1f' % (
+                    particoes, sucesso / duracao, sucesso,
+                    ', '.join('%s: %d' % (s, status.count(s)) for s in sorted(set(status) - {201})) or '-',
+                    produto.quantidade, consolidacao * 1000))
+                if produto.quantidade != estoque - sucesso * options['quantidade']:
+                    raise CommandError('O estoque final não corresponde às vendas realizadas')
+                vendidas = EstatisticaProduto.objects.filter(produto=produto).values_list('unidades', flat=True)
+                if options['modo'] == 'venda' and sum(vendidas) != sucesso * options['quantidade']:
+                    raise CommandError('As estatísticas consolidadas não correspondem às vendas realizadas')
+
+    def disparar(self, options, vendedor, cliente, pagamento, produto):
+        if options['modo'] == 'estoque':
+            def vender(_):
+                return baixar(produto, options['quantidade'], options['trabalho'] / 1000)
+        else:
+            factory = APIRequestFactory()
+            view = VendaList.as_view()
+            payload = {
+                'pagamento': 'http://%s%s' % (HOST, reverse('pagamento-detail', args=[pagamento.id])),
+                'produtos': [{'produto': 'http://%s%s' % (HOST, reverse('produto-detail', args=[produto.id])),
+                              'quantidade': options['quantidade']}],
+                'cliente': 'http://%s%s' % (HOST, reverse('user-detail', args=[cliente.id])),
+                'vendedor': 'http://%s%s' % (HOST, reverse('user-detail', args=[vendedor.id])),
+            }
+
+            def vender(_):
+                request = factory.post(reverse('venda'), payload, format='json', SERVER_NAME=HOST)
+                force_authenticate(request, user=vendedor)
+                return view(request).status_code
+
+        def executar(i):
+            try:
+                return vender(i)
+            except DatabaseError:
+                # No SQLite, que bloqueia o banco inteiro, transações que leem antes de gravar podem falhar
+                return 500
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            return list(executor.map(executar, range(options['vendas'])))
+
+
+def baixar(produto, quantidade, trabalho):
+    """
+    Baixa o estoque em uma transação que fica aberta pelo tempo de trabalho, mantendo bloqueada a linha ou a
+    partição alterada
+    """
+    particoes = {produto.id: produto.particoes_estoque} if produto.particoes_estoque else {}
+    with transaction.atomic():
+        if not Produto.objects.baixar_estoque({produto.id: quantidade}, particoes):
+            return 409
+        time.sleep(trabalho)
+    return 201
+
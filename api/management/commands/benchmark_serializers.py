@@ -0,0 +1,62 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.models import Categoria, Pagamento, Produto, User
+from api.serializers import CategoriaSerializer, PagamentoSerializer, PapelSerializer, ProdutoSerializer
+
+HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = ('Mede a serialização por linha dos serializers do catálogo, com e sem a representação rápida, '
+            'para usuários anônimos e vendedores. Não acessa o banco')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=2000)
+        parser.add_argument('--repeticoes', type=int, default=5)
+
+    def handle(self, *args, **options):
+        linhas = options['linhas']
+        casos = (
+            (CategoriaSerializer, [Categoria(id=i, nome='CATEGORIA %d' % i) for i in range(1, linhas + 1)]),
+            (PagamentoSerializer, [Pagamento(id=i, nome='pagamento %d' % i, juros=Decimal('1.50'))
+                                   for i in range(1, linhas + 1)]),
+            (ProdutoSerializer, [Produto(id=i, nome='PRODUTO %d' % i, preco_compra=Decimal('10.00'),
+                                         preco_venda=Decimal('15.90'), quantidade=i, disponivel=True,
+                                         categoria_id=i % 50 + 1) for i in range(1, linhas + 1)]),
+        )
+        usuarios = (('anonimo', AnonymousUser()), ('vendedor', User(id=1, username='vendedor', is_seller=True)))
+
+        self.stdout.write('%-22s %-10s %14s %14s %8s' % ('serializer', 'usuario', 'padrao (us)', 'rapida (us)',
+                                                         'ganho'))
+        for serializer_class, objetos in casos:
+            for nome, user in usuarios:
+                request = Request(APIRequestFactory().get('/', SERVER_NAME=HOST))
+                request.user = user
+
+                padrao, dados_padrao = self.medir(serializer_class, objetos, request, False, options['repeticoes'])
+                rapida, dados_rapida = self.medir(serializer_class, objetos, request, True, options['repeticoes'])
+                if dados_padrao != dados_rapida:
+                    raise CommandError('%s gerou dados diferentes na representação rápida' % serializer_class.__name__)
+
+                self.stdout.write('%-22s %-10s %14.2f %14.2f %7.1fx' % (
+                    serializer_class.__name__, nome, padrao * 1e6 / linhas, rapida * 1e6 / linhas, padrao / rapida))
+
+    @classmethod
+    def medir(cls, serializer_class, objetos, request, rapida, repeticoes):
+        PapelSerializer.representacao_rapida = rapida
+        try:
+            melhor = None
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                dados = serializer_class(objetos, many=True, context={'request': request}).data
+                decorrido = time.perf_counter() - inicio
+                melhor = decorrido if melhor is None else min(melhor, decorrido)
+            return melhor, dados
+        finally:
+            PapelSerializer.representacao_rapida = True
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.dados import banco_descartavel, rotas, semear
+from api.models import User
+from api.serializers import ObterTokenSerializer
+
+HOST = '127.0.0.1'
+TEMPO_LIMITE = 30
+MODOS = {
+    'sync': ('api_comercio.wsgi:application', 'sync'),
+    'asgi': ('api_comercio.asgi:application', 'uvicorn.workers.UvicornH11Worker'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Sobe o gunicorn com workers síncronos (WSGI) e com workers uvicorn (ASGI), na mesma máquina e com o '
+            'mesmo número de processos, e dispara leituras concorrentes contra os endpoints GET, informando '
+            'requisições por segundo e latências. Os dados são criados em um banco descartável, destruído ao final')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modos', default='sync,asgi', help='Modos separados por vírgula: sync, asgi')
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concorrencia', type=int, default=100)
+        parser.add_argument('--requisicoes', type=int, default=2000)
+        parser.add_argument('--registros', type=int, default=50)
+        parser.add_argument('--porta', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        modos = options['modos'].split(',')
+        if set(modos) - set(MODOS):
+            raise CommandError('Modos disponíveis: %s' % ', '.join(MODOS))
+
+        with banco_descartavel() as ambiente:
+            vendedor = User.objects.create_user('servidor_vendedor', is_seller=True)
+            cliente = User.objects.create_user('servidor_cliente', is_client=True)
+            semear(vendedor, cliente, options['registros'], 'servidor')
+            token = str(ObterTokenSerializer.get_token(vendedor).access_token)
+            urls = rotas()
+
+            self.stdout.write('%-6s %10s %10s %10s %10s %8s' % ('modo', 'req/s', 'p50 (ms)', 'p99 (ms)', 'max (ms)',
+                                                               'erros'))
+            for modo in modos:
+                servidor = iniciar_servidor(modo, options['workers'], options['porta'], ambiente)
+                try:
+                    resultado = asyncio.run(disparar(options, urls, token))
+                finally:
+                    servidor.terminate()
+                    servidor.wait()
+                self.stdout.write('%-6s %10.1f %10.1f %10.1f %10.1f %8d' % ((modo, ) + resultado))
+
+
+def iniciar_servidor(modo, workers, porta, ambiente):
+    """
+    Sobe o gunicorn no modo informado, com as variáveis de ambiente do banco descartável e sem limite de
+    requisições por usuário, e espera que ele aceite conexões
+    """
+    aplicacao, worker = MODOS[modo]
+    env = dict(os.environ, LIMITES_ATIVOS='0', **ambiente)
+    servidor = subprocess.Popen([sys.executable, '-c', 'from gunicorn.app.wsgiapp import run; run()',
+                                 aplicacao, '--worker-class', worker,
+                                 '--workers', str(workers),
+                                 '--bind', '%s:%d' % (HOST, porta)],
+                                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            socket.create_connection((HOST, porta), timeout=1).close()
+            return servidor
+        except OSError:
+            time.sleep(0.2)
+
+    servidor.terminate()
+    raise CommandError('O servidor %s não respondeu na porta %d' % (modo, porta))
+
+
+async def disparar(options, urls, token):
+    vagas = asyncio.Semaphore(options['concorrencia'])
+    latencias = []
+    erros = 0
+
+    async def requisitar(url):
+        nonlocal erros
+        async with vagas:
+            inicio = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(obter(options['porta'], url, token), TEMPO_LIMITE)
+            except (OSError, asyncio.TimeoutError):
+                status = b''
+            latencias.append(time.perf_counter() - inicio)
+            if status.split(b' ')[1:2] != [b'200']:
+                erros += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[requisitar(urls[i % len(urls)]) for i in range(options['requisicoes'])])
+    duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    return (len(latencias) / duracao, statistics.median(latencias) * 1000,
+            latencias[int(len(latencias) * 0.99) - 1] * 1000, latencias[-1] * 1000, erros)
+
+
+async def obter(porta, url, token):
+    reader, writer = await asyncio.open_connection(HOST, porta)
+    writer.write(('GET %s HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer %s\r\n'
+                  'Accept: application/json\r\nConnection: close\r\n\r\n' % (url, token)).encode())
+    status = await reader.readline()
+    await reader.read()
+    writer.close()
+    return status
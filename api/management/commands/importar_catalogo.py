@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import importacao
+
+EXTENSOES = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+
+
+class Command(BaseCommand):
+    help = ('Cria ou atualiza produtos em massa a partir de um catálogo em CSV, com cabeçalho, ou em NDJSON, com os '
+            'campos codigo, nome, categoria, preco_compra, preco_venda e quantidade. O arquivo é lido aos poucos e '
+            'gravado em lotes, e as categorias que não existem são criadas. Com - o catálogo é lido da entrada '
+            'padrão')
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument('--formato', choices=sorted(importacao.LEITORES),
+                            help='Por padrão, deduzido da extensão do arquivo')
+        parser.add_argument('--lote', type=int, default=importacao.TAMANHO_LOTE)
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or EXTENSOES.get(os.path.splitext(options['arquivo'])[1].lower())
+        if formato is None:
+            raise CommandError('Informe o formato com --formato')
+
+        inicio = time.perf_counter()
+        if options['arquivo'] == '-':
+            resumo = importacao.importar(sys.stdin.buffer, formato, options['lote'])
+        else:
+            with open(options['arquivo'], 'rb') as arquivo:
+                resumo = importacao.importar(arquivo, formato, options['lote'])
+        duracao = time.perf_counter() - inicio
+
+        for erro in resumo['erros']:
+            self.stderr.write('Linha %d: %s' % (erro['linha'], '; '.join(
+                '%s: %s' % (campo, ' '.join(mensagens)) for campo, mensagens in erro['erros'].items())))
+        if resumo['invalidos'] > len(resumo['erros']):
+            self.stderr.write('Outras %d linhas inválidas' % (resumo['invalidos'] - len(resumo['erros'])))
+
+        gravados = resumo['criados'] + resumo['atualizados'] + resumo['inalterados']
+        self.stdout.write(self.style.SUCCESS(
+            '%d produtos criados, %d atualizados e %d inalterados, %d categorias criadas e %d linhas inválidas em '
+            '%.1f s (%.0f produtos/s)' % (resumo['criados'], resumo['atualizados'], resumo['inalterados'],
+                                          resumo['categorias_criadas'], resumo['invalidos'], duracao,
+                                          gravados / duracao if duracao else 0)))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import sincronizacao
+
+
+class Command(BaseCommand):
+    help = ('Numera as categorias, pagamentos, produtos e remoções gravados desde a última numeração, para que '
+            'apareçam na sincronização dos terminais, e descarta as remoções mais antigas que RETENCAO_REMOCOES '
+            'dias. Deve ser agendado periodicamente, ou mantido rodando com --intervalo, que repete a numeração a '
+            'cada intervalo de segundos')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=0,
+                            help='Segundos entre as numerações; zero numera uma única vez e termina')
+
+    def handle(self, *args, **options):
+        numeradas, descartadas = numerar_todas(), sincronizacao.descartar_remocoes()
+        while options['intervalo']:
+            if numeradas or descartadas:
+                self.stdout.write('%d alterações numeradas, %d remoções descartadas' % (numeradas, descartadas))
+            close_old_connections()
+            time.sleep(options['intervalo'])
+            numeradas, descartadas = numerar_todas(), sincronizacao.descartar_remocoes()
+
+        self.stdout.write(self.style.SUCCESS('%d alterações numeradas, %d remoções descartadas'
+                                             % (numeradas, descartadas)))
+
+
+def numerar_todas():
+    """
+    Numera as linhas pendentes em transações de até LIMITE_NUMERACAO linhas por tabela, até não restar nenhuma
+    """
+    total = 0
+    pendentes = True
+    while pendentes:
+        numeradas, pendentes = sincronizacao.numerar()
+        total += numeradas
+    return total
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import estatisticas
+
+
+class Command(BaseCommand):
+    help = ('Reconstrói as estatísticas de produtos e pagamentos a partir das vendas registradas. '
+            'Deve ser executado após a criação das tabelas de estatística ou se elas ficarem inconsistentes')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            estatisticas.recalcular()
+
+        self.stdout.write(self.style.SUCCESS('Estatísticas recalculadas'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import busca
+
+
+class Command(BaseCommand):
+    help = ('Reconstrói o índice invertido da busca de produtos a partir dos produtos cadastrados. Necessário após '
+            'gravações que não disparam sinais, como bulk_create e update. No PostgreSQL não faz nada, pois a busca '
+            'usa os índices da própria busca textual')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            busca.reindexar()
+
+        self.stdout.write(self.style.SUCCESS('Índice de busca reconstruído'))
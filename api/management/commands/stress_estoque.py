@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.models import Categoria, Pagamento, Produto, ProdutoVenda, User, Venda
+from api.views import VendaList
+
+HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    help = 'Dispara várias vendas concorrentes contra um mesmo produto e confere se o estoque final fecha'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--vendas', type=int, default=200)
+        parser.add_argument('--estoque', type=int, default=100)
+        parser.add_argument('--quantidade', type=int, default=1)
+
+    def handle(self, *args, **options):
+        vendedor = User.objects.create_user('stress_vendedor', is_seller=True)
+        cliente = User.objects.create_user('stress_cliente', is_client=True)
+        categoria = Categoria.objects.create(nome='stress')
+        pagamento = Pagamento.objects.create(nome='stress', juros=Decimal('0'))
+        produto = Produto.objects.create(nome='stress', preco_compra=Decimal('1'), preco_venda=Decimal('1'),
+                                         quantidade=options['estoque'], categoria=categoria)
+
+        try:
+            status = self.disparar(options, vendedor, cliente, pagamento, produto)
+            self.conferir(options, status, produto)
+        finally:
+            Venda.objects.filter(vendedor=vendedor).delete()
+            produto.delete()
+            categoria.delete()
+            pagamento.delete()
+            vendedor.delete()
+            cliente.delete()
+
+    def disparar(self, options, vendedor, cliente, pagamento, produto):
+        factory = APIRequestFactory()
+        view = VendaList.as_view(throttle_classes=())
+        payload = {
+            'pagamento': 'http://%s%s' % (HOST, reverse('pagamento-detail', args=[pagamento.id])),
+            'produtos': [{'produto': 'http://%s%s' % (HOST, reverse('produto-detail', args=[produto.id])),
+                          'quantidade': options['quantidade']}],
+            'cliente': 'http://%s%s' % (HOST, reverse('user-detail', args=[cliente.id])),
+            'vendedor': 'http://%s%s' % (HOST, reverse('user-detail', args=[vendedor.id])),
+        }
+
+        def vender(_):
+            try:
+                request = factory.post(reverse('venda'), payload, format='json', SERVER_NAME=HOST)
+                force_authenticate(request, user=vendedor)
+                return view(request).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            return list(executor.map(vender, range(options['vendas'])))
+
+    def conferir(self, options, status, produto):
+        produto.refresh_from_db()
+        sucesso = status.count(201)
+        vendido = sum(ProdutoVenda.objects.filter(produto=produto).values_list('quantidade', flat=True))
+
+        self.stdout.write('Vendas: %d concluídas, %d recusadas (%s)' % (
+            sucesso, len(status) - sucesso, ', '.join(sorted({str(s) for s in status if s != 201})) or '-'))
+        self.stdout.write('Estoque: inicial %d, vendido %d, final %d' % (
+            options['estoque'], vendido, produto.quantidade))
+
+        if vendido != sucesso * options['quantidade'] or produto.quantidade != options['estoque'] - vendido:
+            raise CommandError('O estoque final não corresponde às vendas realizadas')
+        if produto.quantidade < 0 or produto.disponivel != (produto.quantidade > 0):
+            raise CommandError('O estoque final está inconsistente')
+
+        self.stdout.write(self.style.SUCCESS('Estoque consistente'))
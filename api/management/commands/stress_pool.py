@@ -0,0 +1,102 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+
+from api.backends.pool import PoolMixin
+from api.models import Produto
+
+
+class Command(BaseCommand):
+    help = ('Confere o pool de conexões do banco informado: o limite de conexões com muitas threads, a troca de '
+            'conexões encerradas pelo banco (pre-ping) e o tempo de espera esgotado. Funciona com SQLite e '
+            'PostgreSQL')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--banco', default='default')
+        parser.add_argument('--threads', type=int, default=32)
+        parser.add_argument('--consultas', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        conexao = connections[options['banco']]
+        if not isinstance(conexao, PoolMixin):
+            raise CommandError('O banco "%s" não usa o pool, confira DB_POOL' % options['banco'])
+
+        conexao.ensure_connection()
+        pool = conexao.pool
+        conexao.close()
+
+        self.limite(options, pool)
+        self.pre_ping(options, pool)
+        self.esgotado(options, pool)
+
+        self.stdout.write('Métricas: %s' % pool.metricas())
+        self.stdout.write(self.style.SUCCESS('Pool consistente'))
+
+    def limite(self, options, pool):
+        maximo = pool.maximo + pool.transbordo
+        pico = [0]
+        lock = threading.Lock()
+
+        def consultar(_):
+            try:
+                Produto.objects.using(options['banco']).exists()
+                with lock:
+                    pico[0] = max(pico[0], pool.em_uso)
+            finally:
+                connections[options['banco']].close()
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            list(executor.map(consultar, range(options['consultas'])))
+
+        metricas = pool.metricas()
+        self.stdout.write('Limite: pico de %d conexões em uso (máximo %d), %d abertas ao final' % (
+            pico[0], maximo, metricas['abertas']))
+        if pico[0] > maximo or metricas['em_uso'] != 0 or metricas['abertas'] > pool.maximo:
+            raise CommandError('O pool ultrapassou o limite de conexões ou não recebeu todas de volta')
+
+    def pre_ping(self, options, pool):
+        if not pool.livres:
+            raise CommandError('O pool não possui conexões livres para conferir o pre-ping')
+
+        falhas = pool.falhas_ping
+        pool.livres[-1].close()
+        Produto.objects.using(options['banco']).exists()
+        connections[options['banco']].close()
+
+        self.stdout.write('Pre-ping: %d conexão encerrada substituída' % (pool.falhas_ping - falhas))
+        if pool.pre_ping and pool.falhas_ping != falhas + 1:
+            raise CommandError('A conexão encerrada não foi substituída pelo pre-ping')
+
+    def esgotado(self, options, pool):
+        vagas = pool.maximo + pool.transbordo
+        ocupadas = threading.Barrier(vagas + 1)
+        liberar = threading.Event()
+
+        def ocupar(_):
+            try:
+                Produto.objects.using(options['banco']).exists()
+                ocupadas.wait()
+                liberar.wait()
+            finally:
+                connections[options['banco']].close()
+
+        espera = pool.espera
+        pool.espera = 0.2
+        with ThreadPoolExecutor(max_workers=vagas) as executor:
+            executor.map(ocupar, range(vagas))
+            ocupadas.wait()
+            try:
+                Produto.objects.using(options['banco']).exists()
+                recusada = False
+            except OperationalError:
+                recusada = True
+            finally:
+                pool.espera = espera
+                liberar.set()
+                connections[options['banco']].close()
+
+        self.stdout.write('Espera esgotada: conexão %s com o pool cheio' % ('recusada' if recusada else 'entregue'))
+        if not recusada:
+            raise CommandError('O pool entregou uma conexão além do limite')
@@ -0,0 +1,195 @@
+import random
+import re
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import estatisticas, resumos
+from api.management.dados import HOST, SEM_CACHE, SEM_LIMITES
+from api.models import Categoria, Pagamento, Produto, ProdutoVenda, User, Venda
+
+TABELAS_GRANDES = ('api_produto', 'api_venda', 'api_produtovenda', 'api_estatisticaproduto',
+                   'api_estatisticaprodutodiaria', 'api_resumovendadiario')
+VARREDURA_SQLITE = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+VARREDURA_POSTGRESQL = re.compile(r'Seq Scan on (\w+)')
+
+
+class Command(BaseCommand):
+    help = ('Cria um volume grande de dados e confere, pelo EXPLAIN de cada consulta, que as combinações de '
+            'filtros e ordenações das listagens e estatísticas não percorrem sequencialmente as tabelas grandes. '
+            'Os dados são criados dentro de uma transação que é desfeita ao final')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=20000)
+        parser.add_argument('--vendas', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        with override_settings(CACHES=SEM_CACHE, LIMITES=SEM_LIMITES), transaction.atomic():
+            vendedor = semear_volume(options['produtos'], options['vendas'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            client = APIClient(SERVER_NAME=HOST)
+            client.force_authenticate(vendedor)
+            falhas = []
+            for url in rotas():
+                varridas = self.conferir(client, url)
+                self.stdout.write('%-75s %s' % (url, ', '.join(varridas) or 'ok'))
+                if varridas:
+                    falhas.append(url)
+
+            transaction.set_rollback(True)
+
+        if falhas:
+            raise CommandError('Consultas com varredura sequencial em: %s' % ', '.join(falhas))
+
+        self.stdout.write(self.style.SUCCESS('Todas as combinações usam índices'))
+
+    def conferir(self, client, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError('%s respondeu %d' % (url, response.status_code))
+
+        varridas = []
+        for consulta in consultas:
+            if consulta['sql'].startswith('SELECT'):
+                varridas += [tabela for tabela in varreduras(consulta['sql']) if tabela in TABELAS_GRANDES]
+        return sorted(set(varridas))
+
+
+def plano(sql, parametros=None):
+    """
+    Linhas do plano da consulta, pelo EXPLAIN do PostgreSQL ou pelo EXPLAIN QUERY PLAN do SQLite
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('EXPLAIN ' + sql, parametros)
+            return [linha[0] for linha in cursor.fetchall()]
+
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, parametros)
+        return [linha[-1] for linha in cursor.fetchall()]
+
+
+def varreduras(sql):
+    """
+    Tabelas percorridas sequencialmente no plano da consulta
+    """
+    if connection.vendor == 'postgresql':
+        return VARREDURA_POSTGRESQL.findall('\n'.join(plano(sql)))
+
+    plano_sqlite = plano(sql)
+    tabelas = [encontrada.group(1) for encontrada in map(VARREDURA_SQLITE.match, plano_sqlite) if encontrada]
+    # No SQLite a tabela é a própria árvore da chave primária: percorrê-la na ordem do id até o LIMIT, sem
+    # ordenar em uma árvore temporária, equivale ao Index Scan da chave primária no PostgreSQL
+    if ' LIMIT ' in sql and not any('USE TEMP B-TREE' in linha for linha in plano_sqlite):
+        tabelas = [tabela for tabela in tabelas if 'ORDER BY "%s"."id"' % tabela not in sql]
+    return tabelas
+
+
+def rotas():
+    produtos = Produto.objects.aggregate(minimo=Min('preco_venda'), maximo=Max('preco_venda'))
+    faixa = (produtos['maximo'] - produtos['minimo']) / 100
+    produto = Produto.objects.order_by('-id').first()
+    venda = Venda.objects.aggregate(valor=Max('valor_venda'), data=Max('data_venda'))
+    pagamento = Venda.objects.values_list('pagamento', flat=True).first()
+    semana = {'inicio': venda['data'] - timedelta(days=7), 'fim': venda['data']}
+
+    consultas = [
+        ('produto', {}),
+        ('produto', {'nome': produto.nome}),
+        ('produto', {'preco_venda__lt': produtos['minimo'] + faixa}),
+        ('produto', {'preco_venda__gte': produtos['minimo'] + faixa,
+                     'preco_venda__lte': produtos['minimo'] + 2 * faixa}),
+        ('produto', {'preco_compra__gt': produtos['maximo'] / 2 - faixa,
+                     'preco_compra__lt': produtos['maximo'] / 2}),
+        ('produto', {'disponivel': 'true'}),
+        ('produto', {'ordering': 'preco_venda'}),
+        ('produto', {'ordering': '-preco_compra'}),
+        ('produto', {'ordering': 'nome'}),
+        ('produto', {'disponivel': 'true', 'ordering': 'preco_venda'}),
+        ('venda', {}),
+        ('venda', {'data_venda__gte': semana['inicio']}),
+        ('venda', {'data_venda': semana['fim']}),
+        ('venda', {'valor_venda__gt': venda['valor'] / 2}),
+        ('venda', {'pagamento': pagamento}),
+        ('venda', {'ordering': '-data_venda'}),
+        ('venda', {'ordering': 'valor_venda'}),
+        ('venda', {'ordering': '-valor_venda', 'valor_venda__gte': venda['valor'] / 2}),
+        ('produtos-mais-vendidos', {}),
+        ('produtos-mais-vendidos', semana),
+        ('produto-mais-vendido', {}),
+        ('serie-vendas', semana),
+        ('serie-vendas', dict(semana, dimensao='vendedor')),
+    ]
+    if connection.vendor == 'postgresql':
+        # O SQLite não possui índice para a busca por trecho, que usa o índice de trigramas no PostgreSQL
+        consultas.append(('produto', {'nome__icontains': produto.nome[3:9]}))
+
+    return ['%s?%s' % (reverse(nome), urlencode(parametros)) if parametros else reverse(nome)
+            for nome, parametros in consultas]
+
+
+def semear_volume(produtos, vendas, vendedores=20, clientes=200, dias=365, categorias=50, itens=3):
+    """
+    Cria categorias, pagamentos, usuários, produtos e vendas de 1 a itens produtos com datas distribuídas pelos
+    últimos dias, e atualiza as estatísticas e os resumos. Retorna o primeiro vendedor criado
+    """
+    aleatorio = random.Random(0)
+    Categoria.objects.bulk_create([Categoria(nome='VOLUME %d' % i) for i in range(categorias)])
+    Pagamento.objects.bulk_create([Pagamento(nome='volume %d' % i, juros=Decimal(i % 4)) for i in range(10)])
+    User.objects.bulk_create([User(username='volume_vendedor_%d' % i, is_seller=True) for i in range(vendedores)] +
+                             [User(username='volume_cliente_%d' % i, is_client=True) for i in range(clientes)])
+
+    ids_categorias = list(Categoria.objects.filter(nome__startswith='VOLUME ').values_list('id', flat=True))
+    pagamentos = list(Pagamento.objects.filter(nome__startswith='volume ').values_list('id', flat=True))
+    usuarios_vendedores = list(User.objects.filter(username__startswith='volume_vendedor_').order_by('id'))
+    usuarios_clientes = list(User.objects.filter(username__startswith='volume_cliente_').values_list('id', flat=True))
+
+    novos = []
+    for i in range(produtos):
+        preco_compra = Decimal(aleatorio.randint(100, 100000)) / 100
+        quantidade = aleatorio.randint(0, 100)
+        novos.append(Produto(nome='VOLUME %s %d' % (aleatorio.choice('ABCDEFGHIJ') * 3, i),
+                             preco_compra=preco_compra, preco_venda=(preco_compra * Decimal('1.3')).quantize(
+                                 Decimal('0.01')), quantidade=quantidade, disponivel=quantidade > 0,
+                             categoria_id=aleatorio.choice(ids_categorias)))
+    Produto.objects.bulk_create(novos)
+    precos = dict(Produto.objects.filter(nome__startswith='VOLUME ').values_list('id', 'preco_venda'))
+    ids_produtos = list(precos)
+
+    carrinhos = [{produto_id: aleatorio.randint(1, 5) for produto_id in aleatorio.sample(ids_produtos,
+                                                                                        aleatorio.randint(1, itens))}
+                 for _ in range(vendas)]
+    Venda.objects.bulk_create([Venda(pagamento_id=aleatorio.choice(pagamentos),
+                                     vendedor_id=aleatorio.choice(usuarios_vendedores).id,
+                                     cliente_id=aleatorio.choice(usuarios_clientes),
+                                     valor_venda=sum(precos[produto_id] * quantidade
+                                                     for produto_id, quantidade in carrinho.items()),
+                                     chave='volume-%d' % i) for i, carrinho in enumerate(carrinhos)])
+    ids_vendas = dict(Venda.objects.filter(chave__startswith='volume-').values_list('chave', 'id'))
+    ids_vendas = [ids_vendas['volume-%d' % i] for i in range(vendas)]
+
+    ProdutoVenda.objects.bulk_create([ProdutoVenda(venda_id=venda_id, produto_id=produto_id, quantidade=quantidade,
+                                                   preco_venda=precos[produto_id], preco_compra=precos[produto_id])
+                                      for venda_id, carrinho in zip(ids_vendas, carrinhos)
+                                      for produto_id, quantidade in carrinho.items()])
+
+    # data_venda é preenchida com o dia atual ao criar, então as datas são distribuídas depois, por faixa de id
+    hoje = timezone.localdate()
+    por_dia = max(len(ids_vendas) // dias, 1)
+    for dia, inicio in enumerate(range(0, len(ids_vendas), por_dia)):
+        Venda.objects.filter(id__in=ids_vendas[inicio:inicio + por_dia]).update(
+            data_venda=hoje - timedelta(days=dias - 1 - min(dia, dias - 1)))
+
+    estatisticas.recalcular()
+    resumos.atualizar(hoje - timedelta(days=dias))
+    return usuarios_vendedores[0]
@@ -0,0 +1,116 @@
+import os
+import secrets
+import tempfile
+from contextlib import contextmanager
+from decimal import Decimal
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.urls import reverse
+
+from api import estatisticas, sincronizacao
+from api.models import Categoria, Pagamento, Produto, ProdutoVenda, Venda
+
+HOST = 'localhost'
+CACHE_LOCAL = 'django.core.cache.backends.locmem.LocMemCache'
+SEM_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'catalogo': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+SEM_LIMITES = dict(settings.LIMITES, ativos=False)
+
+
+def rotas():
+    produto = Produto.objects.order_by('id').first()
+    venda = Venda.objects.order_by('id').first()
+    return [
+        reverse('api-root'),
+        reverse('categoria'), reverse('categoria-detail', args=[produto.categoria_id]),
+        reverse('pagamento'), reverse('pagamento-detail', args=[venda.pagamento_id]),
+        reverse('produto'), reverse('produto-detail', args=[produto.id]),
+        reverse('venda'), reverse('venda-detail', args=[venda.id]),
+        reverse('user'), reverse('user-detail', args=[venda.cliente_id]),
+        reverse('produto-mais-vendido'), reverse('pagamento-mais-utilizado'),
+        reverse('produtos-mais-vendidos'), reverse('pagamentos-mais-utilizados'),
+        reverse('serie-vendas'), reverse('sincronizacao') + '?since=0',
+    ]
+
+
+def semear(vendedor, cliente, quantidade, prefixo):
+    categorias = Categoria.objects.bulk_create(
+        [Categoria(nome='CONSULTAS %s %d' % (prefixo, i)) for i in range(quantidade)])
+    pagamentos = Pagamento.objects.bulk_create(
+        [Pagamento(nome='consultas %s %d' % (prefixo, i), juros=Decimal('1')) for i in range(quantidade)])
+    categorias = list(Categoria.objects.filter(nome__in=[categoria.nome for categoria in categorias]))
+    pagamentos = list(Pagamento.objects.filter(nome__in=[pagamento.nome for pagamento in pagamentos]))
+
+    Produto.objects.bulk_create(
+        [Produto(nome='CONSULTAS %s %d' % (prefixo, i), preco_compra=Decimal('1'), preco_venda=Decimal('2'),
+                 quantidade=100, disponivel=True, categoria=categorias[i]) for i in range(quantidade)])
+    produtos = list(Produto.objects.filter(nome__startswith='CONSULTAS %s ' % prefixo))
+
+    Venda.objects.bulk_create(
+        [Venda(pagamento=pagamentos[i], vendedor=vendedor, cliente=cliente, chave='consultas-%s-%d' % (prefixo, i),
+               valor_venda=Decimal('4')) for i in range(quantidade)])
+    vendas = list(Venda.objects.filter(vendedor=vendedor, chave__startswith='consultas-%s-' % prefixo))
+
+    ProdutoVenda.objects.bulk_create(
+        [ProdutoVenda(venda=venda, produto=produto, quantidade=1, preco_venda=produto.preco_venda,
+                      preco_compra=produto.preco_compra) for venda in vendas for produto in produtos[:3]])
+
+    estatisticas.recalcular()
+    sincronizacao.numerar()
+
+
+@contextmanager
+def banco_descartavel():
+    """
+    Cria um banco novo, com as migrações aplicadas, da mesma forma que os testes, e aponta todas as conexões para
+    ele até o fim do bloco, quando é destruído. Assim os benchmarks que gravam dados e refazem estatísticas não
+    tocam no banco configurado. O cache do catálogo, os limites e as versões compartilhadas também ficam em
+    memória e arquivos próprios, e /metrics exige um token, gerado se não houver um configurado. Retorna as
+    variáveis de ambiente que levam um servidor iniciado em outro processo ao mesmo banco e ao mesmo estado, sem
+    réplicas
+    """
+    token = settings.METRICAS['token'] or secrets.token_hex(16)
+    antigos = setup_databases(verbosity=0, interactive=False)
+    try:
+        with tempfile.TemporaryDirectory(prefix='api_comercio_benchmark_') as diretorio:
+            ambiente = {
+                'DATABASE_URL': url_banco(connection.settings_dict),
+                'DATABASE_REPLICAS': '',
+                'CACHE_CATALOGO_BACKEND': CACHE_LOCAL,
+                'LIMITES_BACKEND': 'compartilhado',
+                'LIMITES_LOCAL': os.path.join(diretorio, 'limites'),
+                'VERSOES_BACKEND': 'compartilhado',
+                'VERSOES_LOCAL': os.path.join(diretorio, 'versoes'),
+                'METRICAS_TOKEN': token,
+            }
+            with override_settings(CACHES=dict(settings.CACHES, catalogo={'BACKEND': CACHE_LOCAL,
+                                                                          'LOCATION': 'benchmark'}),
+                                   LIMITES=dict(settings.LIMITES, backend='compartilhado',
+                                                local=ambiente['LIMITES_LOCAL']),
+                                   VERSOES=dict(settings.VERSOES, backend='compartilhado',
+                                                local=ambiente['VERSOES_LOCAL']),
+                                   METRICAS=dict(settings.METRICAS, token=token)):
+                yield ambiente
+    finally:
+        teardown_databases(antigos, verbosity=0)
+
+
+def url_banco(configuracao):
+    """
+    URL no formato de DATABASE_URL para as configurações de uma conexão
+    """
+    if connection.vendor == 'sqlite':
+        return 'sqlite:///%s' % configuracao['NAME']
+
+    url = 'postgres://%s%s@%s%s/%s' % (
+        quote(configuracao['USER'] or '', safe=''),
+        ':' + quote(configuracao['PASSWORD'], safe='') if configuracao['PASSWORD'] else '',
+        quote(configuracao['HOST'] or '', safe=''),
+        ':%s' % configuracao['PORT'] if configuracao['PORT'] else '',
+        quote(configuracao['NAME'], safe=''))
+    return url + ('?' + urlencode(configuracao['OPTIONS']) if configuracao['OPTIONS'] else '')
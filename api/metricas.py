@@ -0,0 +1,265 @@
+import bisect
+import logging
+import os
+import random
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.db import connections
+
+from .backends import pool
+
+logger = logging.getLogger('api.consultas_lentas')
+
+LIMITES_TEMPO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+LIMITES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# Quadros da pilha mostrados no registro de uma consulta lenta, dos mais próximos da consulta
+QUADROS_PILHA = 5
+
+_local = threading.local()
+
+
+class Metrica:
+    """
+    Séries de uma métrica por combinação de rótulos. As alterações são feitas com o lock do registro já adquirido,
+    para que uma requisição atualize todas as suas séries adquirindo-o uma única vez
+    """
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.series = {}
+
+    def exportar(self):
+        linhas = ['# HELP %s %s' % (self.nome, self.ajuda), '# TYPE %s %s' % (self.nome, self.tipo)]
+        for valores, serie in sorted(self.series.items()):
+            linhas += self.exportar_serie(valores, serie)
+        return linhas
+
+    def formatar(self, valores, extra=()):
+        pares = list(zip(self.rotulos, valores)) + list(extra)
+        if not pares:
+            return ''
+        return '{%s}' % ','.join('%s="%s"' % (rotulo, str(valor).replace('\\', '\\\\').replace('"', '\\"'))
+                                 for rotulo, valor in pares)
+
+
+class Contador(Metrica):
+    tipo = 'counter'
+
+    def incrementar(self, valores, quantidade=1):
+        self.series[valores] = self.series.get(valores, 0) + quantidade
+
+    def exportar_serie(self, valores, serie):
+        return ['%s%s %s' % (self.nome, self.formatar(valores), serie)]
+
+
+class Histograma(Metrica):
+    """
+    Contagem das observações por faixa, com a soma dos valores observados. As faixas são acumuladas apenas ao
+    exportar, então cada observação incrementa uma única posição
+    """
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos, limites):
+        super(Histograma, self).__init__(nome, ajuda, rotulos)
+        self.limites = limites
+
+    def observar(self, valores, valor):
+        serie = self.series.get(valores)
+        if serie is None:
+            serie = self.series[valores] = [[0] * (len(self.limites) + 1), 0]
+        serie[0][bisect.bisect_left(self.limites, valor)] += 1
+        serie[1] += valor
+
+    def exportar_serie(self, valores, serie):
+        contagens, soma = serie
+        linhas = []
+        acumulado = 0
+        for limite, contagem in zip(self.limites + ('+Inf', ), contagens):
+            acumulado += contagem
+            linhas.append('%s_bucket%s %d' % (self.nome, self.formatar(valores, [('le', limite)]), acumulado))
+        linhas.append('%s_sum%s %s' % (self.nome, self.formatar(valores), round(soma, 6)))
+        linhas.append('%s_count%s %d' % (self.nome, self.formatar(valores), acumulado))
+        return linhas
+
+
+class Registro:
+    """
+    Métricas do processo. Cada worker mantém as suas, então com vários workers na mesma porta cada coleta vê as
+    métricas do worker que a atendeu, e os contadores de um worker recomeçam quando ele é reiniciado
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metricas = []
+
+    def contador(self, nome, ajuda, rotulos=()):
+        metrica = Contador(nome, ajuda, rotulos)
+        self.metricas.append(metrica)
+        return metrica
+
+    def histograma(self, nome, ajuda, rotulos, limites):
+        metrica = Histograma(nome, ajuda, rotulos, limites)
+        self.metricas.append(metrica)
+        return metrica
+
+    def exportar(self):
+        with self.lock:
+            linhas = [linha for metrica in self.metricas for linha in metrica.exportar()]
+        return '\n'.join(linhas + exportar_pools()) + '\n'
+
+
+registro = Registro()
+requisicoes = registro.contador('api_requisicoes_total', 'Requisições atendidas', ('rota', 'metodo', 'status'))
+duracao = registro.histograma('api_requisicao_segundos', 'Duração das requisições, do middleware à resposta',
+                              ('rota', 'metodo'), LIMITES_TEMPO)
+tamanho = registro.histograma('api_resposta_bytes', 'Tamanho do corpo das respostas não contínuas',
+                              ('rota', 'metodo'), LIMITES_BYTES)
+consultas = registro.histograma('api_consultas_por_requisicao', 'Consultas ao banco por requisição amostrada',
+                                ('rota', 'metodo'), LIMITES_CONSULTAS)
+tempo_banco = registro.histograma('api_banco_segundos', 'Tempo nas consultas ao banco por requisição amostrada',
+                                  ('rota', 'metodo'), LIMITES_TEMPO)
+tempo_serializacao = registro.histograma('api_serializacao_segundos',
+                                         'Tempo da view e da renderização fora do banco por requisição amostrada',
+                                         ('rota', 'metodo'), LIMITES_TEMPO)
+consultas_lentas = registro.contador('api_consultas_lentas_total',
+                                     'Consultas lentas nas requisições amostradas', ('rota', ))
+
+
+def exportar_pools():
+    linhas = []
+    for nome, ajuda, tipo, campos in (
+            ('api_pool_conexoes', 'Conexões do pool por estado', 'gauge', ('abertas', 'em_uso', 'livres')),
+            ('api_pool_esperas_total', 'Vezes em que uma conexão foi esperada', 'counter', ('esperas', )),
+            ('api_pool_espera_segundos_total', 'Tempo total de espera por conexões', 'counter', ('tempo_espera', )),
+            ('api_pool_esgotadas_total', 'Esperas por conexão que passaram do limite', 'counter', ('esgotadas', ))):
+        linhas += ['# HELP %s %s' % (nome, ajuda), '# TYPE %s %s' % (nome, tipo)]
+        for banco, metricas in sorted(pool.metricas().items()):
+            for campo in campos:
+                estado = ',estado="%s"' % campo if len(campos) > 1 else ''
+                linhas.append('%s{banco="%s"%s} %s' % (nome, banco, estado, metricas[campo]))
+    return linhas
+
+
+class Medicao:
+    """
+    Consultas e tempos de uma requisição amostrada
+    """
+
+    def __init__(self):
+        self.rota = None
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.serializacao = 0.0
+
+    def executar(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            tempo = time.perf_counter() - inicio
+            self.consultas += 1
+            self.tempo_banco += tempo
+            if tempo >= settings.METRICAS['consulta_lenta']:
+                registrar_consulta_lenta(self, sql, tempo)
+
+
+def registrar_consulta_lenta(medicao, sql, tempo):
+    """
+    Registra a consulta com os quadros da pilha do projeto que a originaram, ignorando os do Django, das
+    bibliotecas e desta medição
+    """
+    base = str(settings.BASE_DIR) + os.sep
+    quadros = [quadro for quadro in traceback.extract_stack()[:-2]
+               if quadro.filename.startswith(base) and 'site-packages' not in quadro.filename
+               and quadro.filename != __file__]
+    origem = '\n'.join('  %s:%d em %s' % (quadro.filename[len(base):], quadro.lineno, quadro.name)
+                       for quadro in reversed(quadros[-QUADROS_PILHA:]))
+    with registro.lock:
+        consultas_lentas.incrementar((medicao.rota or 'desconhecida', ))
+    logger.warning('Consulta lenta (%.3f s) na rota %s: %s\n%s', tempo, medicao.rota or 'desconhecida',
+                   sql[:1000], origem or '  origem fora do projeto')
+
+
+class MetricasMiddleware:
+    """
+    Mede cada requisição e a soma às métricas do processo, pelo nome da rota. Todas contam na duração, no status e
+    no tamanho da resposta. Só na fração METRICAS['amostragem'] as consultas são cronometradas, somando consultas,
+    tempo no banco e serialização e registrando as consultas lentas, o que deixa as demais em poucos microssegundos.
+    A serialização é medida pelo MetricasViewMiddleware
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICAS['ativas']:
+            return self.get_response(request)
+
+        medicao = None
+        if random.random() < settings.METRICAS['amostragem']:
+            medicao = _local.medicao = Medicao()
+            # Incluído direto na lista de cada conexão: o execute_wrapper, por ser um gerenciador de contexto por
+            # banco, custava mais que o restante da medição
+            wrappers = [connections[alias].execute_wrappers for alias in connections]
+            for lista in wrappers:
+                lista.append(medicao.executar)
+
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            if medicao is not None:
+                _local.medicao = None
+                for lista in wrappers:
+                    lista.remove(medicao.executar)
+        tempo = time.perf_counter() - inicio
+
+        match = request.resolver_match
+        rota = (match.url_name or '/' + match.route) if match is not None else 'nao_encontrada'
+        rotulos = (rota, request.method)
+        with registro.lock:
+            requisicoes.incrementar(rotulos + (response.status_code, ))
+            duracao.observar(rotulos, tempo)
+            if not response.streaming:
+                tamanho.observar(rotulos, len(response.content))
+            if medicao is not None:
+                consultas.observar(rotulos, medicao.consultas)
+                tempo_banco.observar(rotulos, medicao.tempo_banco)
+                tempo_serializacao.observar(rotulos, medicao.serializacao)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        medicao = getattr(_local, 'medicao', None)
+        if medicao is not None:
+            match = request.resolver_match
+            medicao.rota = match.url_name or '/' + match.route
+
+
+class MetricasViewMiddleware:
+    """
+    Mede a serialização das requisições amostradas na camada da view: o tempo da view e da renderização da
+    resposta, sem as consultas feitas nele. Deve ser o último middleware, para que só a view e o render fiquem
+    dentro dele. Nas respostas contínuas, o conteúdo gerado depois da view não entra na medição
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicao = getattr(_local, 'medicao', None)
+        if medicao is None:
+            return self.get_response(request)
+
+        inicio, banco = time.perf_counter(), medicao.tempo_banco
+        try:
+            return self.get_response(request)
+        finally:
+            medicao.serializacao += time.perf_counter() - inicio - (medicao.tempo_banco - banco)
+
@@ -0,0 +1,240 @@
+# Generated by Django 3.0.5 on 2026-10-18 11:57
+
+from decimal import Decimal
+from django.conf import settings
+import django.contrib.auth.models
+import django.contrib.auth.validators
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='User',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('password', models.CharField(max_length=128, verbose_name='password')),
+                ('last_login', models.DateTimeField(blank=True, null=True, verbose_name='last login')),
+                ('is_superuser', models.BooleanField(default=False, help_text='Designates that this user has all permissions without explicitly assigning them.', verbose_name='superuser status')),
+                ('username', models.CharField(error_messages={'unique': 'A user with that username already exists.'}, help_text='Required. 150 characters or fewer. Letters, digits and @/./+/-/_ only.', max_length=150, unique=True, validators=[django.contrib.auth.validators.UnicodeUsernameValidator()], verbose_name='username')),
+                ('first_name', models.CharField(blank=True, max_length=30, verbose_name='first name')),
+                ('last_name', models.CharField(blank=True, max_length=150, verbose_name='last name')),
+                ('email', models.EmailField(blank=True, max_length=254, verbose_name='email address')),
+                ('is_staff', models.BooleanField(default=False, help_text='Designates whether the user can log into this admin site.', verbose_name='staff status')),
+                ('is_active', models.BooleanField(default=True, help_text='Designates whether this user should be treated as active. Unselect this instead of deleting accounts.', verbose_name='active')),
+                ('date_joined', models.DateTimeField(default=django.utils.timezone.now, verbose_name='date joined')),
+                ('is_client', models.BooleanField(default=False, help_text='Se o usuário for do tipo cliente, ele irá ver apenas informações relacionadas a ele, além de não poder alterar os dados do sistema', verbose_name='Cliente')),
+                ('is_seller', models.BooleanField(default=False, help_text='Se o usuário for do tipo vendedor, ele poderá adicionar, deletar ou excluir, além de poder ver consumir urls específicas', verbose_name='Vendedor')),
+                ('versao_token', models.PositiveIntegerField(default=0, editable=False, help_text='Incrementada quando o papel ou a situação do usuário mudam, invalidando os tokens emitidos antes')),
+            ],
+            options={
+                'verbose_name': 'user',
+                'verbose_name_plural': 'users',
+                'abstract': False,
+            },
+            managers=[
+                ('objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Categoria',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EstatisticaPagamentoDiaria',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('vendas', models.IntegerField(default=0)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EstatisticaProdutoDiaria',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('receita', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+                ('margem', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Pagamento',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=255, unique=True)),
+                ('juros', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(Decimal('0'))])),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Produto',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=255)),
+                ('preco_compra', models.DecimalField(decimal_places=2, max_digits=20, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))])),
+                ('preco_venda', models.DecimalField(decimal_places=2, max_digits=20, validators=[django.core.validators.MinValueValidator(Decimal('0.01'))])),
+                ('quantidade', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)])),
+                ('disponivel', models.BooleanField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProdutoVenda',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantidade', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('preco_venda', models.DecimalField(blank=True, decimal_places=2, help_text='Preço de venda do produto no momento da venda', max_digits=20, null=True)),
+                ('preco_compra', models.DecimalField(blank=True, decimal_places=2, help_text='Preço de compra do produto no momento da venda', max_digits=20, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ResumoVendaDiario',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('dimensao', models.CharField(choices=[('total', 'Total'), ('categoria', 'Categoria'), ('vendedor', 'Vendedor'), ('pagamento', 'Pagamento')], max_length=20)),
+                ('chave', models.IntegerField(blank=True, help_text='Id da categoria, vendedor ou pagamento, vazio na dimensão total', null=True)),
+                ('vendas', models.IntegerField(default=0)),
+                ('unidades', models.IntegerField(default=0)),
+                ('receita', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EstatisticaPagamento',
+            fields=[
+                ('pagamento', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='api.Pagamento')),
+                ('vendas', models.IntegerField(default=0)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EstatisticaProduto',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='api.Produto')),
+                ('unidades', models.IntegerField(default=0)),
+                ('receita', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+                ('margem', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Venda',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data_venda', models.DateField(auto_now_add=True)),
+                ('valor_venda', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+                ('chave', models.CharField(blank=True, help_text='Identificador gerado pelo terminal, usado para que o reenvio de uma venda não a registre duas vezes', max_length=64, null=True, verbose_name='Chave de idempotência')),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cliente', to=settings.AUTH_USER_MODEL)),
+                ('pagamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Pagamento')),
+                ('produtos', models.ManyToManyField(through='api.ProdutoVenda', to='api.Produto')),
+                ('vendedor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendedor', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='resumovendadiario',
+            index=models.Index(fields=['dimensao', 'data'], name='resumo_venda_dimensao_data'),
+        ),
+        migrations.AddConstraint(
+            model_name='resumovendadiario',
+            constraint=models.UniqueConstraint(fields=('dimensao', 'chave', 'data'), name='resumo_venda_diario_unico'),
+        ),
+        migrations.AddField(
+            model_name='produtovenda',
+            name='produto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Produto'),
+        ),
+        migrations.AddField(
+            model_name='produtovenda',
+            name='venda',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Venda'),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='categoria',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Categoria'),
+        ),
+        migrations.AddIndex(
+            model_name='pagamento',
+            index=models.Index(fields=['juros', 'id'], name='pagamento_juros'),
+        ),
+        migrations.AddField(
+            model_name='estatisticaprodutodiaria',
+            name='produto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Produto'),
+        ),
+        migrations.AddField(
+            model_name='estatisticapagamentodiaria',
+            name='pagamento',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.Pagamento'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='groups',
+            field=models.ManyToManyField(blank=True, help_text='The groups this user belongs to. A user will get all permissions granted to each of their groups.', related_name='user_set', related_query_name='user', to='auth.Group', verbose_name='groups'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='user_permissions',
+            field=models.ManyToManyField(blank=True, help_text='Specific permissions for this user.', related_name='user_set', related_query_name='user', to='auth.Permission', verbose_name='user permissions'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['vendedor', 'data_venda'], name='venda_vendedor_data'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['cliente', 'data_venda'], name='venda_cliente_data'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['data_venda', 'id'], name='venda_data'),
+        ),
+        migrations.AddConstraint(
+            model_name='venda',
+            constraint=models.UniqueConstraint(condition=models.Q(chave__isnull=False), fields=('vendedor', 'chave'), name='venda_vendedor_chave_unica'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['nome', 'id'], name='produto_nome'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['preco_venda', 'id'], name='produto_preco_venda'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(fields=['preco_compra', 'id'], name='produto_preco_compra'),
+        ),
+        migrations.AddIndex(
+            model_name='produto',
+            index=models.Index(condition=models.Q(disponivel=True), fields=['id'], name='produto_disponivel'),
+        ),
+        migrations.AddConstraint(
+            model_name='estatisticaprodutodiaria',
+            constraint=models.UniqueConstraint(fields=('data', 'produto'), name='estat_produto_diaria_unica'),
+        ),
+        migrations.AddIndex(
+            model_name='estatisticaproduto',
+            index=models.Index(condition=models.Q(unidades__gt=0), fields=['-unidades', 'produto'], name='estat_produto_unidades'),
+        ),
+        migrations.AddConstraint(
+            model_name='estatisticapagamentodiaria',
+            constraint=models.UniqueConstraint(fields=('data', 'pagamento'), name='estat_pagamento_diaria_unica'),
+        ),
+        migrations.AddIndex(
+            model_name='estatisticapagamento',
+            index=models.Index(condition=models.Q(vendas__gt=0), fields=['-vendas', 'pagamento'], name='estat_pagamento_vendas'),
+        ),
+    ]
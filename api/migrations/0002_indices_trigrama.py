@@ -0,0 +1,33 @@
+from django.db import migrations
+
+# O icontains do PostgreSQL compara UPPER(nome::text), então o índice é criado sobre a mesma expressão
+TABELAS = ('api_produto', 'api_categoria', 'api_pagamento')
+
+
+def criar_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for tabela in TABELAS:
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS %s_nome_trgm ON %s USING gin (UPPER(nome::text) '
+                              'gin_trgm_ops)' % (tabela, tabela))
+
+
+def remover_indices(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for tabela in TABELAS:
+        schema_editor.execute('DROP INDEX IF EXISTS %s_nome_trgm' % tabela)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indices, remover_indices),
+    ]
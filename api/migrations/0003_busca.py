@@ -0,0 +1,107 @@
+# Generated by Django 3.0.5 on 2026-10-18 12:03
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# A migração guarda a sua própria cópia da configuração e da separação em termos, com os valores de quando foi
+# criada, para que alterações futuras em api.busca não mudem o que ela cria. A configuração copia a do português,
+# removendo os acentos antes de reduzir as palavras ao radical, e os índices usam a mesma expressão das consultas
+CONFIGURACAO = 'portugues_sem_acento'
+PALAVRAS_VAZIAS = frozenset(('A', 'AS', 'O', 'OS', 'E', 'DE', 'DA', 'DAS', 'DO', 'DOS', 'EM', 'NA', 'NAS', 'NO',
+                             'NOS', 'UM', 'UMA', 'COM', 'SEM', 'PARA', 'POR'))
+PALAVRA = re.compile(r'[A-Z0-9]+')
+TABELAS = ('api_produto', 'api_categoria')
+
+
+def criar_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        indexar(apps)
+        return
+
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+    schema_editor.execute("""
+        DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{0}') THEN
+                CREATE TEXT SEARCH CONFIGURATION {0} (COPY = portuguese);
+                ALTER TEXT SEARCH CONFIGURATION {0}
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+            END IF;
+        END $$
+    """.format(CONFIGURACAO))
+    for tabela in TABELAS:
+        schema_editor.execute("CREATE INDEX IF NOT EXISTS %s_nome_fts ON %s USING gin "
+                              "(to_tsvector('%s'::regconfig, nome))" % (tabela, tabela, CONFIGURACAO))
+
+
+def remover_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for tabela in TABELAS:
+        schema_editor.execute('DROP INDEX IF EXISTS %s_nome_fts' % tabela)
+    schema_editor.execute('DROP TEXT SEARCH CONFIGURATION IF EXISTS %s' % CONFIGURACAO)
+
+
+def termos(texto):
+    decomposto = unicodedata.normalize('NFKD', texto)
+    normalizado = ''.join(caractere for caractere in decomposto if not unicodedata.combining(caractere)).upper()
+    encontrados = []
+    for palavra in PALAVRA.findall(normalizado):
+        if palavra not in PALAVRAS_VAZIAS and palavra not in encontrados:
+            encontrados.append(palavra)
+    return encontrados
+
+
+def indexar(apps):
+    Produto = apps.get_model('api', 'Produto')
+    Termo = apps.get_model('api', 'Termo')
+    TermoProduto = apps.get_model('api', 'TermoProduto')
+
+    vocabulario = set()
+    lote = []
+    for produto_id, nome, nome_categoria in Produto.objects.values_list('id', 'nome', 'categoria__nome').iterator():
+        ocorrencias = ([(termo, 'nome') for termo in termos(nome)] +
+                       [(termo, 'categoria') for termo in termos(nome_categoria)])
+        for termo, campo in ocorrencias:
+            lote.append(TermoProduto(termo=termo, produto_id=produto_id, campo=campo))
+            vocabulario.add(termo)
+    TermoProduto.objects.bulk_create(lote, batch_size=500)
+    Termo.objects.bulk_create([Termo(texto=termo) for termo in vocabulario], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_indices_trigrama'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Termo',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('texto', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TermoProduto',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termo', models.CharField(max_length=255)),
+                ('campo', models.CharField(choices=[('nome', 'Nome'), ('categoria', 'Categoria')], max_length=10)),
+                ('produto', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.Produto')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='termoproduto',
+            index=models.Index(fields=['produto', 'campo', 'termo'], name='termo_produto_produto'),
+        ),
+        migrations.AddConstraint(
+            model_name='termoproduto',
+            constraint=models.UniqueConstraint(fields=('campo', 'termo', 'produto'), name='termo_produto_unico'),
+        ),
+        migrations.RunPython(criar_busca, remover_busca),
+    ]
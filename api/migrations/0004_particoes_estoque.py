@@ -0,0 +1,33 @@
+# Generated by Django 3.0.5 on 2026-10-18 13:04
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_busca'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='particoes_estoque',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Partições em que o estoque de um produto muito vendido é dividido, para que vendas simultâneas não esperem umas pelas outras. Com zero o estoque fica no próprio produto'),
+        ),
+        migrations.CreateModel(
+            name='ParticaoEstoque',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveSmallIntegerField()),
+                ('quantidade', models.IntegerField(validators=[django.core.validators.MinValueValidator(0)])),
+                ('produto', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.Produto')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='particaoestoque',
+            constraint=models.UniqueConstraint(fields=('produto', 'numero'), name='particao_estoque_unica'),
+        ),
+    ]
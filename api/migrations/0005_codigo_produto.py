@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_particoes_estoque'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produto',
+            name='codigo',
+            field=models.CharField(blank=True, help_text='Código do produto no catálogo do fornecedor, usado para identificar o produto na importação', max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.0.5 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+def criar_contador(apps, schema_editor):
+    # As linhas existentes ficam com a versão nula e são numeradas na primeira sincronização
+    apps.get_model('api', 'ContadorVersao').objects.create(id=1, versao=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_codigo_produto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorVersao',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Remocao',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('versao', models.BigIntegerField(blank=True, db_index=True, editable=False, help_text='Versão da última alteração, usada na sincronização dos terminais', null=True)),
+                ('modelo', models.CharField(max_length=20)),
+                ('objeto_id', models.IntegerField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='categoria',
+            name='versao',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, help_text='Versão da última alteração, usada na sincronização dos terminais', null=True),
+        ),
+        migrations.AddField(
+            model_name='pagamento',
+            name='versao',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, help_text='Versão da última alteração, usada na sincronização dos terminais', null=True),
+        ),
+        migrations.AddField(
+            model_name='produto',
+            name='versao',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, help_text='Versão da última alteração, usada na sincronização dos terminais', null=True),
+        ),
+        migrations.RunPython(criar_contador, migrations.RunPython.noop),
+    ]
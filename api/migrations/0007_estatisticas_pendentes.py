@@ -0,0 +1,28 @@
+# Generated by Django 3.0.5 on 2026-10-18 13:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_sincronizacao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaPendente',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('unidades', models.IntegerField(default=0)),
+                ('receita', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+                ('margem', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+                ('vendas', models.IntegerField(default=0)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=50)),
+                ('pagamento', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='api.Pagamento')),
+                ('produto', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='api.Produto')),
+            ],
+        ),
+    ]
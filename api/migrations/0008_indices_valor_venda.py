@@ -0,0 +1,21 @@
+# Generated by Django 3.0.5 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_estatisticas_pendentes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['vendedor', 'valor_venda', 'id'], name='venda_vendedor_valor'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['cliente', 'valor_venda', 'id'], name='venda_cliente_valor'),
+        ),
+    ]
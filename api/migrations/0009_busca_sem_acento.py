@@ -0,0 +1,45 @@
+from django.db import migrations
+
+# Em bancos com LC_CTYPE C o analisador da busca textual não reconhece letras acentuadas e separa as palavras
+# nelas, então AÇÚCAR vira A e CAR antes mesmo do unaccent da configuração. Os acentos passam a ser removidos do
+# texto antes da análise, por uma função imutável que os índices podem usar
+CONFIGURACAO = 'portugues_sem_acento'
+TABELAS = ('api_produto', 'api_categoria')
+
+
+def recriar_indices(schema_editor, expressao):
+    for tabela in TABELAS:
+        schema_editor.execute('DROP INDEX IF EXISTS %s_nome_fts' % tabela)
+        schema_editor.execute("CREATE INDEX %s_nome_fts ON %s USING gin (to_tsvector('%s'::regconfig, %s))" % (
+            tabela, tabela, CONFIGURACAO, expressao))
+
+
+def remover_acentos_antes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute("""
+        CREATE OR REPLACE FUNCTION sem_acento(text) RETURNS text
+        LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+    """)
+    recriar_indices(schema_editor, 'sem_acento(nome)')
+
+
+def remover_acentos_depois(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    recriar_indices(schema_editor, 'nome')
+    schema_editor.execute('DROP FUNCTION IF EXISTS sem_acento(text)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_indices_valor_venda'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_acentos_antes, remover_acentos_depois),
+    ]
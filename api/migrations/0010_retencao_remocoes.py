@@ -0,0 +1,26 @@
+# Generated by Django 3.0.5 on 2026-10-18 18:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_busca_sem_acento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contadorversao',
+            name='remocoes_descartadas',
+            field=models.BigIntegerField(default=0),
+        ),
+        # As remoções existentes contam a retenção a partir da migração
+        migrations.AddField(
+            model_name='remocao',
+            name='data_remocao',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
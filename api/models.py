@@ -1,8 +1,14 @@
+import random
 from decimal import Decimal
 
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Case, F, Q, Sum, When, Value
+from django.db.models.query import ModelIterable
+from django.dispatch import Signal
+
+from . import cache_catalogo
 
 
 class User(AbstractUser):
@@ -14,14 +20,75 @@ class User(AbstractUser):
                                     verbose_name="Vendedor",
                                     help_text="Se o usuário for do tipo vendedor, ele poderá adicionar, deletar ou "
                                               "excluir, além de poder ver consumir urls específicas")
+    versao_token = models.PositiveIntegerField(default=0, editable=False,
+                                               help_text="Incrementada quando o papel ou a situação do usuário "
+                                                         "mudam, invalidando os tokens emitidos antes")
 
+    CAMPOS_TOKEN = ('is_client', 'is_seller', 'is_active')
 
-class Categoria(models.Model):
-    nome = models.CharField(max_length=255, unique=True)
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if self.pk is not None and (update_fields is None or set(update_fields) & set(self.CAMPOS_TOKEN)):
+            original = User.objects.filter(pk=self.pk).values(*self.CAMPOS_TOKEN).first()
+            if original is not None and any(original[campo] != getattr(self, campo) for campo in self.CAMPOS_TOKEN):
+                self.versao_token += 1
+                if update_fields is not None:
+                    update_fields = set(update_fields) | {'versao_token'}
+        super(User, self).save(force_insert, force_update, using, update_fields)
+
+
+class Versionado(models.Model):
+    """
+    Modelo acompanhado pela sincronização dos terminais. Cada gravação deixa a versão nula, e o comando
+    numerar_sincronizacao numera as linhas pendentes em ordem crescente, de forma que as alterações já numeradas
+    nunca recebem uma versão menor que as anteriores. As gravações feitas com update() devem anular a versão também
+    """
+    versao = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True,
+                                    help_text="Versão da última alteração, usada na sincronização dos terminais")
+
+    class Meta:
+        abstract = True
 
     def save(self, force_insert=False, force_update=False, using=None,
              update_fields=None):
+        self.versao = None
+        if update_fields is not None:
+            update_fields = set(update_fields) | {'versao'}
+        super(Versionado, self).save(force_insert, force_update, using, update_fields)
+
+
+class ContadorVersao(models.Model):
+    """
+    Última versão distribuída pela sincronização, em uma única linha criada na migração. A linha é bloqueada enquanto
+    as versões são numeradas. Guarda também a versão da última remoção descartada: os terminais sincronizados até
+    uma versão anterior a ela precisam de uma sincronização completa
+    """
+    versao = models.BigIntegerField(default=0)
+    remocoes_descartadas = models.BigIntegerField(default=0)
+
+
+class Remocao(Versionado):
+    """
+    Exclusão de uma categoria, pagamento ou produto, enviada aos terminais na sincronização. É descartada depois de
+    RETENCAO_REMOCOES dias
+    """
+    modelo = models.CharField(max_length=20)
+    objeto_id = models.IntegerField()
+    data_remocao = models.DateTimeField(auto_now_add=True)
+
+
+class Categoria(Versionado):
+    nome = models.CharField(max_length=255, unique=True)
+
+    def normalizar(self):
+        """
+        Ajustes aplicados antes de gravar, também pelas gravações em massa, que não passam pelo save
+        """
         self.nome = self.nome.upper()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        self.normalizar()
         super(Categoria, self).save(force_insert, force_update, using, update_fields)
 
     def __str__(self):
@@ -31,10 +98,15 @@ class Categoria(models.Model):
         return self.__str__()
 
 
-class Pagamento(models.Model):
+class Pagamento(Versionado):
     nome = models.CharField(max_length=255, unique=True)
     juros = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0'))])
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['juros', 'id'], name='pagamento_juros'),
+        ]
+
     def __str__(self):
         return self.nome
 
@@ -42,19 +114,191 @@ class Pagamento(models.Model):
         return self.__str__()
 
 
-class Produto(models.Model):
+# Enviado com os ids, em ids, dos produtos que ficaram indisponíveis por falta de estoque em uma baixa, que é feita
+# com update() e não dispara o post_save
+produtos_esgotados = Signal()
+# Enviado com os ids dos produtos esgotados que voltaram a ficar disponíveis com a reposição do estoque
+produtos_repostos = Signal()
+
+
+class ProdutoIterable(ModelIterable):
+    """
+    Carrega os produtos substituindo, nos que têm o estoque particionado, a quantidade e o campo disponivel pela
+    soma das partições, com uma consulta a mais a cada lote que tiver algum desses produtos
+    """
+    lote = 100
+
+    def __iter__(self):
+        produtos = []
+        for produto in super(ProdutoIterable, self).__iter__():
+            produtos.append(produto)
+            if len(produtos) == self.lote:
+                yield from self.somar_particoes(produtos)
+                produtos = []
+        yield from self.somar_particoes(produtos)
+
+    def somar_particoes(self, produtos):
+        particionados = {produto.pk: produto for produto in produtos
+                         if 'particoes_estoque' in produto.__dict__ and produto.particoes_estoque}
+        if particionados:
+            totais = dict(ParticaoEstoque.objects.using(self.queryset.db).filter(produto_id__in=particionados)
+                          .values('produto_id').annotate(total=Sum('quantidade')).values_list('produto_id', 'total')
+                          .order_by())
+            for produto_id, produto in particionados.items():
+                produto.quantidade = totais.get(produto_id) or 0
+                produto.disponivel = produto.quantidade > 0
+        return produtos
+
+
+class ProdutoQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super(ProdutoQuerySet, self).__init__(*args, **kwargs)
+        self._iterable_class = ProdutoIterable
+
+    def baixar_estoque(self, quantidades, particoes=None):
+        """
+        Decrementa o estoque de vários produtos em um único UPDATE, recalculando o campo disponivel.
+        Recebe um dicionário {id_produto: quantidade}, e só altera os produtos que possuem estoque suficiente,
+        retornando a quantidade de produtos alterados. Os produtos de particoes, {id_produto: partições}, têm o
+        estoque baixado nas suas partições, sem alterar a linha do produto
+        """
+        if not quantidades:
+            return 0
+
+        particoes = particoes or {}
+        comuns = {produto_id: quantidade for produto_id, quantidade in quantidades.items()
+                  if produto_id not in particoes}
+        condicao = Q()
+        for produto_id, quantidade in comuns.items():
+            condicao |= Q(id=produto_id, quantidade__gte=quantidade, particoes_estoque=0)
+
+        cache_catalogo.invalidar('produto')
+        alterados = 0
+        if comuns:
+            alterados = self.filter(condicao).update(
+                versao=None,
+                quantidade=Case(*[When(id=produto_id, then=F('quantidade') - quantidade)
+                                  for produto_id, quantidade in comuns.items()]),
+                disponivel=Case(*[When(id=produto_id, quantidade__gt=quantidade, then=Value(True))
+                                  for produto_id, quantidade in comuns.items()],
+                                default=Value(False), output_field=models.BooleanField()),
+            )
+            # As linhas alteradas estão bloqueadas por esta transação, então só ela pode tê-las esgotado
+            esgotados = list(self.filter(id__in=comuns, disponivel=False).values_list('id', flat=True))
+            if esgotados:
+                produtos_esgotados.send(sender=Produto, ids=esgotados)
+
+        for produto_id, quantidade in quantidades.items():
+            if produto_id in particoes:
+                alterados += ParticaoEstoque.objects.using(self.db).baixar(produto_id, quantidade,
+                                                                          particoes[produto_id])
+        return alterados
+
+    def repor_estoque(self, quantidades):
+        """
+        Devolve ao estoque as quantidades de {id_produto: quantidade}, como na exclusão de uma venda. Os produtos
+        particionados recebem a quantidade na partição com menos estoque. Os produtos esgotados voltam a ficar
+        disponíveis. Deve ser chamada dentro de uma transação
+        """
+        if not quantidades:
+            return
+
+        produtos = list(self.filter(id__in=quantidades).order_by('id').select_for_update()
+                        .values_list('id', 'particoes_estoque', 'disponivel'))
+        particionados = {produto_id for produto_id, particoes, _ in produtos if particoes}
+        esgotados = [produto_id for produto_id, _, disponivel in produtos if not disponivel]
+        comuns = {produto_id: quantidade for produto_id, quantidade in quantidades.items()
+                  if produto_id not in particionados}
+
+        cache_catalogo.invalidar('produto')
+        if comuns:
+            self.filter(id__in=comuns).update(
+                versao=None, disponivel=True,
+                quantidade=Case(*[When(id=produto_id, then=F('quantidade') + quantidade)
+                                  for produto_id, quantidade in comuns.items()]))
+        for produto_id in particionados:
+            ParticaoEstoque.objects.using(self.db).repor(produto_id, quantidades[produto_id])
+        # A linha do produto particionado só guarda a disponibilidade, a quantidade vem das partições
+        reabertos = [produto_id for produto_id in esgotados if produto_id in particionados]
+        if reabertos:
+            self.filter(id__in=reabertos).update(disponivel=True, versao=None)
+        if esgotados:
+            produtos_repostos.send(sender=Produto, ids=esgotados)
+
+
+class Produto(Versionado):
+    codigo = models.CharField(max_length=64, unique=True, null=True, blank=True,
+                              help_text="Código do produto no catálogo do fornecedor, usado para identificar o "
+                                        "produto na importação")
     nome = models.CharField(max_length=255)
     preco_compra = models.DecimalField(max_digits=20, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     preco_venda = models.DecimalField(max_digits=20, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     quantidade = models.IntegerField(validators=[MinValueValidator(0)])
     disponivel = models.BooleanField()
     categoria = models.ForeignKey('Categoria', on_delete=models.CASCADE)
-    
-    def save(self, force_insert=False, force_update=False, using=None,
-             update_fields=None):
+    particoes_estoque = models.PositiveSmallIntegerField(default=0,
+                                                         help_text="Partições em que o estoque de um produto muito "
+                                                                   "vendido é dividido, para que vendas simultâneas "
+                                                                   "não esperem umas pelas outras. Com zero o "
+                                                                   "estoque fica no próprio produto")
+
+    objects = ProdutoQuerySet.as_manager()
+
+    # Partições com que o produto foi carregado, para desfazê-las ao salvar com zero
+    _particoes_carregadas = 0
+    # Nome e disponibilidade com que o produto foi carregado ou salvo pela última vez, para que o índice de
+    # autocompletar só seja alterado quando eles mudam
+    _nome_disponivel_carregados = None
+
+    class Meta:
+        # As listagens paginam por (campo ordenado, id). A busca por trecho do nome usa um índice de trigramas,
+        # criado apenas no PostgreSQL pela migração 0002
+        indexes = [
+            models.Index(fields=['nome', 'id'], name='produto_nome'),
+            models.Index(fields=['preco_venda', 'id'], name='produto_preco_venda'),
+            models.Index(fields=['preco_compra', 'id'], name='produto_preco_compra'),
+            models.Index(fields=['id'], condition=Q(disponivel=True), name='produto_disponivel'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Produto, cls).from_db(db, field_names, values)
+        instance._particoes_carregadas = instance.__dict__.get('particoes_estoque', 0)
+        instance._nome_disponivel_carregados = (instance.__dict__.get('nome'), instance.__dict__.get('disponivel'))
+        return instance
+
+    def normalizar(self):
+        """
+        Ajustes aplicados antes de gravar, também pelas gravações em massa, que não passam pelo save
+        """
         self.nome = self.nome.upper()
         self.disponivel = self.quantidade > 0
-        super(Produto, self).save(force_insert, force_update, using, update_fields)
+        # Sem código fica nulo, já que o código vazio se repetiria entre os produtos
+        self.codigo = self.codigo or None
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        self.normalizar()
+        if not (self.particoes_estoque or self._particoes_carregadas) or (
+                update_fields is not None and not {'quantidade', 'particoes_estoque'} & set(update_fields)):
+            super(Produto, self).save(force_insert, force_update, using, update_fields)
+        else:
+            # A quantidade salva é distribuída entre as partições, e a do produto fica como referência até a
+            # próxima vez que o estoque for salvo ou se esgotar
+            with transaction.atomic(using=using):
+                super(Produto, self).save(force_insert, force_update, using, update_fields)
+                ParticaoEstoque.objects.using(using or self._state.db).distribuir(self.pk, self.quantidade,
+                                                                                  self.particoes_estoque)
+            self._particoes_carregadas = self.particoes_estoque
+        self._nome_disponivel_carregados = (self.nome, self.disponivel)
+
+    @property
+    def nome_disponivel_alterados(self):
+        """
+        Se o nome ou a disponibilidade mudaram desde que o produto foi carregado ou salvo pela última vez. Os sinais
+        de post_save recebem o produto antes de esse estado ser atualizado
+        """
+        return self._nome_disponivel_carregados != (self.nome, self.disponivel)
 
     def __str__(self):
         return self.nome
@@ -63,10 +307,107 @@ class Produto(models.Model):
         return self.__str__()
 
 
+class ParticaoEstoqueQuerySet(models.QuerySet):
+    def distribuir(self, produto_id, quantidade, particoes):
+        """
+        Recria as partições do produto dividindo a quantidade igualmente entre elas. Com zero partições apenas
+        remove as existentes
+        """
+        self.filter(produto_id=produto_id).delete()
+        self.bulk_create([ParticaoEstoque(produto_id=produto_id, numero=numero,
+                                          quantidade=quantidade // particoes + (numero < quantidade % particoes))
+                          for numero in range(particoes)])
+
+    def baixar(self, produto_id, quantidade, total):
+        """
+        Retira a quantidade de uma das total partições do produto. Nos bancos com SKIP LOCKED a partição é sorteada
+        entre as que têm estoque suficiente e não estão bloqueadas por outra transação; nos demais, tenta a partir
+        de uma sorteada e segue pelas seguintes. Se nenhuma tem a quantidade sozinha, bloqueia todas e retira de
+        várias. Retorna 1 se conseguiu retirar e 0 se o estoque do produto não é suficiente. Deve ser chamada
+        dentro de uma transação
+        """
+        particoes = self.filter(produto_id=produto_id)
+        if connections[self.db].features.has_select_for_update_skip_locked:
+            escolhida = particoes.filter(quantidade__gte=quantidade).order_by('?').select_for_update(
+                skip_locked=True).values_list('numero', 'quantidade').first()
+            tentativas = [] if escolhida is None else [escolhida]
+        else:
+            # O estoque da partição não é lido antes, então é conferido após a baixa
+            inicio = random.randrange(total)
+            tentativas = [((inicio + deslocamento) % total, None) for deslocamento in range(total)]
+
+        for numero, estoque in tentativas:
+            if particoes.filter(numero=numero, quantidade__gte=quantidade).update(
+                    quantidade=F('quantidade') - quantidade):
+                if estoque == quantidade or estoque is None and not particoes.filter(
+                        numero=numero, quantidade__gt=0).exists():
+                    self.conferir_esgotado(produto_id)
+                return 1
+
+        restante = quantidade
+        linhas = list(particoes.select_for_update().order_by('numero').values_list('id', 'quantidade'))
+        if sum(estoque for _, estoque in linhas) < quantidade:
+            return 0
+        for particao_id, estoque in linhas:
+            retirada = min(estoque, restante)
+            if retirada:
+                # A condição protege os bancos sem bloqueio de linhas, em que a partição pode ter mudado após a
+                # leitura; nesse caso a baixa falha e a transação deve ser desfeita
+                if not particoes.filter(id=particao_id, quantidade__gte=retirada).update(
+                        quantidade=F('quantidade') - retirada):
+                    return 0
+                restante -= retirada
+            if not restante:
+                break
+        self.conferir_esgotado(produto_id)
+        return 1
+
+    def repor(self, produto_id, quantidade):
+        """
+        Devolve a quantidade à partição do produto com menos estoque
+        """
+        particao = self.filter(produto_id=produto_id).order_by('quantidade', 'numero').values_list(
+            'id', flat=True).first()
+        self.filter(id=particao).update(quantidade=F('quantidade') + quantidade)
+
+    def conferir_esgotado(self, produto_id):
+        """
+        Marca o produto como indisponível quando nenhuma partição tem mais estoque, já que a listagem e a busca
+        filtram pelo campo disponivel do próprio produto
+        """
+        if not self.filter(produto_id=produto_id, quantidade__gt=0).exists():
+            Produto.objects.using(self.db).filter(id=produto_id).update(quantidade=0, disponivel=False, versao=None)
+            produtos_esgotados.send(sender=Produto, ids=[produto_id])
+
+
+class ParticaoEstoque(models.Model):
+    """
+    Parte do estoque de um produto com particoes_estoque maior que zero. O estoque do produto é a soma das suas
+    partições
+    """
+    produto = models.ForeignKey('Produto', on_delete=models.CASCADE, db_index=False)
+    numero = models.PositiveSmallIntegerField()
+    quantidade = models.IntegerField(validators=[MinValueValidator(0)])
+
+    objects = ParticaoEstoqueQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['produto', 'numero'], name='particao_estoque_unica'),
+        ]
+
+    def __str__(self):
+        return '%s %s %s' % (self.produto_id, self.numero, self.quantidade)
+
+
 class ProdutoVenda(models.Model):
     venda = models.ForeignKey('Venda', on_delete=models.CASCADE)
     produto = models.ForeignKey('Produto', on_delete=models.CASCADE)
     quantidade = models.IntegerField(validators=[MinValueValidator(1)])
+    preco_venda = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True,
+                                      help_text="Preço de venda do produto no momento da venda")
+    preco_compra = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True,
+                                       help_text="Preço de compra do produto no momento da venda")
 
     def __str__(self):
         return '%s %s %s' % (self.venda, self.produto, self.quantidade)
@@ -79,9 +420,180 @@ class Venda(models.Model):
     vendedor = models.ForeignKey('User', related_name='vendedor', on_delete=models.CASCADE)
     cliente = models.ForeignKey('User', related_name='cliente', on_delete=models.CASCADE)
     valor_venda = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+    chave = models.CharField(max_length=64, null=True, blank=True,
+                             verbose_name="Chave de idempotência",
+                             help_text="Identificador gerado pelo terminal, usado para que o reenvio de uma venda "
+                                       "não a registre duas vezes")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['vendedor', 'chave'], condition=Q(chave__isnull=False),
+                                    name='venda_vendedor_chave_unica'),
+        ]
+        # As listagens filtram pelo vendedor ou cliente e depois pela data ou pelo valor, com o id como desempate da
+        # paginação; os resumos diários filtram só pela data
+        indexes = [
+            models.Index(fields=['vendedor', 'data_venda'], name='venda_vendedor_data'),
+            models.Index(fields=['cliente', 'data_venda'], name='venda_cliente_data'),
+            models.Index(fields=['vendedor', 'valor_venda', 'id'], name='venda_vendedor_valor'),
+            models.Index(fields=['cliente', 'valor_venda', 'id'], name='venda_cliente_valor'),
+            models.Index(fields=['data_venda', 'id'], name='venda_data'),
+        ]
+
+    @staticmethod
+    def calcular_valor(pagamento, itens):
+        """
+        Calcula o valor da venda a partir de pares (produto, quantidade), aplicando os juros do pagamento
+        """
+        valor = 0
+        for produto, quantidade in itens:
+            valor += produto.preco_venda * quantidade
+
+        return valor + (valor * (pagamento.juros / 100))
 
     def __str__(self):
         return self.vendedor.username
 
     def __repr__(self):
         return self.__str__()
+
+
+class EstatisticaProduto(models.Model):
+    produto = models.OneToOneField('Produto', primary_key=True, on_delete=models.CASCADE)
+    unidades = models.IntegerField(default=0)
+    receita = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+    margem = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-unidades', 'produto'], condition=Q(unidades__gt=0),
+                         name='estat_produto_unidades'),
+        ]
+
+
+class EstatisticaProdutoDiaria(models.Model):
+    produto = models.ForeignKey('Produto', on_delete=models.CASCADE)
+    data = models.DateField()
+    unidades = models.IntegerField(default=0)
+    receita = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+    margem = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['data', 'produto'], name='estat_produto_diaria_unica'),
+        ]
+
+
+class EstatisticaPagamento(models.Model):
+    pagamento = models.OneToOneField('Pagamento', primary_key=True, on_delete=models.CASCADE)
+    vendas = models.IntegerField(default=0)
+    valor = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-vendas', 'pagamento'], condition=Q(vendas__gt=0),
+                         name='estat_pagamento_vendas'),
+        ]
+
+
+class EstatisticaPagamentoDiaria(models.Model):
+    pagamento = models.ForeignKey('Pagamento', on_delete=models.CASCADE)
+    data = models.DateField()
+    vendas = models.IntegerField(default=0)
+    valor = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['data', 'pagamento'], name='estat_pagamento_diaria_unica'),
+        ]
+
+
+class EstatisticaPendente(models.Model):
+    """
+    Variação das estatísticas causada por vendas gravadas ou excluídas e ainda não consolidada. As vendas apenas
+    inserem estas linhas, sem disputar as linhas das estatísticas de cada produto e pagamento, que são atualizadas
+    por estatisticas.consolidar
+    """
+    produto = models.ForeignKey('Produto', null=True, on_delete=models.CASCADE)
+    pagamento = models.ForeignKey('Pagamento', null=True, on_delete=models.CASCADE)
+    data = models.DateField()
+    unidades = models.IntegerField(default=0)
+    receita = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+    margem = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+    vendas = models.IntegerField(default=0)
+    valor = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+
+
+class ResumoVendaDiario(models.Model):
+    TOTAL = 'total'
+    CATEGORIA = 'categoria'
+    VENDEDOR = 'vendedor'
+    PAGAMENTO = 'pagamento'
+    DIMENSOES = (
+        (TOTAL, 'Total'),
+        (CATEGORIA, 'Categoria'),
+        (VENDEDOR, 'Vendedor'),
+        (PAGAMENTO, 'Pagamento'),
+    )
+
+    data = models.DateField()
+    dimensao = models.CharField(max_length=20, choices=DIMENSOES)
+    chave = models.IntegerField(null=True, blank=True,
+                                help_text="Id da categoria, vendedor ou pagamento, vazio na dimensão total")
+    vendas = models.IntegerField(default=0)
+    unidades = models.IntegerField(default=0)
+    receita = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimensao', 'chave', 'data'], name='resumo_venda_diario_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['dimensao', 'data'], name='resumo_venda_dimensao_data'),
+        ]
+
+
+class Termo(models.Model):
+    """
+    Vocabulário do índice de busca, usado para encontrar as palavras parecidas com as buscadas
+    """
+    texto = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.texto
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class TermoProduto(models.Model):
+    """
+    Índice invertido da busca de produtos, usado quando o banco não possui busca textual nativa. Cada palavra
+    normalizada do nome do produto e do nome da sua categoria gera um registro
+    """
+    NOME = 'nome'
+    CATEGORIA = 'categoria'
+    CAMPOS = (
+        (NOME, 'Nome'),
+        (CATEGORIA, 'Categoria'),
+    )
+
+    termo = models.CharField(max_length=255)
+    produto = models.ForeignKey('Produto', on_delete=models.CASCADE, db_index=False)
+    campo = models.CharField(max_length=10, choices=CAMPOS)
+
+    class Meta:
+        # O índice da restrição localiza os termos de um campo, inclusive por prefixo, e percorre os produtos de
+        # um termo na ordem do id. O índice pelo produto cobre a pontuação dos produtos de uma faixa de ids
+        constraints = [
+            models.UniqueConstraint(fields=['campo', 'termo', 'produto'], name='termo_produto_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['produto', 'campo', 'termo'], name='termo_produto_produto'),
+        ]
+
+    def __str__(self):
+        return '%s %s %s' % (self.termo, self.produto_id, self.campo)
+
+    def __repr__(self):
+        return self.__str__()
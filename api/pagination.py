@@ -0,0 +1,101 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Paginação por cursor em que a posição é o valor do campo ordenado junto com o id do último registro da página.
+    A página seguinte é buscada com um filtro sobre essa posição, então páginas profundas custam o mesmo que a
+    primeira, mesmo quando o campo ordenado possui valores repetidos.
+    Respeita a ordenação pedida ao OrderingFilter da view, considerando apenas o primeiro campo
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    ordering = ('id', )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        fields = []
+        ordering = self.get_ordering(request, queryset, view)
+        for campo in ordering:
+            fields.append(queryset.model._meta.get_field(campo.lstrip('-')))
+
+        self.campos = [field.attname for field in fields]
+        self.ordering = [('-' if campo.startswith('-') else '') + field.attname for campo, field in zip(ordering, fields)]
+
+        self.cursor = self.decode_cursor(request)
+        reverso = bool(self.cursor and self.cursor.reverse)
+        ordering = [inverter(campo) for campo in self.ordering] if reverso else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            try:
+                valores = [field.to_python(valor) for field, valor in zip(fields, json.loads(self.cursor.position))]
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self.apos(ordering, valores))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        mais = len(results) > self.page_size
+
+        if reverso:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = mais
+        else:
+            self.has_next = mais
+            self.has_previous = self.cursor is not None and bool(self.page)
+
+        return self.page
+
+    def get_ordering(self, request, queryset, view):
+        try:
+            ordering = super(KeysetPagination, self).get_ordering(request, queryset, view)
+        except AssertionError:
+            ordering = self.ordering
+
+        campo = ordering[0] if ordering else 'id'
+        if campo.lstrip('-') in ('id', 'pk'):
+            return (campo.replace('pk', 'id'), )
+        return campo, ('-id' if campo.startswith('-') else 'id')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.posicao(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.posicao(self.page[0])))
+
+    def posicao(self, instance):
+        return json.dumps([getattr(instance, campo) for campo in self.campos], cls=DjangoJSONEncoder)
+
+    def apos(self, ordering, valores):
+        """
+        Monta o filtro dos registros que vêm depois da posição, na ordenação informada
+        """
+        condicao = Q()
+        anteriores = {}
+        for campo, ordem, valor in zip(self.campos, ordering, valores):
+            lookup = '%s__%s' % (campo, 'lt' if ordem.startswith('-') else 'gt')
+            condicao |= Q(**anteriores, **{lookup: valor})
+            anteriores[campo] = valor
+
+        return condicao
+
+
+def inverter(campo):
+    return campo[1:] if campo.startswith('-') else '-' + campo
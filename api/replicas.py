@@ -0,0 +1,55 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+REPLICAS = [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+usar_replica = ContextVar('usar_replica', default=False)
+
+
+@contextmanager
+def leitura():
+    """
+    Envia às réplicas as consultas de leitura feitas dentro do bloco
+    """
+    token = usar_replica.set(True)
+    try:
+        yield
+    finally:
+        usar_replica.reset(token)
+
+
+class RoteadorReplicas:
+    """
+    Lê das réplicas apenas dentro de leitura(), usado pelas listagens e estatísticas, que toleram o atraso da
+    replicação. As demais leituras e todas as escritas usam o banco principal
+    """
+
+    def db_for_read(self, model, **hints):
+        # Objetos relacionados a uma instância são lidos do mesmo banco que ela
+        if REPLICAS and usar_replica.get() and 'instance' not in hints:
+            return random.choice(REPLICAS)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class LeituraReplicaMixin:
+    """
+    Atende o GET da view lendo das réplicas. Não é usado nas listagens do catálogo, cujo resultado fica no cache
+    até a próxima alteração, e uma réplica atrasada guardaria no cache dados anteriores a ela
+    """
+
+    def get(self, request, *args, **kwargs):
+        with leitura():
+            return super(LeituraReplicaMixin, self).get(request, *args, **kwargs)
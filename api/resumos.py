@@ -0,0 +1,69 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import ProdutoVenda, ResumoVendaDiario, Venda
+
+
+def atualizar(desde=None):
+    """
+    Reconstrói os resumos diários a partir da data informada. Sem data, continua do último dia já resumido,
+    que é refeito por poder ter sido resumido antes de terminar. Retorna a quantidade de resumos gravados
+    """
+    if desde is None:
+        desde = ResumoVendaDiario.objects.aggregate(ultimo=Max('data'))['ultimo']
+    if desde is None:
+        desde = Venda.objects.aggregate(primeiro=Min('data_venda'))['primeiro']
+    if desde is None:
+        return 0
+
+    ResumoVendaDiario.objects.filter(data__gte=desde).delete()
+
+    vendas = Venda.objects.filter(data_venda__gte=desde)
+    itens = ProdutoVenda.objects.filter(venda__data_venda__gte=desde)
+
+    resumos = {}
+    for dimensao, campo in ((ResumoVendaDiario.TOTAL, None),
+                            (ResumoVendaDiario.VENDEDOR, 'vendedor_id'),
+                            (ResumoVendaDiario.PAGAMENTO, 'pagamento_id')):
+        agrupamento = ('data_venda', campo) if campo else ('data_venda', )
+        for linha in vendas.values(*agrupamento).annotate(total_vendas=Count('id'),
+                                                          total_receita=Sum('valor_venda')).order_by():
+            resumo = _resumo(resumos, linha['data_venda'], dimensao, linha.get(campo))
+            resumo.vendas = linha['total_vendas']
+            resumo.receita = linha['total_receita']
+
+        agrupamento = tuple('venda__' + nome for nome in agrupamento)
+        for linha in itens.values(*agrupamento).annotate(total_unidades=Sum('quantidade')).order_by():
+            resumo = _resumo(resumos, linha['venda__data_venda'], dimensao, linha.get('venda__%s' % campo))
+            resumo.unidades = linha['total_unidades']
+
+    valor = ExpressionWrapper(F('quantidade') * Coalesce('preco_venda', 'produto__preco_venda') *
+                              (1 + F('venda__pagamento__juros') * Value(Decimal('0.01'))), output_field=DecimalField())
+    for linha in itens.values('venda__data_venda', 'produto__categoria_id').annotate(
+            total_vendas=Count('venda', distinct=True),
+            total_unidades=Sum('quantidade'),
+            total_receita=Sum(valor)).order_by():
+        resumo = _resumo(resumos, linha['venda__data_venda'], ResumoVendaDiario.CATEGORIA,
+                         linha['produto__categoria_id'])
+        resumo.vendas = linha['total_vendas']
+        resumo.unidades = linha['total_unidades']
+        resumo.receita = linha['total_receita']
+
+    ResumoVendaDiario.objects.bulk_create(resumos.values(), batch_size=500)
+    return len(resumos)
+
+
+def _resumo(resumos, data, dimensao, chave):
+    if (data, dimensao, chave) not in resumos:
+        resumos[(data, dimensao, chave)] = ResumoVendaDiario(data=data, dimensao=dimensao, chave=chave)
+    return resumos[(data, dimensao, chave)]
+
+
+def periodo_padrao(periodo, fim):
+    """
+    Início padrão da série quando não informado: 30 dias, 12 semanas ou 12 meses antes do fim
+    """
+    return fim - {'dia': timedelta(days=30), 'semana': timedelta(weeks=12), 'mes': timedelta(days=365)}[periodo]
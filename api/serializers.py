@@ -1,5 +1,23 @@
+import copy
+import hashlib
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db import transaction
+from django.urls import get_script_prefix, reverse
+from django.utils.functional import cached_property
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from . import cache_catalogo, estatisticas
+from .authentication import CLAIM_VERSAO, CacheLRU, refresh_verificados
+from .campos import CamposMixin, parametro
+from .exceptions import EstoqueInsuficiente
 from .models import (Categoria,
+                     EstatisticaPagamento,
+                     EstatisticaProduto,
                      User,
                      Pagamento,
                      Produto,
@@ -7,72 +25,233 @@ from .models import (Categoria,
                      Venda,
                      )
 
+CAMPOS_SIMPLES = (serializers.BooleanField,
+                  serializers.CharField,
+                  serializers.DateField,
+                  serializers.DecimalField,
+                  serializers.FloatField,
+                  serializers.IntegerField,
+                  )
+SENTINELA = 2147483647
+
+_caminhos = {}
+
+
+def caminho_detalhe(view_name):
+    """
+    Caminho da view de detalhe com %s no lugar do id, calculado uma única vez por view
+    """
+    chave = (view_name, get_script_prefix())
+    if chave not in _caminhos:
+        _caminhos[chave] = reverse(view_name, kwargs={'pk': SENTINELA}).replace(str(SENTINELA), '%s')
+    return _caminhos[chave]
+
+
+class PapelSerializer(CamposMixin, serializers.HyperlinkedModelSerializer):
+    """
+    Serializer cujos campos dependem do papel do usuário da requisição: anônimos e clientes veem apenas os campos
+    de campos_restritos. Os campos de cada papel são montados uma única vez por classe, e, quando todos os campos
+    são simples ou hyperlinks pelo id, a representação lê os atributos diretamente e monta as urls a partir de um
+    caminho calculado uma única vez. Esse plano de representação é guardado por classe, papel, host e parâmetros
+    fields e expand, e com ele os campos do serializer nem chegam a ser copiados
+    """
+    campos_restritos = None
+    representacao_rapida = True
+
+    _campos = {}
+    _planos = CacheLRU(tamanho=256, validade=3600)
+
+    @property
+    def papel(self):
+        request = self.context.get('request')
+        if request is None or self.campos_restritos is None:
+            return 'completo'
+        return cache_catalogo.papel(request.user)
+
+    def get_campos_disponiveis(self):
+        chave = (type(self), self.papel)
+        if chave not in PapelSerializer._campos:
+            campos = super(PapelSerializer, self).get_campos_disponiveis()
+            if chave[1] == 'restrito':
+                campos = OrderedDict((nome, field) for nome, field in campos.items()
+                                     if nome in self.campos_restritos)
+            PapelSerializer._campos[chave] = campos
+
+        return copy.deepcopy(PapelSerializer._campos[chave])
+
+    def to_representation(self, instance):
+        plano = self.plano_representacao
+        if plano is None:
+            return super(PapelSerializer, self).to_representation(instance)
+
+        ret = OrderedDict()
+        for nome, atributo, url, field in plano:
+            valor = getattr(instance, atributo)
+            if valor is None:
+                ret[nome] = None
+            elif url is not None:
+                ret[nome] = url % valor
+            else:
+                ret[nome] = field.to_representation(valor)
+
+        return ret
+
+    @cached_property
+    def plano_representacao(self):
+        """
+        Lista de (nome, atributo, url, field) usada pela representação rápida, ou None se algum campo precisar
+        da representação padrão do DRF
+        """
+        request = self.context.get('request')
+        if not self.representacao_rapida or request is None or self.context.get('format'):
+            return None
+
+        prefixo = request.build_absolute_uri('/')[:-1]
+        chave = (type(self), self.papel, prefixo, _congelar(parametro(request, 'expand')),
+                 _congelar(parametro(request, 'fields')) if self.principal else None)
+        plano = PapelSerializer._planos.obter(chave)
+        if plano is None:
+            plano = self.planejar_representacao(prefixo)
+            # Os serializers aninhados guardam o contexto desta requisição, então os planos com eles não são
+            # reaproveitados. Os demais campos só convertem valores, e são guardados sem o serializer de origem
+            if plano is not None and not any(isinstance(field, serializers.BaseSerializer)
+                                             for _, _, _, field in plano):
+                plano = [(nome, atributo, url, _desvincular(field)) for nome, atributo, url, field in plano]
+                PapelSerializer._planos.guardar(chave, plano)
+        return plano
+
+    def planejar_representacao(self, prefixo):
+        plano = []
+        for field in self._readable_fields:
+            if isinstance(field, serializers.HyperlinkedRelatedField):
+                if field.lookup_field != 'pk' or field.lookup_url_kwarg != 'pk':
+                    return None
+                if isinstance(field, serializers.HyperlinkedIdentityField):
+                    atributo = 'pk'
+                elif field.use_pk_only_optimization() and len(field.source_attrs) == 1:
+                    atributo = self.Meta.model._meta.get_field(field.source).attname
+                else:
+                    return None
+                plano.append((field.field_name, atributo, prefixo + caminho_detalhe(field.view_name), None))
+            elif isinstance(field, CAMPOS_SIMPLES + (serializers.BaseSerializer, )) and len(field.source_attrs) == 1:
+                plano.append((field.field_name, field.source, None, field))
+            else:
+                return None
+
+        return plano
+
+
+def _congelar(nomes):
+    return None if nomes is None else frozenset(nomes)
+
+
+def _desvincular(field):
+    if field is None:
+        return None
+    field = copy.copy(field)
+    field.parent = None
+    return field
+
+
+class ObterTokenSerializer(TokenObtainPairSerializer):
+    """
+    Inclui no token a versão usada para revogar os tokens emitidos antes de uma mudança. O papel não vai no
+    token: ele é lido do usuário, que a autenticação mantém atualizado
+    """
 
-class UserSerializer(serializers.HyperlinkedModelSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super(ObterTokenSerializer, cls).get_token(user)
+        token[CLAIM_VERSAO] = user.versao_token
+        return token
+
+
+class RenovarTokenSerializer(TokenRefreshSerializer):
+    """
+    Guarda o conteúdo dos refresh tokens já verificados, para que renovações seguidas com o mesmo token não
+    decodifiquem e verifiquem a assinatura novamente. Com a rotação de refresh tokens ligada, não usa o cache
+    """
+
+    def validate(self, attrs):
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            return super(RenovarTokenSerializer, self).validate(attrs)
+
+        chave = hashlib.sha256(attrs['refresh'].encode()).hexdigest()
+        payload = refresh_verificados.obter(chave)
+        if payload is None:
+            payload = RefreshToken(attrs['refresh']).payload
+            refresh_verificados.guardar(chave, payload, validade=payload['exp'] - time.time())
+
+        access = AccessToken()
+        for claim, valor in payload.items():
+            if claim not in RefreshToken.no_copy_claims:
+                access[claim] = valor
+
+        return {'access': str(access)}
+
+
+class UserSerializer(CamposMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'is_client', 'is_seller')
 
 
-class CategoriaSerializer(serializers.HyperlinkedModelSerializer):
-    def __init__(self, *args, **kwargs):
-        super(CategoriaSerializer, self).__init__(*args, **kwargs)
-        if 'context' in kwargs:
-            if 'request' in kwargs['context']:
-                request = kwargs.get('context').get('request')
-                user = request.user
-                existing = set(self.fields.keys())
+class ParticipanteSerializer(CamposMixin, serializers.ModelSerializer):
+    """
+    Cliente ou vendedor expandido numa venda, apenas com a identificação
+    """
+    class Meta:
+        model = User
+        fields = ('id', 'username')
+
 
-                if user.is_anonymous or user.is_client:
-                    for other in existing - {'url', 'nome', }:
-                        self.fields.pop(other)
+class CategoriaSerializer(PapelSerializer):
+    campos_restritos = ('url', 'nome', )
 
     class Meta:
         model = Categoria
         fields = ('id', 'url', 'nome', )
 
 
-class PagamentoSerializer(serializers.HyperlinkedModelSerializer):
-    def __init__(self, *args, **kwargs):
-        super(PagamentoSerializer, self).__init__(*args, **kwargs)
-        if 'context' in kwargs:
-            if 'request' in kwargs['context']:
-                request = kwargs.get('context').get('request')
-                user = request.user
-                existing = set(self.fields.keys())
-
-                if user.is_anonymous or user.is_client:
-                    for other in existing - {'url', 'nome', }:
-                        self.fields.pop(other)
+class PagamentoSerializer(PapelSerializer):
+    campos_restritos = ('url', 'nome', )
 
     class Meta:
         model = Pagamento
         fields = ('id', 'url', 'nome', 'juros')
 
 
-class ProdutoSerializer(serializers.HyperlinkedModelSerializer):
-    def __init__(self, *args, **kwargs):
-        super(ProdutoSerializer, self).__init__(*args, **kwargs)
-        if 'context' in kwargs:
-            if 'request' in kwargs['context']:
-                request = kwargs.get('context').get('request')
-                user = request.user
-
-                existing = set(self.fields.keys())
-
-                if user.is_anonymous or user.is_client:
-                    allow = {'url', 'nome', 'preco_venda', 'disponivel', 'categoria', }
-
-                    for other in existing - allow:
-                        self.fields.pop(other)
+class ProdutoSerializer(PapelSerializer):
+    campos_restritos = ('url', 'nome', 'preco_venda', 'disponivel', 'categoria', )
+    expansoes = {'categoria': CategoriaSerializer}
+    # Nos produtos com o estoque particionado, a quantidade e o disponivel vêm da soma das partições
+    colunas_dependentes = {'quantidade': ('particoes_estoque', ), 'disponivel': ('particoes_estoque', )}
 
     class Meta:
         model = Produto
-        fields = ('id', 'url', 'nome', 'preco_compra', 'preco_venda', 'quantidade', 'disponivel', 'categoria', )
+        fields = ('id', 'url', 'codigo', 'nome', 'preco_compra', 'preco_venda', 'quantidade', 'disponivel',
+                  'categoria', 'particoes_estoque', )
         read_only_fields = ('disponivel', )
 
 
-class ProdutoVendaSerializer(serializers.HyperlinkedModelSerializer):
+class ReajusteSerializer(serializers.Serializer):
+    """
+    Reajuste de preços por um percentual ou por um valor somado ao preço, podendo ser negativos
+    """
+    campo = serializers.ChoiceField(choices=('preco_venda', 'preco_compra'), default='preco_venda')
+    percentual = serializers.DecimalField(max_digits=7, decimal_places=2, min_value=Decimal('-99.99'),
+                                          required=False)
+    valor = serializers.DecimalField(max_digits=20, decimal_places=2, required=False)
+
+    def validate(self, attrs):
+        if ('percentual' in attrs) == ('valor' in attrs):
+            raise serializers.ValidationError('Informe o percentual ou o valor do reajuste, apenas um deles')
+        return attrs
+
+
+class ProdutoVendaSerializer(CamposMixin, serializers.HyperlinkedModelSerializer):
+    expansoes = {'produto': ProdutoSerializer}
+
     class Meta:
         model = ProdutoVenda
         fields = ('produto', 'quantidade')
@@ -96,14 +275,24 @@ class ProdutoVendaSerializer(serializers.HyperlinkedModelSerializer):
 }"""
 
 
-class VendaSerializer(serializers.HyperlinkedModelSerializer):
+class VendaSerializer(CamposMixin, serializers.HyperlinkedModelSerializer):
     produtos = ProdutoVendaSerializer(source='produtovenda_set', many=True)
+    expansoes = {'pagamento': PagamentoSerializer, 'cliente': ParticipanteSerializer,
+                 'vendedor': ParticipanteSerializer}
+    # Os usuários só são expandidos para os vendedores, como nas estatísticas; os clientes nem acessam /users/
+    expansoes_vendedor = ('cliente', 'vendedor')
 
     class Meta:
         model = Venda
         fields = ('id', 'url', 'pagamento', 'produtos', 'valor_venda', 'cliente', 'vendedor', 'data_venda', )
         read_only_fields = ('valor_venda', )
 
+    def expansoes_permitidas(self, request):
+        if getattr(request.user, 'is_seller', False):
+            return self.expansoes
+        return {nome: serializer for nome, serializer in self.expansoes.items()
+                if nome not in self.expansoes_vendedor}
+
     @classmethod
     def validate_produtos(cls, produtos):
         for data in produtos:
@@ -121,28 +310,72 @@ class VendaSerializer(serializers.HyperlinkedModelSerializer):
 
         raise serializers.ValidationError('Você não pode realizar uma venda usando outro vendedor')
 
+    @transaction.atomic
     def create(self, validated_data) -> Venda:
-        valor = 0
-        instance: Venda = Venda(pagamento=validated_data.pop('pagamento'),
-                                cliente=validated_data.pop('cliente'),
-                                vendedor=validated_data.pop('vendedor'), )
+        itens = validated_data.pop('produtovenda_set')
+        pagamento: Pagamento = validated_data.pop('pagamento')
 
-        instance.save()
-
-        for data in validated_data.pop('produtovenda_set'):
+        quantidades = {}
+        particoes = {}
+        for data in itens:
             produto: Produto = data.get('produto')
-            quantidade = data.get('quantidade')
+            quantidades[produto.id] = quantidades.get(produto.id, 0) + data.get('quantidade')
+            if produto.particoes_estoque:
+                particoes[produto.id] = produto.particoes_estoque
+
+        instance: Venda = Venda.objects.create(pagamento=pagamento,
+                                               cliente=validated_data.pop('cliente'),
+                                               vendedor=validated_data.pop('vendedor'),
+                                               valor_venda=Venda.calcular_valor(
+                                                   pagamento, [(data.get('produto'), data.get('quantidade'))
+                                                               for data in itens]), )
+
+        produtos = [ProdutoVenda(venda=instance,
+                                 produto=data.get('produto'),
+                                 quantidade=data.get('quantidade'),
+                                 preco_venda=data.get('produto').preco_venda,
+                                 preco_compra=data.get('produto').preco_compra)
+                    for data in itens]
+        ProdutoVenda.objects.bulk_create(produtos)
+
+        if Produto.objects.baixar_estoque(quantidades, particoes) != len(quantidades):
+            raise EstoqueInsuficiente()
+
+        estatisticas.registrar_vendas([instance], produtos)
 
-            valor += produto.preco_venda * quantidade
-            ProdutoVenda(venda=instance, produto=produto, quantidade=quantidade).save()
+        return instance
 
-            produto.quantidade -= quantidade
-            produto.save()
 
-        instance.valor_venda = valor + (valor * (instance.pagamento.juros / 100))
-        instance.save()
+class HyperlinkedIdField(serializers.HyperlinkedRelatedField):
+    """
+    Resolve o hyperlink apenas até o id do objeto, sem consultá-lo no banco
+    """
+
+    def get_object(self, view_name, view_args, view_kwargs):
+        return int(view_kwargs[self.lookup_url_kwarg])
 
-        return instance
+
+class ProdutoVendaLoteSerializer(serializers.Serializer):
+    produto = HyperlinkedIdField(view_name='produto-detail', queryset=Produto.objects.all())
+    quantidade = serializers.IntegerField(min_value=1)
+
+
+class VendaLoteSerializer(serializers.Serializer):
+    """
+    Uma venda dentro de um lote. Os hyperlinks são resolvidos apenas até o id, para que os objetos
+    de todo o lote sejam buscados de uma vez
+    """
+    chave = serializers.CharField(max_length=64)
+    pagamento = HyperlinkedIdField(view_name='pagamento-detail', queryset=Pagamento.objects.all())
+    produtos = ProdutoVendaLoteSerializer(many=True, allow_empty=False)
+    cliente = HyperlinkedIdField(view_name='user-detail', queryset=User.objects.all())
+    vendedor = HyperlinkedIdField(view_name='user-detail', queryset=User.objects.all())
+
+    def validate_vendedor(self, vendedor):
+        if self.context.get('request').user.id == vendedor:
+            return vendedor
+
+        raise serializers.ValidationError('Você não pode realizar uma venda usando outro vendedor')
 
 
 class ProdutoMaisVendidoSerializer(serializers.HyperlinkedModelSerializer):
@@ -155,3 +388,37 @@ class PagamentoMaisUtilizadoSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Pagamento
         fields = ('url', )
+
+
+class EstatisticaProdutoSerializer(PapelSerializer):
+    produto = serializers.HyperlinkedRelatedField(view_name='produto-detail', read_only=True)
+    campos_restritos = ('produto', 'unidades', 'receita', )
+    expansoes = {'produto': ProdutoSerializer}
+
+    class Meta:
+        model = EstatisticaProduto
+        fields = ('produto', 'unidades', 'receita', 'margem', )
+
+
+class EstatisticaPagamentoSerializer(CamposMixin, serializers.HyperlinkedModelSerializer):
+    pagamento = serializers.HyperlinkedRelatedField(view_name='pagamento-detail', read_only=True)
+    expansoes = {'pagamento': PagamentoSerializer}
+
+    class Meta:
+        model = EstatisticaPagamento
+        fields = ('pagamento', 'vendas', 'valor', )
+
+
+class SerieVendaSerializer(serializers.Serializer):
+    periodo = serializers.DateField()
+    chave = serializers.IntegerField(allow_null=True)
+    vendas = serializers.IntegerField()
+    unidades = serializers.IntegerField()
+    receita = serializers.DecimalField(max_digits=50, decimal_places=2)
+    ticket_medio = serializers.SerializerMethodField()
+
+    @classmethod
+    def get_ticket_medio(cls, linha):
+        if not linha['vendas']:
+            return None
+        return str((linha['receita'] / linha['vendas']).quantize(Decimal('0.01')))
@@ -0,0 +1,86 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import autocompletar, busca, cache_catalogo
+from .authentication import alterar_usuario
+from .models import Categoria, Pagamento, Produto, Remocao, User, produtos_esgotados, produtos_repostos
+
+
+@receiver(post_save, sender=Categoria)
+@receiver(post_delete, sender=Categoria)
+def invalidar_categoria(sender, **kwargs):
+    cache_catalogo.invalidar('categoria')
+
+
+@receiver(post_save, sender=Pagamento)
+@receiver(post_delete, sender=Pagamento)
+def invalidar_pagamento(sender, **kwargs):
+    cache_catalogo.invalidar('pagamento')
+
+
+@receiver(post_save, sender=Produto)
+@receiver(post_delete, sender=Produto)
+def invalidar_produto(sender, **kwargs):
+    cache_catalogo.invalidar('produto')
+
+
+@receiver(post_delete, sender=Categoria)
+@receiver(post_delete, sender=Pagamento)
+@receiver(post_delete, sender=Produto)
+def registrar_remocao(sender, instance, **kwargs):
+    Remocao.objects.create(modelo=sender._meta.model_name, objeto_id=instance.pk)
+
+
+@receiver(post_save, sender=Produto)
+def indexar_produto(sender, instance, **kwargs):
+    busca.indexar_produtos([instance.pk])
+
+
+@receiver(post_save, sender=Categoria)
+def indexar_categoria(sender, instance, created, **kwargs):
+    if not created:
+        busca.indexar_categoria(instance)
+
+
+@receiver(post_save, sender=Produto)
+def autocompletar_produto(sender, instance, created, **kwargs):
+    # As gravações que só mudam o estoque ou os preços não alteram o índice
+    if created or instance.nome_disponivel_alterados:
+        produto_id, nome, disponivel = instance.pk, instance.nome, instance.disponivel
+        transaction.on_commit(lambda: autocompletar.produtos.atualizar(produto_id, nome, disponivel))
+
+
+@receiver(produtos_esgotados, sender=Produto)
+def autocompletar_produtos_esgotados(sender, ids, **kwargs):
+    transaction.on_commit(lambda: autocompletar.produtos.indisponibilizar(ids))
+
+
+@receiver(produtos_repostos, sender=Produto)
+def autocompletar_produtos_repostos(sender, ids, **kwargs):
+    transaction.on_commit(lambda: autocompletar.produtos.disponibilizar(ids))
+
+
+@receiver(post_save, sender=Categoria)
+def autocompletar_categoria(sender, instance, **kwargs):
+    categoria_id, nome = instance.pk, instance.nome
+    transaction.on_commit(lambda: autocompletar.categorias.atualizar(categoria_id, nome))
+
+
+@receiver(post_delete, sender=Produto)
+def autocompletar_remover_produto(sender, instance, **kwargs):
+    produto_id = instance.pk
+    transaction.on_commit(lambda: autocompletar.produtos.remover(produto_id))
+
+
+@receiver(post_delete, sender=Categoria)
+def autocompletar_remover_categoria(sender, instance, **kwargs):
+    categoria_id = instance.pk
+    transaction.on_commit(lambda: autocompletar.categorias.remover(categoria_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def alterar_usuario_cache(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: alterar_usuario(user_id))
@@ -0,0 +1,119 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import Categoria, ContadorVersao, Pagamento, Produto, Remocao
+from .serializers import CategoriaSerializer, PagamentoSerializer, ProdutoSerializer
+
+# Chave na resposta, modelo e serializer de cada tipo sincronizado
+TIPOS = (
+    ('categorias', Categoria, CategoriaSerializer),
+    ('pagamentos', Pagamento, PagamentoSerializer),
+    ('produtos', Produto, ProdutoSerializer),
+)
+# Linhas pendentes numeradas por tabela em cada transação da numeração; as demais ficam para a seguinte
+LIMITE_NUMERACAO = 10000
+
+
+def numerar(limite=LIMITE_NUMERACAO):
+    """
+    Dá versões às linhas gravadas desde a última numeração, que estão com a versão nula. A numeração é feita com
+    o contador bloqueado e só vê linhas já confirmadas, então versões maiores só aparecem depois das menores e um
+    terminal que leu até uma versão não perde alterações anteriores a ela. Cada tabela recebe um único UPDATE,
+    com a versão calculada a partir do id. É executada pelo comando numerar_sincronizacao, fora das requisições,
+    para que nem a sincronização nem as gravações esperem pelo contador. Retorna a quantidade de linhas numeradas
+    e se alguma tabela ainda tem linhas pendentes além do limite
+    """
+    modelos = [modelo for _, modelo, _ in TIPOS] + [Remocao]
+    if not any(modelo.objects.filter(versao__isnull=True).exists() for modelo in modelos):
+        return 0, False
+
+    numeradas = 0
+    pendentes = False
+    with transaction.atomic():
+        contador = bloquear_contador()
+        for modelo in modelos:
+            ids = list(modelo.objects.filter(versao__isnull=True).order_by('id').values_list('id', flat=True)[:limite])
+            if not ids:
+                continue
+            pendentes = pendentes or len(ids) == limite
+            # As versões ficam entre contador + 1 e contador + (último id - primeiro id + 1), na ordem dos ids
+            numeradas += modelo.objects.filter(versao__isnull=True, id__gte=ids[0], id__lte=ids[-1]).update(
+                versao=F('id') + (contador.versao - ids[0] + 1))
+            contador.versao += ids[-1] - ids[0] + 1
+        contador.save()
+    return numeradas, pendentes
+
+
+def bloquear_contador():
+    try:
+        return ContadorVersao.objects.select_for_update().get(id=1)
+    except ContadorVersao.DoesNotExist:
+        # A linha é criada na migração, mas falta em bancos criados sem as migrações
+        return ContadorVersao.objects.get_or_create(id=1)[0]
+
+
+def descartar_remocoes(dias=None):
+    """
+    Exclui as remoções já numeradas há mais de dias, por padrão RETENCAO_REMOCOES, e guarda no contador a maior
+    versão excluída. Os terminais sincronizados até uma versão anterior a ela não receberiam essas remoções, então
+    passam a receber uma sincronização completa. Retorna a quantidade de remoções excluídas
+    """
+    dias = settings.RETENCAO_REMOCOES if dias is None else dias
+    antigas = Remocao.objects.filter(versao__isnull=False, data_remocao__lt=timezone.now() - timedelta(days=dias))
+    if not antigas.exists():
+        return 0
+
+    with transaction.atomic():
+        contador = bloquear_contador()
+        # As remoções anteriores à última antiga também são excluídas, para que nenhuma versão abaixo do corte
+        # continue disponível
+        versao = antigas.aggregate(versao=Max('versao'))['versao']
+        descartadas = Remocao.objects.filter(versao__lte=versao).delete()[0]
+        contador.remocoes_descartadas = max(contador.remocoes_descartadas, versao)
+        contador.save(update_fields=['remocoes_descartadas'])
+    return descartadas
+
+
+def alteracoes(desde, limite, contexto, completa=False):
+    """
+    Alterações com versão maior que desde, no máximo limite somando todos os tipos, em ordem de versão: as
+    categorias, pagamentos e produtos criados ou alterados, representados pelos seus serializers, e os
+    removidos. Só lê o banco: as linhas gravadas aparecem depois de numeradas por numerar. Retorna também a versão
+    a informar na próxima chamada, se há mais alterações depois dela e se a sincronização é completa, a partir da
+    versão 0, com o terminal substituindo o catálogo guardado. Ela é completa quando desde é 0, quando continua uma
+    completa e quando desde é anterior às remoções já descartadas
+    """
+    versao_atual, corte = ContadorVersao.objects.filter(id=1).values_list(
+        'versao', 'remocoes_descartadas').first() or (0, 0)
+    if desde < corte and not completa:
+        desde = 0
+    completa = completa or desde == 0
+
+    encontrados = []
+    for chave, modelo, _ in TIPOS:
+        encontrados += [(objeto.versao, chave, objeto)
+                        for objeto in modelo.objects.filter(versao__gt=desde).order_by('versao')[:limite + 1]]
+    encontrados += [(remocao.versao, 'removidos', remocao)
+                    for remocao in Remocao.objects.filter(versao__gt=desde).order_by('versao')[:limite + 1]]
+    encontrados.sort(key=lambda encontrado: encontrado[0])
+
+    pagina = encontrados[:limite]
+    mais = len(encontrados) > limite
+    versao = pagina[-1][0] if pagina else desde
+    if not mais:
+        # Tudo o que estava numerado ao começar foi entregue, mesmo as versões que não existem mais, como as das
+        # remoções descartadas
+        versao = max(versao, versao_atual)
+    resposta = {'versao': versao, 'mais': mais, 'completa': completa}
+    for chave, _, serializer_class in TIPOS:
+        objetos = [objeto for _, tipo, objeto in pagina if tipo == chave]
+        dados = serializer_class(objetos, many=True, context=contexto).data
+        # O id vai em todos os papéis, para que o terminal relacione as alterações e as remoções
+        resposta[chave] = [dict(item, id=objeto.pk) for objeto, item in zip(objetos, dados)]
+    resposta['removidos'] = [{'modelo': remocao.modelo, 'id': remocao.objeto_id}
+                             for _, tipo, remocao in pagina if tipo == 'removidos']
+    return resposta
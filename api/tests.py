@@ -1,3 +1,1396 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import gzip
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+import brotli
+import msgpack
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import Serializer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import (autocompletar, busca, compressao, estatisticas, exportacao, hashers, importacao, lote, replicas,
+               throttling, versoes)
+from .backends import pool
+from .authentication import chave_usuario, usuarios
+from .management.dados import HOST, SEM_CACHE, SEM_LIMITES, rotas, semear
+from .models import (Categoria,
+                     ContadorVersao,
+                     EstatisticaPagamento,
+                     EstatisticaPendente,
+                     EstatisticaProduto,
+                     EstatisticaProdutoDiaria,
+                     Pagamento,
+                     ParticaoEstoque,
+                     Produto,
+                     ProdutoVenda,
+                     Remocao,
+                     Termo,
+                     TermoProduto,
+                     User,
+                     Venda,
+                     )
+from .renderers import JSONRapidoRenderer
+from .serializers import PapelSerializer, ProdutoSerializer
+
+SEM_METRICAS = dict(settings.METRICAS, ativas=False)
+
+
+@override_settings(LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class BaixaEstoqueConcorrenteTest(TransactionTestCase):
+    """
+    Vendas simultâneas do mesmo produto, cada uma na sua thread e com a sua conexão, como em um servidor com
+    vários workers
+    """
+    threads = 8
+    vendas = 40
+    estoque = 25
+
+    def setUp(self):
+        self.vendedor = User.objects.create_user('vendedor', is_seller=True)
+        self.cliente = User.objects.create_user('cliente', is_client=True)
+        self.pagamento = Pagamento.objects.create(nome='dinheiro', juros=Decimal('0'))
+        categoria = Categoria.objects.create(nome='bebidas')
+        self.produto = Produto.objects.create(nome='refrigerante', preco_compra=Decimal('1'),
+                                              preco_venda=Decimal('2'), quantidade=self.estoque,
+                                              categoria=categoria)
+
+    def payload(self, quantidade=1, **kwargs):
+        return dict({
+            'pagamento': reverse('pagamento-detail', args=[self.pagamento.id]),
+            'produtos': [{'produto': reverse('produto-detail', args=[self.produto.id]), 'quantidade': quantidade}],
+            'cliente': reverse('user-detail', args=[self.cliente.id]),
+            'vendedor': reverse('user-detail', args=[self.vendedor.id]),
+        }, **kwargs)
+
+    def simultaneas(self, funcao, vezes):
+        def executar(posicao):
+            client = APIClient(SERVER_NAME=HOST)
+            client.force_authenticate(self.vendedor)
+            try:
+                return funcao(client, posicao)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            return list(executor.map(executar, range(vezes)))
+
+    def vender(self, quantidade=1):
+        payload = self.payload(quantidade)
+        return self.simultaneas(lambda client, _: client.post(reverse('venda'), payload, format='json').status_code,
+                                self.vendas)
+
+    def vender_em_lote(self, tamanho=5, chaves=None):
+        """
+        Envia as vendas em lotes simultâneos e retorna o resultado de cada venda. Com chaves, os lotes repetem as
+        mesmas chaves em vez de usar chaves únicas
+        """
+        def enviar(client, lote):
+            vendas = [self.payload(chave='%d' % (posicao % chaves if chaves else posicao))
+                      for posicao in range(lote * tamanho, (lote + 1) * tamanho)]
+            response = client.post(reverse('venda-lote'), vendas, format='json')
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        return [resultado for lote in self.simultaneas(enviar, self.vendas // tamanho) for resultado in lote]
+
+    def conferir(self, status, quantidade=1):
+        self.assertEqual(set(status) - {201, 400, 409}, set())
+        vendido = ProdutoVenda.objects.filter(produto=self.produto).aggregate(total=Sum('quantidade'))['total'] or 0
+        produto = Produto.objects.get(id=self.produto.id)
+
+        self.assertEqual(Venda.objects.count(), status.count(201))
+        self.assertEqual(vendido, status.count(201) * quantidade)
+        self.assertEqual(produto.quantidade, self.estoque - vendido)
+        self.assertGreaterEqual(produto.quantidade, 0)
+        self.assertEqual(produto.disponivel, produto.quantidade > 0)
+        return produto
+
+    def test_estoque_nunca_fica_negativo(self):
+        status = self.vender()
+        produto = self.conferir(status)
+        # Há mais vendas que estoque, então todas as unidades são vendidas e as demais vendas são recusadas
+        self.assertEqual(status.count(201), self.estoque)
+        self.assertEqual(produto.quantidade, 0)
+
+    def test_vendas_de_varias_unidades(self):
+        status = self.vender(quantidade=3)
+        produto = self.conferir(status, quantidade=3)
+        self.assertLess(produto.quantidade, 3)
+
+    def test_estoque_particionado(self):
+        self.produto.particoes_estoque = 4
+        self.produto.save()
+
+        status = self.vender()
+        self.conferir(status)
+        self.assertEqual(status.count(201), self.estoque)
+        self.assertFalse(ParticaoEstoque.objects.filter(produto=self.produto, quantidade__lt=0).exists())
+        self.assertFalse(Produto.objects.get(id=self.produto.id).disponivel)
+
+    def test_estatisticas_consolidadas(self):
+        status = self.vender()
+        self.conferir(status)
+        # As vendas só registram a variação, as estatísticas mudam ao consolidar
+        self.assertFalse(EstatisticaProduto.objects.exists())
+        self.assertEqual(EstatisticaPendente.objects.count(), 2 * self.estoque)
+
+        self.assertEqual(estatisticas.consolidar(lote=7), 2 * self.estoque)
+        self.assertFalse(EstatisticaPendente.objects.exists())
+        produto = EstatisticaProduto.objects.get(produto=self.produto)
+        self.assertEqual(produto.unidades, self.estoque)
+        self.assertEqual(produto.receita, self.estoque * self.produto.preco_venda)
+        self.assertEqual(EstatisticaProdutoDiaria.objects.get(produto=self.produto).unidades, self.estoque)
+        self.assertEqual(EstatisticaPagamento.objects.get(pagamento=self.pagamento).vendas, self.estoque)
+
+        client = APIClient(SERVER_NAME=HOST)
+        client.force_authenticate(self.vendedor)
+        self.assertEqual(client.delete(reverse('venda-detail', args=[Venda.objects.first().id])).status_code, 204)
+        estatisticas.consolidar()
+        self.assertEqual(EstatisticaProduto.objects.get(produto=self.produto).unidades, self.estoque - 1)
+        self.assertEqual(EstatisticaPagamento.objects.get(pagamento=self.pagamento).vendas, self.estoque - 1)
+
+    def test_lote_recusa_so_as_vendas_sem_estoque(self):
+        # Com o estoque particionado o lote não bloqueia o produto, então a falta de estoque só é percebida na baixa
+        self.produto.particoes_estoque = 4
+        self.produto.save()
+
+        resultados = self.vender_em_lote()
+        self.assertEqual(len(resultados), self.vendas)
+        status = [resultado['status'] for resultado in resultados]
+        self.conferir(status)
+        self.assertEqual(status.count(201), self.estoque)
+        self.assertTrue(all('erros' in resultado for resultado in resultados if resultado['status'] != 201))
+
+    def test_lote_com_chaves_repetidas(self):
+        self.produto.particoes_estoque = 4
+        self.produto.save()
+
+        resultados = self.vender_em_lote(chaves=5)
+        vendas = {}
+        for resultado in resultados:
+            self.assertIn(resultado['status'], (200, 201))
+            vendas.setdefault(resultado['chave'], set()).add(resultado['venda'])
+
+        # Cada chave gera uma única venda, mesmo quando lotes simultâneos a enviam ao mesmo tempo
+        self.assertEqual(Venda.objects.count(), 5)
+        self.assertTrue(all(len(urls) == 1 for urls in vendas.values()))
+        self.assertEqual([resultado['status'] for resultado in resultados].count(201), 5)
+
+    def test_lote_repetido_apos_impasse(self):
+        causa = Exception('deadlock detected')
+        causa.pgcode = lote.IMPASSE
+        impasse = OperationalError('deadlock detected')
+        impasse.__cause__ = causa
+        registrar = lote._registrar_lote
+        chamadas = []
+
+        def registrar_com_impasse(*args):
+            chamadas.append(args)
+            if len(chamadas) == 1:
+                raise impasse
+            return registrar(*args)
+
+        client = APIClient(SERVER_NAME=HOST)
+        client.force_authenticate(self.vendedor)
+        with mock.patch.object(lote, '_registrar_lote', registrar_com_impasse):
+            response = client.post(reverse('venda-lote'), [self.payload(chave='1')], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([resultado['status'] for resultado in response.json()], [201])
+        self.assertEqual(len(chamadas), 2)
+        self.assertEqual(Produto.objects.get(id=self.produto.id).quantidade, self.estoque - 1)
+
+
+@override_settings(CACHES=SEM_CACHE, LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class ConsultasPorEndpointTest(TestCase):
+    """
+    A quantidade de consultas de cada endpoint de leitura não pode crescer com a quantidade de registros
+    """
+    registros = 10
+
+    def setUp(self):
+        self.vendedor = User.objects.create_user('consultas_vendedor', is_seller=True)
+        self.cliente = User.objects.create_user('consultas_cliente', is_client=True)
+        self.client = APIClient(SERVER_NAME=HOST)
+        self.client.force_authenticate(self.vendedor)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return response
+
+    def test_consultas_fixas(self):
+        semear(self.vendedor, self.cliente, self.registros, 'a')
+        primeira = {}
+        for url in rotas():
+            with CaptureQueriesContext(connection) as consultas:
+                self.get(url)
+            primeira[url] = len(consultas)
+
+        semear(self.vendedor, self.cliente, self.registros, 'b')
+        for url in rotas():
+            with self.subTest(url=url), self.assertNumQueries(primeira[url]):
+                self.get(url)
+
+    def test_listagem_de_vendas(self):
+        semear(self.vendedor, self.cliente, self.registros, 'a')
+        # Uma consulta para a página de vendas e uma para os produtos de todas elas, sem consultas por venda
+        with self.assertNumQueries(2):
+            self.get(reverse('venda'))
+
+    def test_consultas_de_vendas_e_relacionados(self):
+        """
+        Quantidade exata de consultas das leituras de vendas e das listagens com relações, para o vendedor e para
+        o cliente, com N e com 2N registros
+        """
+        semear(self.vendedor, self.cliente, self.registros, 'a')
+        venda = Venda.objects.order_by('id').first()
+        casos = (
+            (reverse('venda'), 2),
+            # O pagamento, o cliente e o vendedor vêm na mesma consulta das vendas
+            (reverse('venda') + '?expand=pagamento,cliente,vendedor', 2),
+            # Os produtos expandidos são lidos com uma consulta para todos os itens da página
+            (reverse('venda') + '?expand=produto,pagamento', 3),
+            (reverse('venda-detail', args=[venda.id]), 2),
+            (reverse('venda-detail', args=[venda.id]) + '?expand=produto,pagamento,cliente', 3),
+            (reverse('produto') + '?expand=categoria', 1),
+            # Os produtos somam as partições do estoque, então são lidos à parte, com uma consulta para a página
+            (reverse('produtos-mais-vendidos') + '?expand=produto', 2),
+            (reverse('pagamentos-mais-utilizados') + '?expand=pagamento', 1),
+        )
+        for prefixo in ('a', 'b'):
+            if prefixo == 'b':
+                semear(self.vendedor, self.cliente, self.registros, prefixo)
+            for user in (self.vendedor, self.cliente):
+                self.client.force_authenticate(user)
+                for url, consultas in casos:
+                    with self.subTest(url=url, usuario=user.username, registros=prefixo), \
+                            self.assertNumQueries(consultas):
+                        self.get(url)
+
+        self.client.force_authenticate(self.vendedor)
+        with self.assertNumQueries(1):
+            self.get(reverse('user'))
+
+
+@override_settings(CACHES=SEM_CACHE, LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class PaginacaoKeysetTest(TestCase):
+    """
+    Páginas da listagem de produtos pelo cursor de posição, com valores repetidos no campo ordenado
+    """
+
+    def setUp(self):
+        categoria = Categoria.objects.create(nome='bebidas')
+        precos = ['3', '1', '2', '1', '3', '1', '2']
+        for posicao, preco in enumerate(precos):
+            Produto.objects.create(nome='produto %d' % posicao, preco_compra=Decimal('0.5'),
+                                   preco_venda=Decimal(preco), quantidade=1, categoria=categoria)
+        self.client = APIClient(SERVER_NAME=HOST)
+        self.client.force_authenticate(User.objects.create_user('paginacao', is_seller=True))
+
+    def pagina(self, url, **parametros):
+        response = self.client.get(url, parametros)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def percorrer(self, ordering):
+        pagina = self.pagina(reverse('produto'), ordering=ordering, page_size=3)
+        self.assertIsNone(pagina['previous'])
+        paginas = [pagina]
+        while pagina['next']:
+            pagina = self.pagina(pagina['next'])
+            paginas.append(pagina)
+        return paginas
+
+    def ids(self, pagina):
+        return [produto['id'] for produto in pagina['results']]
+
+    def test_seguinte_e_anterior_com_empates(self):
+        for ordering in ('preco_venda', '-preco_venda'):
+            with self.subTest(ordering=ordering):
+                paginas = self.percorrer(ordering)
+                esperados = list(Produto.objects.order_by(
+                    ordering, '-id' if ordering.startswith('-') else 'id').values_list('id', flat=True))
+                self.assertEqual([len(pagina['results']) for pagina in paginas], [3, 3, 1])
+                self.assertEqual([produto for pagina in paginas for produto in self.ids(pagina)], esperados)
+
+                # O cursor anterior volta exatamente às páginas já vistas
+                anterior = self.pagina(paginas[2]['previous'])
+                self.assertEqual(self.ids(anterior), self.ids(paginas[1]))
+                primeira = self.pagina(anterior['previous'])
+                self.assertEqual(self.ids(primeira), self.ids(paginas[0]))
+                self.assertIsNone(primeira['previous'])
+                self.assertIsNotNone(primeira['next'])
+
+    def test_registro_incluido_entre_as_paginas(self):
+        primeira = self.pagina(reverse('produto'), ordering='preco_venda', page_size=3)
+        # Um produto com o mesmo preço do último da página, mas id maior, aparece na página seguinte, sem repetir
+        # nem pular registros, o que a paginação por deslocamento não garante
+        ultimo = Produto.objects.get(id=primeira['results'][-1]['id'])
+        novo = Produto.objects.create(nome='novo', preco_compra=Decimal('0.5'), preco_venda=ultimo.preco_venda,
+                                      quantidade=1, categoria=ultimo.categoria)
+        seguinte = self.pagina(primeira['next'])
+        self.assertIn(novo.id, self.ids(seguinte))
+        self.assertFalse(set(self.ids(seguinte)) & set(self.ids(primeira)))
+
+    def test_cursor_invalido(self):
+        url = reverse('produto')
+        self.assertEqual(self.client.get(url, {'cursor': 'invalido'}).status_code, 404)
+        posicao = base64.b64encode(urlencode({'p': '["caro", "x"]'}).encode()).decode()
+        self.assertEqual(self.client.get(url, {'cursor': posicao, 'ordering': 'preco_venda'}).status_code, 404)
+        posicao = base64.b64encode(urlencode({'p': 'sem json'}).encode()).decode()
+        self.assertEqual(self.client.get(url, {'cursor': posicao}).status_code, 404)
+
+
+@override_settings(LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class ExportacaoVendasTest(TestCase):
+    """
+    A exportação contínua traz todas as vendas visíveis ao usuário, e apenas elas, com os seus produtos
+    """
+
+    def setUp(self):
+        self.vendedor = User.objects.create_user('exportacao_vendedor', is_seller=True)
+        cliente = User.objects.create_user('exportacao_cliente', is_client=True)
+        semear(self.vendedor, cliente, 5, 'a')
+        semear(User.objects.create_user('exportacao_outro', is_seller=True), cliente, 4, 'b')
+        self.client = APIClient(SERVER_NAME=HOST)
+        self.client.force_authenticate(self.vendedor)
+
+    def exportar(self, formato):
+        response = self.client.get(reverse('venda-exportar'), {'formato': formato})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def produtos(self, venda):
+        return list(venda.produtovenda_set.order_by('id').values_list('produto_id', 'quantidade'))
+
+    def test_ndjson(self):
+        linhas = [json.loads(linha) for linha in self.exportar('ndjson').splitlines()]
+        vendas = list(Venda.objects.filter(vendedor=self.vendedor).order_by('id'))
+        self.assertEqual(len(linhas), 5)
+        for linha, venda in zip(linhas, vendas):
+            self.assertEqual((linha['id'], linha['pagamento'], linha['vendedor'], linha['cliente']),
+                             (venda.id, venda.pagamento_id, venda.vendedor_id, venda.cliente_id))
+            self.assertEqual(Decimal(linha['valor_venda']), venda.valor_venda)
+            self.assertEqual([(produto['produto'], produto['quantidade']) for produto in linha['produtos']],
+                             self.produtos(venda))
+
+    def test_csv(self):
+        linhas = list(csv.reader(StringIO(self.exportar('csv'))))
+        self.assertEqual(tuple(linhas[0]), exportacao.CABECALHO_CSV)
+        esperadas = [[str(venda.id), str(venda.vendedor_id), str(venda.cliente_id), str(produto), str(quantidade)]
+                     for venda in Venda.objects.filter(vendedor=self.vendedor).order_by('id')
+                     for produto, quantidade in self.produtos(venda)]
+        self.assertEqual(len(linhas) - 1, 15)
+        self.assertEqual([[linha[0], linha[3], linha[4], linha[6], linha[7]] for linha in linhas[1:]], esperadas)
+
+    def test_lotes(self):
+        # Duas consultas por lote, uma para as vendas e outra para os seus produtos, e uma última sem vendas
+        with self.assertNumQueries(11):
+            vendas = list(exportacao.iterar_vendas(Venda.objects.all(), tamanho_lote=2))
+        self.assertEqual([venda['id'] for venda, _ in vendas],
+                         list(Venda.objects.order_by('id').values_list('id', flat=True)))
+        self.assertTrue(all(len(produtos) == 3 for _, produtos in vendas))
+
+
+@override_settings(LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class ExclusaoVendaTest(TestCase):
+    """
+    A exclusão de uma venda devolve os produtos ao estoque, na mesma transação
+    """
+
+    def setUp(self):
+        self.vendedor = User.objects.create_user('exclusao_vendedor', is_seller=True)
+        self.cliente = User.objects.create_user('exclusao_cliente', is_client=True)
+        self.pagamento = Pagamento.objects.create(nome='dinheiro', juros=Decimal('0'))
+        categoria = Categoria.objects.create(nome='bebidas')
+        self.comum = Produto.objects.create(nome='agua', preco_compra=Decimal('1'), preco_venda=Decimal('2'),
+                                            quantidade=2, categoria=categoria)
+        self.particionado = Produto.objects.create(nome='suco', preco_compra=Decimal('1'), preco_venda=Decimal('3'),
+                                                   quantidade=9, particoes_estoque=3, categoria=categoria)
+        self.client = APIClient(SERVER_NAME=HOST)
+        self.client.force_authenticate(self.vendedor)
+
+    def vender(self, **quantidades):
+        response = self.client.post(reverse('venda'), {
+            'pagamento': reverse('pagamento-detail', args=[self.pagamento.id]),
+            'produtos': [{'produto': reverse('produto-detail', args=[getattr(self, nome).id]),
+                          'quantidade': quantidade} for nome, quantidade in quantidades.items()],
+            'cliente': reverse('user-detail', args=[self.cliente.id]),
+            'vendedor': reverse('user-detail', args=[self.vendedor.id]),
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.data['id']
+
+    def estoque(self, produto):
+        produto = Produto.objects.get(id=produto.id)
+        return produto.quantidade, produto.disponivel
+
+    def test_estoque_devolvido(self):
+        venda = self.vender(comum=2, particionado=4)
+        self.assertEqual(self.estoque(self.comum), (0, False))
+        self.assertEqual(self.estoque(self.particionado), (5, True))
+
+        self.assertEqual(self.client.delete(reverse('venda-detail', args=[venda])).status_code, 204)
+        self.assertFalse(Venda.objects.filter(id=venda).exists())
+        self.assertFalse(ProdutoVenda.objects.filter(venda_id=venda).exists())
+        self.assertEqual(self.estoque(self.comum), (2, True))
+        self.assertEqual(self.estoque(self.particionado), (9, True))
+        # A quantidade volta para a partição com menos estoque
+        self.assertEqual(sorted(ParticaoEstoque.objects.filter(produto=self.particionado)
+                                .values_list('quantidade', flat=True)), [2, 3, 4])
+
+    def test_particionado_esgotado_volta_a_ficar_disponivel(self):
+        venda = self.vender(particionado=9)
+        self.assertEqual(self.estoque(self.particionado), (0, False))
+        self.assertEqual(self.client.delete(reverse('venda-detail', args=[venda])).status_code, 204)
+        self.assertEqual(self.estoque(self.particionado), (9, True))
+        self.assertTrue(Produto.objects.filter(id=self.particionado.id, disponivel=True).exists())
+
+    def test_falha_desfaz_a_devolucao(self):
+        venda = self.vender(comum=1)
+        with mock.patch.object(Venda, 'delete', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.client.delete(reverse('venda-detail', args=[venda]))
+        self.assertTrue(Venda.objects.filter(id=venda).exists())
+        self.assertEqual(self.estoque(self.comum), (1, True))
+
+
+@override_settings(CACHES=SEM_CACHE, LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class ExpansaoVendaTest(TestCase):
+    """
+    O cliente e o vendedor de uma venda só são expandidos para os vendedores, e apenas com a identificação
+    """
+
+    def setUp(self):
+        self.vendedor = User.objects.create_user('expansao_vendedor', is_seller=True)
+        self.cliente = User.objects.create_user('expansao_cliente', is_client=True)
+        semear(self.vendedor, self.cliente, 1, 'a')
+        self.url = reverse('venda-detail', args=[Venda.objects.get().id])
+
+    def expandir(self, user):
+        client = APIClient(SERVER_NAME=HOST)
+        client.force_authenticate(user)
+        response = client.get(self.url, {'expand': 'cliente,vendedor,pagamento'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_vendedor_expande_com_campos_reduzidos(self):
+        venda = self.expandir(self.vendedor)
+        self.assertEqual(venda['cliente'], {'id': self.cliente.id, 'username': 'expansao_cliente'})
+        self.assertEqual(venda['vendedor'], {'id': self.vendedor.id, 'username': 'expansao_vendedor'})
+
+    def test_cliente_recebe_apenas_hyperlinks(self):
+        # O cliente não acessa /users/, então também não vê os usuários pela expansão
+        self.assertEqual(APIClient(SERVER_NAME=HOST).get(reverse('user-detail', args=[self.vendedor.id]))
+                         .status_code, 401)
+        venda = self.expandir(self.cliente)
+        self.assertTrue(venda['cliente'].endswith(reverse('user-detail', args=[self.cliente.id])))
+        self.assertTrue(venda['vendedor'].endswith(reverse('user-detail', args=[self.vendedor.id])))
+        self.assertIsInstance(venda['pagamento'], dict)
+
+
+@override_settings(LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class CacheCatalogoTest(TestCase):
+    def setUp(self):
+        caches['catalogo'].clear()
+        self.categoria = Categoria.objects.create(nome='bebidas')
+        self.client = APIClient()
+
+    def test_chave_inclui_esquema_e_host(self):
+        urls = set()
+        for host, seguro in (('localhost', False), ('127.0.0.1', False), ('localhost', True)):
+            response = self.client.get(reverse('categoria'), HTTP_HOST=host, secure=seguro, format='json')
+            urls.add(response.json()['results'][0]['url'])
+
+        caminho = reverse('categoria-detail', args=[self.categoria.id])
+        self.assertEqual(urls, {'http://localhost' + caminho, 'http://127.0.0.1' + caminho,
+                                'https://localhost' + caminho})
+
+    def test_if_none_match(self):
+        etag = self.client.get(reverse('categoria'), HTTP_HOST=HOST, format='json')['ETag']
+        respostas = {
+            etag: 304,
+            'W/' + etag: 304,
+            '"outro", ' + etag: 304,
+            '*': 304,
+            etag[:-2] + '"': 200,
+            '"x%s"' % etag.strip('"'): 200,
+            etag.strip('"'): 200,
+        }
+        for if_none_match, status_code in respostas.items():
+            with self.subTest(if_none_match=if_none_match):
+                response = self.client.get(reverse('categoria'), HTTP_HOST=HOST, HTTP_IF_NONE_MATCH=if_none_match,
+                                           format='json')
+                self.assertEqual(response.status_code, status_code)
+
+
+class PlanoRepresentacaoTest(SimpleTestCase):
+    def setUp(self):
+        PapelSerializer._planos.itens.clear()
+        self.produto = Produto(id=7, nome='refrigerante', preco_compra=Decimal('1'), preco_venda=Decimal('2'),
+                               quantidade=3, disponivel=True, categoria_id=2)
+
+    def serializar(self, host=HOST, **parametros):
+        request = Request(APIRequestFactory().get('/', parametros, SERVER_NAME=host))
+        request.user = User(id=1, username='vendedor', is_seller=True)
+        serializer = ProdutoSerializer([self.produto], many=True, context={'request': request})
+        return serializer, serializer.data
+
+    def test_plano_reaproveitado_sem_copiar_campos(self):
+        _, esperado = self.serializar()
+        with mock.patch.object(ProdutoSerializer, 'get_fields', side_effect=AssertionError):
+            serializer, data = self.serializar()
+
+        self.assertEqual(data, esperado)
+        self.assertNotIn('fields', serializer.child.__dict__)
+
+    def test_plano_por_host_e_campos(self):
+        _, completo = self.serializar()
+        _, outro_host = self.serializar(host='127.0.0.1')
+        _, escolhidos = self.serializar(fields='nome,url')
+
+        self.assertEqual(completo[0]['url'], 'http://localhost' + reverse('produto-detail', args=[7]))
+        self.assertEqual(outro_host[0]['url'], 'http://127.0.0.1' + reverse('produto-detail', args=[7]))
+        self.assertEqual(list(escolhidos[0]), ['url', 'nome'])
+        self.assertGreater(len(completo[0]), 2)
+
+
+@override_settings(LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class AutenticacaoCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('vendedor', password='senha-do-vendedor', is_seller=True)
+        self.client = APIClient(SERVER_NAME=HOST)
+        response = self.client.post(reverse('token_obtain_pair'),
+                                    {'username': 'vendedor', 'password': 'senha-do-vendedor'}, format='json')
+        self.access = response.json()['access']
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer %s' % self.access)
+
+    def test_token_sem_papel(self):
+        token = AccessToken(self.access)
+        self.assertNotIn('is_seller', token.payload)
+        self.assertNotIn('is_client', token.payload)
+
+    def test_alteracao_feita_por_outro_processo(self):
+        self.assertEqual(self.client.get(reverse('venda')).status_code, 200)
+        self.assertIsNotNone(usuarios.obter(self.user.id))
+
+        # Gravação feita por outro worker: não passa pelos sinais deste processo, que ainda guarda o usuário
+        User.objects.filter(id=self.user.id).update(is_seller=False, versao_token=F('versao_token') + 1)
+        self.assertEqual(self.client.get(reverse('venda')).status_code, 200)
+
+        versoes.backend().incrementar(chave_usuario(self.user.id))
+        response = self.client.get(reverse('venda'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_revogado')
+
+
+class VersoesCompartilhadasTest(SimpleTestCase):
+    def setUp(self):
+        descritor, self.arquivo = tempfile.mkstemp()
+        os.close(descritor)
+        self.addCleanup(os.remove, self.arquivo)
+
+    def tabela(self, chaves=64):
+        return versoes.MemoriaCompartilhada({'local': self.arquivo, 'chaves': chaves})
+
+    def test_versao_vista_por_outro_mapa(self):
+        # Cada instância mapeia o arquivo por conta própria, como os workers
+        escrita, leitura = self.tabela(), self.tabela()
+        self.assertIsNone(leitura.obter('usuario:1'))
+
+        primeira = escrita.incrementar('usuario:1')
+        self.assertEqual(leitura.obter('usuario:1'), primeira)
+        self.assertEqual(leitura.incrementar('usuario:1'), primeira + 1)
+        self.assertEqual(escrita.obter('usuario:1'), primeira + 1)
+        self.assertIsNone(escrita.obter('usuario:2'))
+
+    def test_descarta_a_chave_escrita_ha_mais_tempo(self):
+        tabela = self.tabela(chaves=versoes.SONDAGENS)
+        for numero in range(versoes.SONDAGENS):
+            tabela.incrementar('chave:%d' % numero)
+        tabela.incrementar('chave:0')
+
+        tabela.incrementar('chave:nova')
+        self.assertIsNone(tabela.obter('chave:1'))
+        self.assertIsNotNone(tabela.obter('chave:0'))
+        self.assertIsNotNone(tabela.obter('chave:nova'))
+
+
+class LimitesTest(SimpleTestCase):
+    """
+    Regra do GCRA e tabela compartilhada dos limites de requisições: rajada, reposição e recusa
+    """
+
+    def setUp(self):
+        descritor, self.arquivo = tempfile.mkstemp()
+        os.close(descritor)
+        self.addCleanup(os.remove, self.arquivo)
+
+    def test_gcra_rajada_reposicao_e_recusa(self):
+        tat, agora = None, 1000.0
+        # O balde cheio aceita uma rajada de até 'quantidade' requisições no mesmo instante
+        for _ in range(5):
+            permitida, tat, espera = throttling.consumir_gcra(tat, agora, 5, 60)
+            self.assertTrue(permitida)
+            self.assertEqual(espera, 0.0)
+        self.assertEqual(tat, agora + 60)
+
+        permitida, tat_recusada, espera = throttling.consumir_gcra(tat, agora, 5, 60)
+        self.assertFalse(permitida)
+        self.assertEqual(tat_recusada, tat)
+        self.assertEqual(espera, 12)
+
+        # Uma requisição é reposta a cada periodo / quantidade segundos
+        self.assertFalse(throttling.consumir_gcra(tat, agora + 11.9, 5, 60)[0])
+        permitida, tat, _ = throttling.consumir_gcra(tat, agora + 12, 5, 60)
+        self.assertTrue(permitida)
+        self.assertFalse(throttling.consumir_gcra(tat, agora + 12, 5, 60)[0])
+
+        # Depois de um período parado o balde volta a estar cheio, sem acumular além da rajada
+        tat = None
+        for segundos in range(0, 600, 60):
+            self.assertTrue(throttling.consumir_gcra(tat, agora + segundos, 5, 60)[0])
+        permitida, tat, _ = throttling.consumir_gcra(None, agora + 1000, 5, 60)
+        self.assertEqual(tat, agora + 1012)
+
+    def test_tabela_compartilhada_entre_mapas(self):
+        opcoes = {'local': self.arquivo, 'chaves': 64}
+        # Cada instância mapeia o arquivo por conta própria, como os workers
+        primeira, segunda = throttling.MemoriaCompartilhada(opcoes), throttling.MemoriaCompartilhada(opcoes)
+        with mock.patch('api.throttling.time.time', return_value=1000.0):
+            self.assertEqual([primeira.consumir('anon:1', 3, 30)[0] for _ in range(2)], [True, True])
+            self.assertTrue(segunda.consumir('anon:1', 3, 30)[0])
+            self.assertEqual(primeira.consumir('anon:1', 3, 30), (False, 10.0))
+            # Cada chave tem o seu próprio balde
+            self.assertTrue(segunda.consumir('anon:2', 3, 30)[0])
+
+        with mock.patch('api.throttling.time.time', return_value=1010.0):
+            self.assertTrue(segunda.consumir('anon:1', 3, 30)[0])
+            self.assertFalse(primeira.consumir('anon:1', 3, 30)[0])
+
+    def test_tabela_cheia_reaproveita_o_menor_tat(self):
+        tabela = throttling.MemoriaCompartilhada({'local': self.arquivo, 'chaves': throttling.SONDAGENS})
+        with mock.patch('api.throttling.time.time', return_value=1000.0):
+            for numero in range(throttling.SONDAGENS):
+                self.assertTrue(tabela.consumir('chave:%d' % numero, 1, 60)[0])
+            self.assertFalse(tabela.consumir('chave:0', 1, 60)[0])
+            # Sem posição livre, a chave nova ocupa a de menor TAT, e a chave descartada volta ao balde cheio
+            self.assertTrue(tabela.consumir('chave:nova', 1, 60)[0])
+            self.assertFalse(tabela.consumir('chave:nova', 1, 60)[0])
+
+    def test_memoria_local(self):
+        tabela = throttling.MemoriaLocal({'chaves': 2})
+        with mock.patch('api.throttling.time.time', return_value=1000.0):
+            self.assertTrue(tabela.consumir('a', 1, 60)[0])
+            self.assertEqual(tabela.consumir('a', 1, 60), (False, 60.0))
+            self.assertTrue(tabela.consumir('b', 1, 60)[0])
+        with mock.patch('api.throttling.time.time', return_value=1060.0):
+            # Com a tabela cheia, as chaves cujo balde já voltou a estar cheio são descartadas
+            self.assertTrue(tabela.consumir('c', 1, 60)[0])
+            self.assertEqual(set(tabela.estados), {'c'})
+
+
+@override_settings(CACHES=SEM_CACHE, METRICAS=SEM_METRICAS)
+class LimitePorEscopoTest(TestCase):
+    """
+    Os anônimos ficam na taxa anônima do escopo, menor que a dos autenticados
+    """
+
+    def setUp(self):
+        descritor, arquivo = tempfile.mkstemp()
+        os.close(descritor)
+        self.addCleanup(os.remove, arquivo)
+        limites = override_settings(LIMITES=dict(settings.LIMITES, ativos=True, backend='memoria', local=arquivo))
+        limites.enable()
+        self.addCleanup(limites.disable)
+        self.vendedor = User.objects.create_user('limite_vendedor', is_seller=True)
+
+    def requisicoes(self, client, vezes):
+        return [client.get(reverse('produto')).status_code for _ in range(vezes)]
+
+    def test_catalogo_anonimo_e_autenticado(self):
+        taxas = settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES']
+        anonimo = int(taxas['catalogo_anon'].split('/')[0])
+        self.assertLess(anonimo, int(taxas['catalogo'].split('/')[0]))
+
+        status = self.requisicoes(APIClient(SERVER_NAME=HOST), anonimo + 1)
+        self.assertEqual(status, [200] * anonimo + [429])
+
+        client = APIClient(SERVER_NAME=HOST)
+        client.force_authenticate(self.vendedor)
+        self.assertEqual(self.requisicoes(client, anonimo + 1), [200] * (anonimo + 1))
+
+    def test_escopo_sem_taxa_anonima(self):
+        request = Request(APIRequestFactory().post('/'))
+        request.user = AnonymousUser()
+        view = mock.Mock(escopos_limite={'POST': 'venda'})
+        self.assertEqual(throttling.LimitePorEscopo.escopo(request, view), 'anon')
+        view.escopos_limite = {'POST': 'catalogo'}
+        self.assertEqual(throttling.LimitePorEscopo.escopo(request, view), 'catalogo_anon')
+        request.user = self.vendedor
+        self.assertEqual(throttling.LimitePorEscopo.escopo(request, view), 'catalogo')
+
+
+@override_settings(CACHES=SEM_CACHE, LIMITES=SEM_LIMITES,
+                   METRICAS=dict(settings.METRICAS, ativas=True, amostragem=1, token='segredo'))
+class MetricasTest(TestCase):
+    def setUp(self):
+        Categoria.objects.create(nome='bebidas')
+        self.client = APIClient(SERVER_NAME=HOST)
+
+    def exportar(self):
+        response = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return dict(linha.rsplit(' ', 1) for linha in response.content.decode().splitlines()
+                    if not linha.startswith('#'))
+
+    def test_requisicao_amostrada(self):
+        serie = '{rota="categoria",metodo="GET"}'
+        antes = self.exportar()
+        self.assertEqual(self.client.get(reverse('categoria')).status_code, 200)
+        depois = self.exportar()
+
+        total = 'api_requisicoes_total{rota="categoria",metodo="GET",status="200"}'
+        self.assertEqual(int(depois[total]) - int(antes.get(total, 0)), 1)
+        for metrica in ('api_requisicao_segundos', 'api_resposta_bytes', 'api_consultas_por_requisicao',
+                        'api_banco_segundos', 'api_serializacao_segundos'):
+            with self.subTest(metrica=metrica):
+                contagem = '%s_count%s' % (metrica, serie)
+                self.assertEqual(int(depois[contagem]) - int(antes.get(contagem, 0)), 1)
+        soma = 'api_serializacao_segundos_sum%s' % serie
+        self.assertGreater(float(depois[soma]) - float(antes.get(soma, 0)), 0)
+        # A serialização é medida pela view e pela renderização, sem substituir o data dos serializers do DRF
+        self.assertIs(type(Serializer.__dict__['data']), property)
+
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer outro').status_code, 401)
+        with override_settings(METRICAS=dict(settings.METRICAS, token='')):
+            # Sem token configurado as métricas não ficam públicas
+            self.assertEqual(self.client.get(reverse('metricas')).status_code, 404)
+
+
+@override_settings(CACHES=SEM_CACHE, LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS,
+                   COMPRESSAO=dict(settings.COMPRESSAO, ativa=True, minimo=1024))
+class FormatosRespostaTest(TestCase):
+    """
+    Negociação do formato, pelo Accept ou pelo parâmetro format, e da compressão, pelo Accept-Encoding
+    """
+
+    def setUp(self):
+        Categoria.objects.bulk_create([Categoria(nome='CATEGORIA %d' % i) for i in range(40)])
+        self.client = APIClient(SERVER_NAME=HOST)
+        self.client.force_authenticate(User.objects.create_user('formatos', is_seller=True))
+
+    def get(self, url=None, **extra):
+        response = self.client.get(url or reverse('categoria'), **extra)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_json_e_msgpack(self):
+        response = self.get(HTTP_ACCEPT='application/json')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        dados = json.loads(response.content)
+        self.assertEqual(len(dados['results']), 40)
+
+        response = self.get(HTTP_ACCEPT='application/x-msgpack')
+        self.assertEqual(response['Content-Type'], 'application/x-msgpack')
+        self.assertEqual(msgpack.unpackb(response.content, raw=False), dados)
+        self.assertEqual(msgpack.unpackb(self.get(reverse('categoria') + '?format=msgpack').content, raw=False),
+                         dados)
+
+    def test_corpo_em_msgpack(self):
+        response = self.client.post(reverse('categoria'), msgpack.packb({'nome': 'nova'}),
+                                    content_type='application/x-msgpack', HTTP_ACCEPT='application/x-msgpack')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(msgpack.unpackb(response.content, raw=False)['nome'], 'NOVA')
+        response = self.client.post(reverse('categoria'), b'\xc1', content_type='application/x-msgpack')
+        self.assertEqual(response.status_code, 400)
+
+    def test_json_rapido_como_o_do_drf(self):
+        dados = {'preco': Decimal('1.50'), 'data': timezone.datetime(2021, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+                 'nome': 'linha\u2028separada', 1: 'chave'}
+        self.assertEqual(JSONRapidoRenderer().render(dados), JSONRenderer().render(dados))
+        self.assertIn(b'\n  ', JSONRapidoRenderer().render({'a': 1}, 'application/json; indent=2'))
+
+    def test_codificacoes_aceitas(self):
+        self.assertEqual(compressao.codificacoes_aceitas('gzip;q=0.5, br, identity;q=0, x;q=abc'),
+                         {'gzip': 0.5, 'br': 1})
+
+    def test_compressao_negociada(self):
+        original = self.get(HTTP_ACCEPT='application/json').content
+        self.assertGreater(len(original), 1024)
+        casos = (
+            ('gzip', 'gzip'),
+            ('br', 'br'),
+            ('gzip, br', 'br'),
+            ('gzip;q=1, br;q=0.5', 'gzip'),
+            ('*', 'gzip'),
+            ('br;q=0, gzip;q=0', None),
+            ('', None),
+        )
+        for aceitas, esperada in casos:
+            with self.subTest(aceitas=aceitas):
+                response = self.get(HTTP_ACCEPT='application/json', HTTP_ACCEPT_ENCODING=aceitas)
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(response.get('Content-Encoding'), esperada)
+                conteudo = {'gzip': gzip.decompress, 'br': brotli.decompress, None: bytes}[esperada](
+                    response.content)
+                self.assertEqual(conteudo, original)
+                # O ETag do catálogo passa a ser fraco quando o corpo é comprimido
+                self.assertEqual(response['ETag'].startswith('W/'), esperada is not None)
+
+    def test_limite_minimo(self):
+        with override_settings(COMPRESSAO=dict(settings.COMPRESSAO, ativa=True, minimo=10 ** 6)):
+            response = self.get(HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        response = self.get(reverse('categoria-detail', args=[Categoria.objects.first().id]),
+                            HTTP_ACCEPT_ENCODING='gzip')
+        self.assertLess(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_tokens_sem_compressao(self):
+        User.objects.create_user('comprimido', password='segredo-forte')
+        with override_settings(COMPRESSAO=dict(settings.COMPRESSAO, ativa=True, minimo=0)):
+            response = self.client.post(reverse('token_obtain_pair'),
+                                        {'username': 'comprimido', 'password': 'segredo-forte'},
+                                        HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertIn('refresh', response.json())
+
+            response = self.client.post(reverse('token_refresh'), {'refresh': response.json()['refresh']},
+                                        HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+            # As demais respostas continuam comprimidas com o mesmo limite
+            self.assertEqual(self.get(HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'], 'gzip')
+
+
+@override_settings(LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class AutocompletarVersaoTest(TransactionTestCase):
+    """
+    Só as alterações de nome ou disponibilidade geram uma nova versão do índice de autocompletar
+    """
+
+    def setUp(self):
+        self.vendedor = User.objects.create_user('vendedor', is_seller=True)
+        self.cliente = User.objects.create_user('cliente', is_client=True)
+        self.pagamento = Pagamento.objects.create(nome='dinheiro', juros=Decimal('0'))
+        self.produto = Produto.objects.create(nome='refrigerante', preco_compra=Decimal('1'),
+                                              preco_venda=Decimal('2'), quantidade=2,
+                                              categoria=Categoria.objects.create(nome='bebidas'))
+        self.indice = autocompletar.produtos
+        self.indice.reconstruir(self.indice.versao_atual())
+        self.client = APIClient(SERVER_NAME=HOST)
+        self.client.force_authenticate(self.vendedor)
+
+    def vender(self):
+        response = self.client.post(reverse('venda'), {
+            'pagamento': reverse('pagamento-detail', args=[self.pagamento.id]),
+            'produtos': [{'produto': reverse('produto-detail', args=[self.produto.id]), 'quantidade': 1}],
+            'cliente': reverse('user-detail', args=[self.cliente.id]),
+            'vendedor': reverse('user-detail', args=[self.vendedor.id]),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def buscar(self, prefixo, todos=False):
+        return [item_id for item_id, _ in self.indice.buscar(prefixo, 10, todos)]
+
+    def conferir_esgotamento(self):
+        versao = self.indice.versao_atual()
+        self.vender()
+        self.assertEqual(self.indice.versao_atual(), versao)
+        self.assertEqual(self.buscar('refri'), [self.produto.id])
+
+        self.vender()
+        # A venda que esgota o produto gera uma versão, já aplicada ao índice deste processo
+        self.assertNotEqual(self.indice.versao_atual(), versao)
+        self.assertEqual(self.indice.versao, self.indice.versao_atual())
+        self.assertEqual(self.buscar('refri'), [])
+        self.assertEqual(self.buscar('refri', todos=True), [self.produto.id])
+
+    def test_venda_so_gera_versao_ao_esgotar(self):
+        self.conferir_esgotamento()
+
+    def test_estoque_particionado(self):
+        self.produto.particoes_estoque = 2
+        self.produto.save()
+        self.conferir_esgotamento()
+
+    def test_alteracao_de_preco_e_de_nome(self):
+        versao = self.indice.versao_atual()
+        produto = Produto.objects.get(id=self.produto.id)
+        produto.preco_venda = Decimal('3')
+        produto.save()
+        self.assertEqual(self.indice.versao_atual(), versao)
+
+        produto.nome = 'suco'
+        produto.save()
+        self.assertNotEqual(self.indice.versao_atual(), versao)
+        self.assertEqual(self.indice.versao, self.indice.versao_atual())
+        self.assertEqual(self.buscar('suco'), [self.produto.id])
+        self.assertEqual(self.buscar('refri'), [])
+
+
+class ConexaoFalsa:
+    def __init__(self, numero):
+        self.numero = numero
+        self.ativa = True
+        self.fechada = False
+
+    def cursor(self):
+        if not self.ativa:
+            raise ConnectionError('conexão encerrada pelo banco')
+        return mock.Mock()
+
+    def rollback(self):
+        if not self.ativa:
+            raise ConnectionError('conexão encerrada pelo banco')
+
+    def close(self):
+        self.fechada = True
+
+
+class PoolConexoesTest(SimpleTestCase):
+    def criar(self, **kwargs):
+        criadas = []
+
+        def conectar():
+            criadas.append(ConexaoFalsa(len(criadas)))
+            return criadas[-1]
+
+        opcoes = dict(minimo=0, maximo=1, transbordo=0, espera=0.05, pre_ping=True)
+        opcoes.update(kwargs)
+        return pool.Pool(conectar, **opcoes), criadas
+
+    def test_espera_esgotada(self):
+        conexoes, _ = self.criar()
+        self.assertIsNotNone(conexoes.obter())
+        self.assertIsNone(conexoes.obter())
+        metricas = conexoes.metricas()
+        self.assertEqual((metricas['esgotadas'], metricas['abertas'], metricas['em_uso']), (1, 1, 1))
+
+    def test_espera_pela_devolucao(self):
+        conexoes, _ = self.criar(espera=5)
+        conexao = conexoes.obter()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            obtida = executor.submit(conexoes.obter)
+            conexoes.devolver(conexao)
+            self.assertIs(obtida.result(), conexao)
+        self.assertEqual(conexoes.metricas()['criadas'], 1)
+
+    def test_transbordo_fechado_ao_devolver(self):
+        conexoes, criadas = self.criar(maximo=1, transbordo=1)
+        primeira, segunda = conexoes.obter(), conexoes.obter()
+        self.assertIsNone(conexoes.obter())
+        self.assertEqual(conexoes.metricas()['transbordo'], 1)
+
+        conexoes.devolver(segunda)
+        self.assertTrue(segunda.fechada)
+        conexoes.devolver(primeira)
+        self.assertFalse(primeira.fechada)
+        metricas = conexoes.metricas()
+        self.assertEqual((metricas['abertas'], metricas['livres'], metricas['em_uso']), (1, 1, 0))
+        self.assertIs(conexoes.obter(), primeira)
+        self.assertEqual(len(criadas), 2)
+
+    def test_pre_ping_substitui_conexao_encerrada(self):
+        conexoes, criadas = self.criar()
+        conexao = conexoes.obter()
+        conexoes.devolver(conexao)
+        conexao.ativa = False
+
+        nova = conexoes.obter()
+        self.assertIsNot(nova, conexao)
+        self.assertTrue(conexao.fechada)
+        metricas = conexoes.metricas()
+        self.assertEqual((metricas['falhas_ping'], metricas['descartadas'], metricas['abertas']), (1, 1, 1))
+
+        # Sem pre_ping, a conexão encerrada é entregue e descartada ao ser devolvida com erro
+        conexoes, _ = self.criar(pre_ping=False)
+        conexao = conexoes.obter()
+        conexoes.devolver(conexao)
+        conexao.ativa = False
+        self.assertIs(conexoes.obter(), conexao)
+        conexoes.devolver(conexao)
+        self.assertTrue(conexao.fechada)
+        self.assertEqual(conexoes.metricas()['abertas'], 0)
+
+    def test_falha_ao_conectar_libera_a_vaga(self):
+        conexoes = pool.Pool(mock.Mock(side_effect=ConnectionError), minimo=0, maximo=1, transbordo=0, espera=0.05,
+                             pre_ping=True)
+        with self.assertRaises(ConnectionError):
+            conexoes.obter()
+        metricas = conexoes.metricas()
+        self.assertEqual((metricas['abertas'], metricas['em_uso']), (0, 0))
+
+
+class ReplicasTest(SimpleTestCase):
+    def test_roteamento(self):
+        roteador = replicas.RoteadorReplicas()
+        with mock.patch('api.replicas.REPLICAS', ['replica_1']):
+            self.assertIsNone(roteador.db_for_read(Produto))
+            with replicas.leitura():
+                self.assertEqual(roteador.db_for_read(Produto), 'replica_1')
+                # Os objetos relacionados a uma instância são lidos do banco dela
+                self.assertIsNone(roteador.db_for_read(Produto, instance=Produto()))
+                self.assertEqual(roteador.db_for_write(Produto), 'default')
+            self.assertIsNone(roteador.db_for_read(Produto))
+            self.assertFalse(roteador.allow_migrate('replica_1', 'api'))
+            self.assertTrue(roteador.allow_migrate('default', 'api'))
+
+        with replicas.leitura():
+            self.assertIsNone(roteador.db_for_read(Produto))
+
+    def test_views_de_leitura(self):
+        lidos = []
+
+        class Base:
+            def get(self, request):
+                lidos.append(replicas.usar_replica.get())
+
+        class View(replicas.LeituraReplicaMixin, Base):
+            pass
+
+        View().get(None)
+        self.assertEqual(lidos, [True])
+        self.assertFalse(replicas.usar_replica.get())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'BEGIN IMMEDIATE é exclusivo do SQLite')
+class TransacaoSqliteTest(TransactionTestCase):
+    def test_begin_immediate(self):
+        with CaptureQueriesContext(connection) as consultas, transaction.atomic():
+            Categoria.objects.create(nome='bebidas')
+        self.assertEqual([consulta['sql'] for consulta in consultas][0], 'BEGIN IMMEDIATE')
+
+
+class PoolsASGITest(SimpleTestCase):
+    def test_autenticacao_em_pool_proprio(self):
+        from api_comercio.asgi import application
+
+        fabrica = APIRequestFactory()
+        casos = (
+            (fabrica.get(reverse('produto')), 'leitura'),
+            (fabrica.get(reverse('user')), 'leitura'),
+            (fabrica.post(reverse('token_obtain_pair')), 'autenticacao'),
+            (fabrica.post(reverse('token_refresh')), 'autenticacao'),
+            (fabrica.post(reverse('user')), 'autenticacao'),
+            (fabrica.post(reverse('venda')), 'escrita'),
+            (fabrica.post('/inexistente/'), 'escrita'),
+        )
+        for request, esperado in casos:
+            with self.subTest(metodo=request.method, caminho=request.path):
+                self.assertEqual(application.escolher_pool(request), esperado)
+
+    def test_recusa_autenticacao_com_fila_cheia(self):
+        from api_comercio.asgi import application
+
+        request = APIRequestFactory().post(reverse('token_obtain_pair'))
+        limite = settings.ASGI_THREADS['autenticacao'] + settings.SENHAS['fila']
+        with mock.patch.object(application, 'autenticando', limite), \
+                mock.patch.object(application, 'atender', side_effect=AssertionError) as atender:
+            response = asyncio.run(application.get_response(request))
+        self.assertEqual(response.status_code, 503)
+        atender.assert_not_called()
+
+    def test_recusa_hash_sem_vaga(self):
+        with mock.patch.object(hashers, 'vagas', mock.Mock(**{'acquire.return_value': False})):
+            with self.assertRaises(hashers.LoginSobrecarregado):
+                hashers.calcular(lambda: None)
+
+
+class IndicesVendaTest(TestCase):
+    """
+    A listagem de vendas de um usuário ordenada pelo valor procura nos índices (vendedor, valor_venda, id) e
+    (cliente, valor_venda, id), uma busca em cada lado do OR entre vendedor e cliente
+    """
+
+    def test_ordenacao_por_valor_do_usuario(self):
+        from .management.commands.verificar_indices import plano, semear_volume, varreduras
+
+        vendedor = semear_volume(200, 4000, dias=30)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        minimo = Venda.objects.order_by('-valor_venda').values_list('valor_venda', flat=True)[200]
+        client = APIClient(SERVER_NAME=HOST)
+        client.force_authenticate(vendedor)
+
+        with override_settings(CACHES=SEM_CACHE, LIMITES=SEM_LIMITES), CaptureQueriesContext(connection) as consultas:
+            response = client.get(reverse('venda'), {'ordering': '-valor_venda', 'valor_venda__gte': minimo})
+        self.assertEqual(response.status_code, 200)
+        sql = next(consulta['sql'] for consulta in consultas if consulta['sql'].startswith('SELECT "api_venda".'))
+
+        linhas = '\n'.join(plano(sql))
+        self.assertEqual(varreduras(sql), [], linhas)
+        self.assertIn('venda_vendedor_valor', linhas)
+        self.assertIn('venda_cliente_valor', linhas)
+
+
+@override_settings(LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class ImportacaoTest(TestCase):
+    cabecalho = 'codigo,nome,categoria,preco_compra,preco_venda,quantidade\n'
+
+    def setUp(self):
+        self.bebidas = Categoria.objects.create(nome='Bebidas')
+        self.client = APIClient(SERVER_NAME=HOST)
+        self.client.force_authenticate(User.objects.create_user('importacao', is_seller=True))
+
+    def importar(self, linhas, formato='csv', **kwargs):
+        return importacao.importar([linha.encode() for linha in linhas], formato, **kwargs)
+
+    def test_categorias_existentes_nao_sao_contadas(self):
+        resumo = self.importar([self.cabecalho,
+                                'A1,Refrigerante,bebidas,1.00,2.00,10\n',
+                                'A2,Detergente,Limpeza,1.00,3.00,0\n',
+                                'A3,Sabao,limpeza,2.00,4.00,5\n',
+                                'A4,Queijo,Frios,5.00,9.00,2\n',
+                                'A5,Sem preco,Frios,,9.00,2\n'], tamanho_lote=2)
+        self.assertEqual(resumo['criados'], 4)
+        self.assertEqual(resumo['categorias_criadas'], 2)
+        self.assertEqual(resumo['invalidos'], 1)
+        self.assertEqual(resumo['erros'][0]['linha'], 6)
+        self.assertIn('preco_compra', resumo['erros'][0]['erros'])
+        self.assertEqual(sorted(Categoria.objects.values_list('nome', flat=True)), ['BEBIDAS', 'FRIOS', 'LIMPEZA'])
+
+        detergente = Produto.objects.get(codigo='A2')
+        self.assertEqual((detergente.nome, detergente.categoria.nome, detergente.disponivel),
+                         ('DETERGENTE', 'LIMPEZA', False))
+        self.assertEqual(Produto.objects.get(codigo='A1').categoria, self.bebidas)
+
+    def test_reimportacao(self):
+        linhas = [self.cabecalho, 'A1,Refrigerante,Bebidas,1.00,2.00,10\n', 'A2,Suco,Sucos,1.00,3.00,5\n']
+        self.importar(linhas)
+        resumo = self.importar(linhas[:2] + ['A2,Suco,Sucos,1.00,3.50,5\n'])
+        self.assertEqual((resumo['criados'], resumo['atualizados'], resumo['inalterados'],
+                          resumo['categorias_criadas']), (0, 1, 1, 0))
+        self.assertEqual(Produto.objects.get(codigo='A2').preco_venda, Decimal('3.50'))
+
+    def test_categoria_criada_por_outra_importacao(self):
+        # Outra importação cria a categoria depois da consulta das existentes, que não a encontra, e antes do INSERT
+        Categoria.objects.create(nome='Frios')
+        filtrar = Categoria.objects.filter
+        consultas = []
+
+        def antes_da_concorrente(*args, **kwargs):
+            consultas.append(kwargs)
+            return Categoria.objects.none() if len(consultas) == 1 else filtrar(*args, **kwargs)
+
+        with mock.patch.object(Categoria.objects, 'filter', antes_da_concorrente):
+            resumo = self.importar([self.cabecalho, 'A1,Queijo,Frios,5.00,9.00,2\n',
+                                    'A2,Detergente,Limpeza,1.00,3.00,1\n'])
+        self.assertEqual(resumo['criados'], 2)
+        self.assertEqual(resumo['categorias_criadas'], 1)
+        self.assertEqual(Produto.objects.get(codigo='A1').categoria.nome, 'FRIOS')
+
+    def test_ndjson_pela_api(self):
+        corpo = '\n'.join(json.dumps(linha) for linha in (
+            {'codigo': 'N1', 'nome': 'Agua', 'categoria': 'Bebidas', 'preco_compra': '0.50', 'preco_venda': '1.00',
+             'quantidade': 3},
+            ['não', 'é', 'um', 'objeto'])) + '\nnão é json\n'
+        response = self.client.post(reverse('produto-importar'), corpo, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['criados'], response.data['invalidos'], response.data['categorias_criadas']),
+                         (1, 2, 0))
+        self.assertEqual([erro['linha'] for erro in response.data['erros']], [2, 3])
+
+        response = self.client.post(reverse('produto-importar'), corpo, content_type='application/xml')
+        self.assertEqual(response.status_code, 415)
+
+
+@override_settings(LIMITES=SEM_LIMITES, METRICAS=SEM_METRICAS)
+class ReajusteTest(TestCase):
+    def setUp(self):
+        self.bebidas = Categoria.objects.create(nome='Bebidas')
+        limpeza = Categoria.objects.create(nome='Limpeza')
+        self.produtos = [Produto.objects.create(nome='produto %d' % posicao, preco_compra=Decimal('1.00'),
+                                                preco_venda=Decimal(preco), quantidade=1,
+                                                categoria=self.bebidas if posicao < 4 else limpeza)
+                         for posicao, preco in enumerate(['10.00', '0.05', '3.33', '1.99', '7.00'])]
+        Produto.objects.update(versao=1)
+        self.client = APIClient(SERVER_NAME=HOST)
+        self.client.force_authenticate(User.objects.create_user('reajuste', is_seller=True))
+
+    def precos(self, campo='preco_venda'):
+        return list(Produto.objects.order_by('id').values_list(campo, flat=True))
+
+    def test_percentual_em_lotes(self):
+        alterados = importacao.reajustar(Produto.objects.filter(categoria=self.bebidas), percentual=Decimal('10'),
+                                         tamanho_lote=3)
+        self.assertEqual(alterados, 4)
+        self.assertEqual(self.precos(), [Decimal('11.00'), Decimal('0.06'), Decimal('3.66'), Decimal('2.19'),
+                                         Decimal('7.00')])
+        # Os produtos reajustados voltam para a sincronização dos terminais
+        self.assertEqual(list(Produto.objects.order_by('id').values_list('versao', flat=True)),
+                         [None, None, None, None, 1])
+
+    def test_valor_negativo_nao_passa_do_minimo(self):
+        importacao.reajustar(Produto.objects.all(), campo='preco_compra', valor=Decimal('-0.995'))
+        self.assertEqual(set(self.precos('preco_compra')), {Decimal('0.01')})
+        importacao.reajustar(Produto.objects.all(), percentual=Decimal('-99.99'))
+        self.assertEqual(set(self.precos()), {Decimal('0.01')})
+
+    def test_pela_api(self):
+        url = reverse('produto-reajuste') + '?categoria=%d' % self.bebidas.id
+        response = self.client.post(url, {'valor': '-1.00'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'produtos': 4})
+        self.assertEqual(self.precos(), [Decimal('9.00'), Decimal('0.01'), Decimal('2.33'), Decimal('0.99'),
+                                         Decimal('7.00')])
+
+        self.assertEqual(self.client.post(url, {'valor': '1', 'percentual': '1'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'campo': 'quantidade', 'valor': '1'}, format='json').status_code,
+                         400)
+
+
+class BuscaTest(TestCase):
+    """
+    A busca roda pelo índice invertido no SQLite e pela busca textual e pelos trigramas das migrações 0002 e 0003
+    no PostgreSQL
+    """
+
+    def setUp(self):
+        bebidas = Categoria.objects.create(nome='Bebidas')
+        mercearia = Categoria.objects.create(nome='Mercearia')
+        self.refrigerante = Produto.objects.create(nome='Refrigerante de laranja', preco_compra=1, preco_venda=2,
+                                                   quantidade=10, categoria=bebidas)
+        self.suco = Produto.objects.create(nome='Suco de laranja', preco_compra=1, preco_venda=2, quantidade=10,
+                                           categoria=bebidas)
+        self.acucar = Produto.objects.create(nome='Açúcar cristal', preco_compra=1, preco_venda=2, quantidade=10,
+                                             categoria=mercearia)
+
+    def buscar(self, texto):
+        return [produto.id for produto in busca.buscar(texto, 10)]
+
+    def test_palavras_acentos_e_categoria(self):
+        self.assertEqual(self.buscar('açucar'), [self.acucar.id])
+        self.assertEqual(self.buscar('laranja refri'), [self.refrigerante.id])
+        self.assertEqual(sorted(self.buscar('bebidas laranja')), sorted([self.refrigerante.id, self.suco.id]))
+        self.assertEqual(self.buscar('cafe'), [])
+
+    def test_erro_de_digitacao(self):
+        self.assertEqual(self.buscar('refrigerabte'), [self.refrigerante.id])
+
+    def test_migracao_indexa_como_a_busca(self):
+        migracao = import_module('api.migrations.0003_busca')
+        with mock.patch.object(busca, 'nativa', return_value=False):
+            busca.reindexar()
+        esperado = sorted(TermoProduto.objects.values_list('produto', 'campo', 'termo'))
+
+        TermoProduto.objects.all().delete()
+        Termo.objects.all().delete()
+        migracao.indexar(django_apps)
+        self.assertEqual(sorted(TermoProduto.objects.values_list('produto', 'campo', 'termo')), esperado)
+
+
+@override_settings(LIMITES=SEM_LIMITES)
+class SincronizacaoTest(TestCase):
+    """
+    A sincronização só lê o banco, mesmo com linhas pendentes; elas são numeradas pelo comando numerar_sincronizacao
+    """
+
+    def sincronizar(self, desde, **parametros):
+        with CaptureQueriesContext(connection) as consultas:
+            response = APIClient(SERVER_NAME=HOST).get(reverse('sincronizacao'), {'since': desde, **parametros})
+        self.assertEqual(response.status_code, 200)
+        gravacoes = [consulta['sql'] for consulta in consultas
+                     if consulta['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE') or 'FOR UPDATE' in consulta['sql']]
+        self.assertEqual(gravacoes, [])
+        return response.data
+
+    def test_numeracao_fora_da_sincronizacao(self):
+        categoria = Categoria.objects.create(nome='Bebidas')
+        self.assertEqual(self.sincronizar(0)['categorias'], [])
+
+        call_command('numerar_sincronizacao', stdout=StringIO())
+        resposta = self.sincronizar(0)
+        self.assertEqual([item['id'] for item in resposta['categorias']], [categoria.id])
+
+        categoria.nome = 'Sucos'
+        categoria.save()
+        self.assertEqual(self.sincronizar(resposta['versao'])['categorias'], [])
+        call_command('numerar_sincronizacao', stdout=StringIO())
+        self.assertEqual([item['nome'] for item in self.sincronizar(resposta['versao'])['categorias']], ['SUCOS'])
+
+    def test_remocoes_antigas_exigem_sincronizacao_completa(self):
+        bebidas, sucos, doces = (Categoria.objects.create(nome=nome) for nome in ('Bebidas', 'Sucos', 'Doces'))
+        call_command('numerar_sincronizacao', stdout=StringIO())
+        desatualizado = self.sincronizar(0)['versao']
+        id_bebidas, id_sucos = bebidas.id, sucos.id
+
+        bebidas.delete()
+        call_command('numerar_sincronizacao', stdout=StringIO())
+        atualizado = self.sincronizar(desatualizado)
+        self.assertFalse(atualizado['completa'])
+        self.assertEqual(atualizado['removidos'], [{'modelo': 'categoria', 'id': id_bebidas}])
+
+        sucos.delete()
+        Remocao.objects.filter(objeto_id=id_bebidas).update(
+            data_remocao=timezone.now() - timedelta(days=settings.RETENCAO_REMOCOES + 1))
+        call_command('numerar_sincronizacao', stdout=StringIO())
+        self.assertEqual(list(Remocao.objects.values_list('objeto_id', flat=True)), [id_sucos])
+
+        # Quem já recebeu a remoção descartada continua recebendo só as alterações
+        resposta = self.sincronizar(atualizado['versao'])
+        self.assertFalse(resposta['completa'])
+        self.assertEqual(resposta['removidos'], [{'modelo': 'categoria', 'id': id_sucos}])
+
+        # Quem não recebeu recomeça da versão 0, paginando com completa até o fim
+        resposta = self.sincronizar(desatualizado, limite=1)
+        self.assertTrue(resposta['completa'])
+        self.assertTrue(resposta['mais'])
+        recebidas = [item['id'] for item in resposta['categorias']]
+        while resposta['mais']:
+            resposta = self.sincronizar(resposta['versao'], limite=1, completa='true')
+            self.assertTrue(resposta['completa'])
+            recebidas += [item['id'] for item in resposta['categorias']]
+        self.assertEqual(recebidas, [doces.id])
+        self.assertEqual(resposta['versao'], ContadorVersao.objects.get(id=1).versao)
+        self.assertFalse(self.sincronizar(resposta['versao'])['completa'])
+
+
+class ConsolidacaoTest(TestCase):
+    def test_mais_de_mil_produtos_no_mesmo_lote(self):
+        categoria = Categoria.objects.create(nome='Consolidacao')
+        Produto.objects.bulk_create([Produto(nome='CONSOLIDACAO %d' % i, preco_compra=1, preco_venda=2, quantidade=1,
+                                             disponivel=True, categoria=categoria) for i in range(1200)])
+        hoje = timezone.localdate()
+        ids = list(Produto.objects.filter(categoria=categoria).values_list('id', flat=True))
+        EstatisticaPendente.objects.bulk_create([EstatisticaPendente(produto_id=produto_id, data=hoje, unidades=2,
+                                                                     receita=4, margem=2)
+                                                 for produto_id in ids], batch_size=500)
+
+        self.assertEqual(estatisticas.consolidar(lote=5000), 1200)
+        self.assertFalse(EstatisticaPendente.objects.exists())
+        self.assertEqual(EstatisticaProduto.objects.filter(produto__in=ids, unidades=2, receita=4).count(), 1200)
+        self.assertEqual(EstatisticaProdutoDiaria.objects.filter(produto__in=ids, data=hoje, unidades=2).count(), 1200)
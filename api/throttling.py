@@ -0,0 +1,216 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+# Posição de uma chave na tabela compartilhada: impressão digital de 8 bytes da chave e o instante teórico de
+# chegada (TAT) da próxima requisição
+POSICAO = struct.Struct('<Qd')
+# Posições consultadas a partir da posição inicial de uma chave antes de reaproveitar a mais antiga
+SONDAGENS = 8
+
+backends = {}
+backends_lock = threading.Lock()
+
+
+def consumir_gcra(tat, agora, quantidade, periodo):
+    """
+    Token bucket na forma do GCRA: todo o estado de uma chave é o instante em que o balde volta a estar cheio.
+    Permite rajadas de até 'quantidade' requisições e repõe uma a cada periodo / quantidade segundos. Devolve
+    (permitida, novo tat, espera em segundos)
+    """
+    intervalo = periodo / quantidade
+    tat = max(tat or 0.0, agora)
+    espera = tat + intervalo - agora - periodo
+    if espera > 0:
+        return False, tat, espera
+    return True, tat + intervalo, 0.0
+
+
+def impressao_digital(chave):
+    # Nunca zero, que marca as posições livres
+    return int.from_bytes(hashlib.blake2b(chave.encode(), digest_size=8).digest(), 'little') or 1
+
+
+def mapear(arquivo, tamanho):
+    """
+    Abre o arquivo da tabela compartilhada, zerando-o se o tamanho não for o esperado, e o mapeia na memória.
+    Devolve o descritor, usado no flock, e o mapa. Deve ser chamada em cada processo, já que o flock de um
+    descritor herdado no fork seria compartilhado com o pai
+    """
+    descritor = os.open(arquivo, os.O_RDWR | os.O_CREAT, 0o600)
+    fcntl.flock(descritor, fcntl.LOCK_EX)
+    try:
+        if os.fstat(descritor).st_size != tamanho:
+            os.ftruncate(descritor, 0)
+            os.ftruncate(descritor, tamanho)
+    finally:
+        fcntl.flock(descritor, fcntl.LOCK_UN)
+    return descritor, mmap.mmap(descritor, tamanho)
+
+
+class MemoriaLocal:
+    """
+    Estado na memória do processo, válido apenas com um único worker
+    """
+
+    def __init__(self, opcoes):
+        self.estados = {}
+        self.lock = threading.Lock()
+        self.maximo = opcoes['chaves']
+
+    def consumir(self, chave, quantidade, periodo):
+        agora = time.time()
+        with self.lock:
+            permitida, tat, espera = consumir_gcra(self.estados.get(chave), agora, quantidade, periodo)
+            if permitida:
+                if len(self.estados) >= self.maximo and chave not in self.estados:
+                    self.estados = {k: v for k, v in self.estados.items() if v > agora}
+                self.estados[chave] = tat
+        return permitida, espera
+
+
+class MemoriaCompartilhada:
+    """
+    Tabela de tamanho fixo em um arquivo mapeado na memória por todos os workers da máquina, protegida por flock.
+    Cada chave ocupa uma posição, encontrada pela sua impressão digital com sondagem linear; sem posição livre ou
+    expirada, a de menor TAT é reaproveitada, o que no pior caso devolve uma chave antiga ao balde cheio
+    """
+
+    def __init__(self, opcoes):
+        self.arquivo = opcoes['local']
+        self.posicoes = opcoes['chaves']
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def abrir(self):
+        self.descritor, self.mapa = mapear(self.arquivo, self.posicoes * POSICAO.size)
+        self.pid = os.getpid()
+
+    def consumir(self, chave, quantidade, periodo):
+        digital = impressao_digital(chave)
+        inicio = digital % self.posicoes
+        with self.lock:
+            if self.pid != os.getpid():
+                self.abrir()
+            fcntl.flock(self.descritor, fcntl.LOCK_EX)
+            try:
+                agora = time.time()
+                escolhida, tat, menor = None, None, None
+                for sondagem in range(SONDAGENS):
+                    posicao = (inicio + sondagem) % self.posicoes * POSICAO.size
+                    atual, tat_atual = POSICAO.unpack_from(self.mapa, posicao)
+                    if atual == digital:
+                        escolhida, tat = posicao, tat_atual
+                        break
+                    if menor is None or tat_atual < menor:
+                        escolhida, menor = posicao, tat_atual
+
+                permitida, tat, espera = consumir_gcra(tat, agora, quantidade, periodo)
+                if permitida:
+                    POSICAO.pack_into(self.mapa, escolhida, digital, tat)
+            finally:
+                fcntl.flock(self.descritor, fcntl.LOCK_UN)
+        return permitida, espera
+
+
+class Redis:
+    """
+    Estado em um Redis, ou servidor compatível, compartilhado por todas as máquinas. Cada chave guarda o TAT e
+    expira junto com ele; a regra roda em um script Lua para ser atômica. Requer o pacote redis
+    """
+    SCRIPT = """
+        local agora = tonumber(ARGV[1])
+        local intervalo = tonumber(ARGV[2])
+        local periodo = tonumber(ARGV[3])
+        local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or 0), agora)
+        local espera = tat + intervalo - agora - periodo
+        if espera > 0 then
+            return {0, tostring(espera)}
+        end
+        redis.call('SET', KEYS[1], tostring(tat + intervalo), 'PX', math.ceil((tat + intervalo - agora) * 1000))
+        return {1, '0'}
+    """
+
+    def __init__(self, opcoes):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('O backend de limites redis requer o pacote redis')
+        self.script = redis.Redis.from_url(opcoes['local']).register_script(self.SCRIPT)
+
+    def consumir(self, chave, quantidade, periodo):
+        # O horário vem do worker, então as máquinas que compartilham o Redis devem estar com os relógios sincronizados
+        permitida, espera = self.script(keys=['limite:%s' % chave], args=[time.time(), periodo / quantidade, periodo])
+        return bool(permitida), float(espera)
+
+
+BACKENDS = {
+    'memoria': MemoriaLocal,
+    'compartilhado': MemoriaCompartilhada,
+    'redis': Redis,
+}
+
+
+def backend():
+    opcoes = settings.LIMITES
+    chave = (opcoes['backend'], opcoes['local'], opcoes['chaves'])
+    atual = backends.get(chave)
+    if atual is None:
+        with backends_lock:
+            atual = backends.get(chave)
+            if atual is None:
+                if opcoes['backend'] not in BACKENDS:
+                    raise ImproperlyConfigured('Backend de limites desconhecido: %s' % opcoes['backend'])
+                atual = backends[chave] = BACKENDS[opcoes['backend']](opcoes)
+    return atual
+
+
+class LimitePorEscopo(SimpleRateThrottle):
+    """
+    Limita as requisições por usuário, ou por IP para os anônimos, com a taxa do escopo que a view define para o
+    método em escopos_limite, como {'GET': 'catalogo'}. Os anônimos usam a taxa do escopo com o sufixo _anon,
+    como 'catalogo_anon', ou, sem ela, a taxa 'anon', nunca a dos autenticados. Sem escopo, vale a taxa 'user' ou
+    'anon' de DEFAULT_THROTTLE_RATES. Cada par escopo e usuário tem o seu próprio balde
+    """
+
+    def __init__(self):
+        self.espera = None
+
+    def allow_request(self, request, view):
+        if not settings.LIMITES['ativos']:
+            return True
+
+        escopo = self.escopo(request, view)
+        taxa = api_settings.DEFAULT_THROTTLE_RATES.get(escopo)
+        if taxa is None:
+            return True
+
+        quantidade, periodo = self.parse_rate(taxa)
+        ident = self.get_ident(request) if request.user.is_anonymous else 'u%s' % request.user.pk
+        permitida, self.espera = backend().consumir('%s:%s' % (escopo, ident), quantidade, periodo)
+        return permitida
+
+    @staticmethod
+    def escopo(request, view):
+        """
+        Escopo cuja taxa vale para a requisição
+        """
+        taxas = api_settings.DEFAULT_THROTTLE_RATES
+        escopo = getattr(view, 'escopos_limite', {}).get(request.method)
+        if not request.user.is_anonymous:
+            return escopo or 'user'
+        if escopo is not None and '%s_anon' % escopo in taxas:
+            return '%s_anon' % escopo
+        return 'anon'
+
+    def wait(self):
+        return self.espera
@@ -4,9 +4,11 @@ from rest_framework import permissions
 from .views import (CategoriaList, CategoriaDetail,
                     UserList, UserDetail,
                     PagamentoList, PagamentoDetail,
-                    ProdutoList, ProdutoDetail,
-                    VendaList, VendaDetail,
-                    api_root, ProdutoMaisVendido, PagamentoMaisUtilizado)
+                    ProdutoList, ProdutoDetail, ProdutoBusca, Autocompletar,
+                    ProdutoImportar, ProdutoReajuste,
+                    VendaList, VendaDetail, VendaLote, VendaExportar,
+                    api_root, ProdutoMaisVendido, PagamentoMaisUtilizado,
+                    ProdutosMaisVendidos, PagamentosMaisUtilizados, SerieVendas, Sincronizacao, saude_banco)
 
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -42,13 +44,25 @@ urlpatterns = [
 
     path('produto/', ProdutoList.as_view(), name='produto'),
     path('produto/<int:pk>', ProdutoDetail.as_view(), name='produto-detail'),
+    path('produto/search', ProdutoBusca.as_view(), name='produto-busca'),
+    path('produto/import', ProdutoImportar.as_view(), name='produto-importar'),
+    path('produto/reprice', ProdutoReajuste.as_view(), name='produto-reajuste'),
+    path('autocomplete', Autocompletar.as_view(), name='autocompletar'),
+    path('sync', Sincronizacao.as_view(), name='sincronizacao'),
 
     path('venda/', VendaList.as_view(), name='venda'),
     path('venda/<int:pk>', VendaDetail.as_view(), name='venda-detail'),
+    path('venda/batch/', VendaLote.as_view(), name='venda-lote'),
+    path('venda/export/', VendaExportar.as_view(), name='venda-exportar'),
 
     path('users/', UserList.as_view(), name='user'),
     path('users/<int:pk>', UserDetail.as_view(), name='user-detail'),
 
     path('stats/produto-mais-vendido', ProdutoMaisVendido.as_view(), name='produto-mais-vendido'),
-    path('stats/pagamento-mais-utilizado', PagamentoMaisUtilizado.as_view(), name='pagamento-mais-utilizado')
+    path('stats/pagamento-mais-utilizado', PagamentoMaisUtilizado.as_view(), name='pagamento-mais-utilizado'),
+    path('stats/produtos-mais-vendidos', ProdutosMaisVendidos.as_view(), name='produtos-mais-vendidos'),
+    path('stats/pagamentos-mais-utilizados', PagamentosMaisUtilizados.as_view(), name='pagamentos-mais-utilizados'),
+    path('stats/series', SerieVendas.as_view(), name='serie-vendas'),
+
+    path('saude/banco', saude_banco, name='saude-banco'),
 ]
@@ -0,0 +1,160 @@
+import fcntl
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .throttling import SONDAGENS, impressao_digital, mapear
+
+# Posição de uma chave na tabela compartilhada: impressão digital de 8 bytes da chave, a versão e o instante em
+# que ela foi escrita
+POSICAO = struct.Struct('<Qqd')
+
+backends = {}
+backends_lock = threading.Lock()
+
+
+def inicial():
+    """
+    Versão de uma chave que ainda não tem versão, ou que foi descartada. Começa pelo horário atual, para ficar
+    acima de qualquer versão que a chave já teve
+    """
+    return int(time.time() * 1000)
+
+
+class MemoriaLocal:
+    """
+    Versões na memória do processo, válidas apenas com um único worker
+    """
+
+    def __init__(self, opcoes):
+        self.versoes = OrderedDict()
+        self.lock = threading.Lock()
+        self.maximo = opcoes['chaves']
+
+    def obter(self, chave):
+        return self.versoes.get(chave)
+
+    def incrementar(self, chave):
+        with self.lock:
+            versao = self.versoes.pop(chave, None)
+            versao = inicial() if versao is None else versao + 1
+            self.versoes[chave] = versao
+            while len(self.versoes) > self.maximo:
+                self.versoes.popitem(last=False)
+        return versao
+
+
+class MemoriaCompartilhada:
+    """
+    Tabela de tamanho fixo em um arquivo mapeado na memória por todos os workers da máquina, protegida por flock,
+    organizada como a tabela dos limites de requisições. Sem posição livre, a chave escrita há mais tempo é
+    descartada, e quem guardou a versão dela passa a ver a chave sem versão, o que também conta como mudança
+    """
+
+    def __init__(self, opcoes):
+        self.arquivo = opcoes['local']
+        self.posicoes = opcoes['chaves']
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def abrir(self):
+        self.descritor, self.mapa = mapear(self.arquivo, self.posicoes * POSICAO.size)
+        self.pid = os.getpid()
+
+    def obter(self, chave):
+        digital = impressao_digital(chave)
+        with self.lock:
+            if self.pid != os.getpid():
+                self.abrir()
+            fcntl.flock(self.descritor, fcntl.LOCK_SH)
+            try:
+                return self.procurar(digital)[1]
+            finally:
+                fcntl.flock(self.descritor, fcntl.LOCK_UN)
+
+    def incrementar(self, chave):
+        digital = impressao_digital(chave)
+        with self.lock:
+            if self.pid != os.getpid():
+                self.abrir()
+            fcntl.flock(self.descritor, fcntl.LOCK_EX)
+            try:
+                posicao, versao = self.procurar(digital)
+                versao = inicial() if versao is None else versao + 1
+                POSICAO.pack_into(self.mapa, posicao, digital, versao, time.time())
+            finally:
+                fcntl.flock(self.descritor, fcntl.LOCK_UN)
+        return versao
+
+    def procurar(self, digital):
+        """
+        Posição e versão da chave, ou, se ela não estiver na tabela, a posição livre ou escrita há mais tempo e None
+        """
+        inicio = digital % self.posicoes
+        escolhida, menor = None, None
+        for sondagem in range(SONDAGENS):
+            posicao = (inicio + sondagem) % self.posicoes * POSICAO.size
+            atual, versao, escrita = POSICAO.unpack_from(self.mapa, posicao)
+            if atual == digital:
+                return posicao, versao
+            if menor is None or escrita < menor:
+                escolhida, menor = posicao, escrita
+        return escolhida, None
+
+
+class Redis:
+    """
+    Versões em um Redis, ou servidor compatível, compartilhadas por todas as máquinas. Requer o pacote redis
+    """
+    SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 0 then
+            redis.call('SET', KEYS[1], ARGV[1])
+            return tonumber(ARGV[1])
+        end
+        return redis.call('INCR', KEYS[1])
+    """
+
+    def __init__(self, opcoes):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('O backend de versões redis requer o pacote redis')
+        self.cliente = redis.Redis.from_url(opcoes['local'])
+        self.script = self.cliente.register_script(self.SCRIPT)
+
+    def obter(self, chave):
+        versao = self.cliente.get('versao:%s' % chave)
+        return None if versao is None else int(versao)
+
+    def incrementar(self, chave):
+        return int(self.script(keys=['versao:%s' % chave], args=[inicial()]))
+
+
+BACKENDS = {
+    'memoria': MemoriaLocal,
+    'compartilhado': MemoriaCompartilhada,
+    'redis': Redis,
+}
+
+
+def backend():
+    """
+    Versões compartilhadas pelos workers, usadas para que cada processo perceba na hora as alterações feitas pelos
+    outros. obter devolve a versão atual de uma chave, ou None se ela não tem versão, e incrementar gera uma nova
+    """
+    opcoes = settings.VERSOES
+    chave = (opcoes['backend'], opcoes['local'], opcoes['chaves'])
+    atual = backends.get(chave)
+    if atual is None:
+        with backends_lock:
+            atual = backends.get(chave)
+            if atual is None:
+                if opcoes['backend'] not in BACKENDS:
+                    raise ImproperlyConfigured('Backend de versões desconhecido: %s' % opcoes['backend'])
+                atual = backends[chave] = BACKENDS[opcoes['backend']](opcoes)
+    return atual
@@ -1,37 +1,67 @@
-from django.http import Http404
+import hmac
+import time
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import mixins
-from rest_framework.decorators import api_view
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import UnsupportedMediaType, ValidationError
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from rest_framework_simplejwt.serializers import (TokenObtainPairSerializer,
-                                                  TokenVerifySerializer,
-                                                  TokenRefreshSerializer)
-from django.db.models import Q, Count
+from rest_framework.views import APIView
+from rest_framework_simplejwt.serializers import TokenVerifySerializer
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import autocompletar, busca, estatisticas, metricas, sincronizacao
+from .backends import pool
 from .models import (Categoria,
+                     EstatisticaPagamento,
+                     EstatisticaPagamentoDiaria,
+                     EstatisticaProduto,
+                     EstatisticaProdutoDiaria,
+                     ResumoVendaDiario,
                      User,
                      Pagamento,
                      Produto,
                      Venda,
-                     ProdutoVenda,
                      )
 from .serializers import (CategoriaSerializer,
+                          ObterTokenSerializer,
+                          RenovarTokenSerializer,
                           UserSerializer,
                           PagamentoSerializer,
                           ProdutoSerializer,
+                          ReajusteSerializer,
                           VendaSerializer,
+                          VendaLoteSerializer,
                           ProdutoMaisVendidoSerializer,
                           PagamentoMaisUtilizadoSerializer,
+                          EstatisticaProdutoSerializer,
+                          EstatisticaPagamentoSerializer,
+                          SerieVendaSerializer,
                           )
+from .cache_catalogo import CacheCatalogoMixin
+from .campos import CamposViewMixin
+from .exportacao import iterar_vendas, exportar_csv, exportar_ndjson
+from .importacao import TIPOS_IMPORTACAO, importar, reajustar
+from .lote import registrar_lote
+from .replicas import LeituraReplicaMixin
+from .resumos import periodo_padrao
 from .permissions import (IsSellerOrReadOnly,
                           IsSeller,
                           IsSellerOrClient)
 
 from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import IsAdminUser
 from rest_framework_simplejwt.views import TokenViewBase
 from rest_framework.generics import (ListCreateAPIView,
                                      ListAPIView,
                                      RetrieveUpdateDestroyAPIView,
+                                     RetrieveDestroyAPIView,
                                      RetrieveAPIView, GenericAPIView, )
 
 
@@ -41,14 +71,14 @@ class ObterJWTToken(TokenViewBase):
     O acessToken serve para realizar as requisições que necessitem de autenticação
     O refreshToken serve para gerar um novo acessToken quando este for expirado
     """
-    serializer_class = TokenObtainPairSerializer
+    serializer_class = ObterTokenSerializer
 
 
 class RefreshJWTToken(TokenViewBase):
     """
     Gera um novo acessToken com base no refreshToken
     """
-    serializer_class = TokenRefreshSerializer
+    serializer_class = RenovarTokenSerializer
 
 
 class VerificarToken(TokenViewBase):
@@ -69,7 +99,44 @@ def api_root(request, format=None):
     })
 
 
-class UserList(ListAPIView):
+@api_view(['GET'])
+@permission_classes((IsAdminUser, ))
+def saude_banco(request, format=None):
+    """
+    Confere a conexão com cada banco e informa as métricas dos pools de conexões do processo que atendeu a
+    requisição: conexões abertas, em uso, livres, em transbordo e o tempo de espera por uma conexão
+    """
+    pools = pool.metricas()
+    bancos = {}
+    for alias in connections:
+        inicio = time.perf_counter()
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            bancos[alias] = {'disponivel': True, 'latencia': round(time.perf_counter() - inicio, 6)}
+        except DatabaseError as erro:
+            bancos[alias] = {'disponivel': False, 'erro': str(erro)}
+        bancos[alias]['pool'] = pools.get(alias)
+
+    disponivel = all(banco['disponivel'] for banco in bancos.values())
+    return Response(bancos, status=status.HTTP_200_OK if disponivel else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+def exportar_metricas(request):
+    """
+    Métricas de desempenho por rota do processo que atendeu a requisição, no formato de texto do Prometheus. Fica
+    fora do DRF para não passar pela autenticação e pelo throttling, e exige o token de METRICAS. Sem token
+    configurado a rota não existe, para que as métricas nunca fiquem públicas
+    """
+    token = settings.METRICAS['token']
+    if not token:
+        raise Http404
+    if not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), 'Bearer %s' % token):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(metricas.registro.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class UserList(LeituraReplicaMixin, CamposViewMixin, ListAPIView):
     """
     Lista todos os usuários no sistema, apenas vendedores podem utilizar isso
     """
@@ -78,7 +145,7 @@ class UserList(ListAPIView):
     permission_classes = (IsSeller, )
 
 
-class UserDetail(RetrieveAPIView):
+class UserDetail(CamposViewMixin, RetrieveAPIView):
     """
     Detalhes do usuário
     """
@@ -87,7 +154,7 @@ class UserDetail(RetrieveAPIView):
     permission_classes = (IsSeller, )
 
 
-class CategoriaList(ListCreateAPIView):
+class CategoriaList(CacheCatalogoMixin, CamposViewMixin, ListCreateAPIView):
     """
     Lista todas as categorias existentes.\n
     Pode ser filtrada por nome, sendo ele exato, ou nomes que contenham a palavra a ser procurar\n
@@ -96,6 +163,8 @@ class CategoriaList(ListCreateAPIView):
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
     permission_classes = (IsSellerOrReadOnly, )
+    escopos_limite = {'GET': 'catalogo'}
+    modelos_cache = ('categoria', )
 
     filter_backends = (DjangoFilterBackend, OrderingFilter,)
 
@@ -103,16 +172,17 @@ class CategoriaList(ListCreateAPIView):
     ordering_fields = ('id', 'nome',)
 
 
-class CategoriaDetail(RetrieveUpdateDestroyAPIView):
+class CategoriaDetail(CamposViewMixin, RetrieveUpdateDestroyAPIView):
     """
     Detalhes da categoria
     """
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
     permission_classes = (IsSellerOrReadOnly, )
+    escopos_limite = {'GET': 'catalogo'}
 
 
-class PagamentoList(ListCreateAPIView):
+class PagamentoList(CacheCatalogoMixin, CamposViewMixin, ListCreateAPIView):
     """
     Lista todos os pagamentos existentes.\n
     Pode ser filtrada por nome, sendo ele exato, ou nomes que contenham a palavra a ser procurar\n
@@ -122,6 +192,8 @@ class PagamentoList(ListCreateAPIView):
     queryset = Pagamento.objects.all()
     serializer_class = PagamentoSerializer
     permission_classes = (IsSellerOrReadOnly, )
+    escopos_limite = {'GET': 'catalogo'}
+    modelos_cache = ('pagamento', )
 
     filter_backends = (DjangoFilterBackend, OrderingFilter,)
 
@@ -129,27 +201,32 @@ class PagamentoList(ListCreateAPIView):
     ordering_fields = ('id', 'nome', 'juros',)
 
 
-class PagamentoDetail(RetrieveUpdateDestroyAPIView):
+class PagamentoDetail(CamposViewMixin, RetrieveUpdateDestroyAPIView):
     """
     Detalhes do pagamento
     """
     queryset = Pagamento.objects.all()
     serializer_class = PagamentoSerializer
     permission_classes = (IsSellerOrReadOnly, )
+    escopos_limite = {'GET': 'catalogo'}
 
 
-class ProdutoList(ListCreateAPIView):
+class ProdutoList(CacheCatalogoMixin, CamposViewMixin, ListCreateAPIView):
     """
     Lista todos os produtos existentes.\n
     Pode ser filtrada por nome, sendo ele exato, ou nomes que contenham a palavra a ser procurar\n
     Pode ser filtrada por preco_compra, sendo ele exato, maior, maior ou igual, menor ou menor ou igual\n
     Pode ser filtrada por preco_venda, sendo ele exato, maior, maior ou igual, menor ou menor ou igual\n
     Pode ser filtrada por disponivel, sendo ele true ou false\n
-    Pode ser ordenada por id, nome e juros\n
+    Pode ser ordenada por id, nome, preco_compra e preco_venda\n
+    Os campos retornados podem ser escolhidos com fields, separados por vírgula, e a categoria incluída no produto
+    com expand=categoria\n
     """
     queryset = Produto.objects.all()
     serializer_class = ProdutoSerializer
     permission_classes = (IsSellerOrReadOnly, )
+    escopos_limite = {'GET': 'catalogo'}
+    modelos_cache = ('produto', )
 
     filter_backends = (DjangoFilterBackend, OrderingFilter,)
 
@@ -158,37 +235,85 @@ class ProdutoList(ListCreateAPIView):
                         'preco_venda': ['exact', 'lt', 'gt', 'lte', 'gte'],
                         'disponivel': ['exact', ], }
 
-    ordering_fields = ('id', 'nome', 'juros',)
+    ordering_fields = ('id', 'nome', 'preco_compra', 'preco_venda',)
 
 
-class ProdutoDetail(RetrieveUpdateDestroyAPIView):
+class ProdutoDetail(CamposViewMixin, RetrieveUpdateDestroyAPIView):
     """
     Detalhes do produto
     """
     queryset = Produto.objects.all()
     serializer_class = ProdutoSerializer
     permission_classes = (IsSellerOrReadOnly, )
+    escopos_limite = {'GET': 'catalogo'}
 
 
-class VendaList(ListCreateAPIView):
+class ProdutoImportar(APIView):
+    """
+    Cria ou atualiza produtos em massa a partir de um catálogo em CSV, com cabeçalho, ou em NDJSON, um produto por
+    linha, escolhido pelo Content-Type text/csv ou application/x-ndjson. O corpo é lido aos poucos e gravado em
+    lotes, sem ser carregado inteiro na memória\n
+    Cada linha tem os campos codigo, nome, categoria, preco_compra, preco_venda e quantidade. O produto é
+    identificado pelo codigo, e a categoria pelo nome, sendo criada se ainda não existir\n
+    Retorna a quantidade de produtos criados, atualizados e inalterados, e os erros das linhas ignoradas\n
+    """
+    permission_classes = (IsSeller, )
+    escopos_limite = {'POST': 'importacao'}
+
+    def post(self, request, *args, **kwargs):
+        formato = TIPOS_IMPORTACAO.get(request.content_type.split(';')[0].strip().lower())
+        if formato is None:
+            raise UnsupportedMediaType(request.content_type)
+        return Response(importar(request.stream or (), formato))
+
+
+class ProdutoReajuste(GenericAPIView):
+    """
+    Reajusta o preço de venda, ou o de compra com campo igual a preco_compra, dos produtos filtrados, por um
+    percentual ou somando um valor, que podem ser negativos. O preço é arredondado para centavos e não fica
+    abaixo de 0,01\n
+    Aceita os mesmos filtros da listagem de produtos, além de categoria, pelo id, e categoria__nome\n
+    Retorna a quantidade de produtos reajustados\n
+    """
+    queryset = Produto.objects.all()
+    serializer_class = ReajusteSerializer
+    permission_classes = (IsSeller, )
+    escopos_limite = {'POST': 'importacao'}
+
+    filter_backends = (DjangoFilterBackend, )
+    filterset_fields = dict(ProdutoList.filterset_fields, categoria=['exact'], categoria__nome=['exact'])
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'produtos': reajustar(self.filter_queryset(self.get_queryset()),
+                                               **serializer.validated_data)})
+
+
+class VendaQuerysetMixin:
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_anonymous:
+            return Venda.objects.none()
+        return Venda.objects.filter(Q(vendedor=user) | Q(cliente=user)).prefetch_related('produtovenda_set')
+
+
+class VendaList(LeituraReplicaMixin, CamposViewMixin, VendaQuerysetMixin, ListCreateAPIView):
     """
     Lista todas as vendas existentes.\n
     Pode ser filtrada por pagamento\n
     Pode ser filtrada por valor_venda, sendo ele exato, maior, maior ou igual, menor ou menor ou igual\n
     Pode ser filtrada por data_venda, sendo ela exato, maior, maior ou igual, menor ou menor ou igual\n
     Pode ser ordenada por id, data_venda, valor_venda, vendedor e cliente\n
+    Os campos retornados podem ser escolhidos com fields, separados por vírgula, e os objetos relacionados incluídos
+    na venda com expand, aceitando produto, pagamento, cliente e vendedor\n
     """
     serializer_class = VendaSerializer
     permission_classes = (IsSellerOrClient, )
+    escopos_limite = {'POST': 'venda'}
 
     filter_backends = (DjangoFilterBackend, OrderingFilter,)
 
-    def get_queryset(self):
-        user = self.request.user
-        if user.is_anonymous:
-            return Venda.objects.none()
-        return Venda.objects.filter(Q(vendedor=user) | Q(cliente=user))
-
     filterset_fields = {'pagamento': ['exact'],
                         'valor_venda': ['exact', 'lt', 'gt', 'lte', 'gte'],
                         'data_venda': ['exact', 'lt', 'gt', 'lte', 'gte']}
@@ -196,46 +321,324 @@ class VendaList(ListCreateAPIView):
     ordering_fields = ('id', 'data_venda', 'valor_venda', 'vendedor', 'cliente')
 
 
-class VendaDetail(mixins.RetrieveModelMixin,
-                  mixins.DestroyModelMixin,
-                  GenericAPIView):
+class VendaDetail(CamposViewMixin, VendaQuerysetMixin, RetrieveDestroyAPIView):
     """
     Detalhes da venda
+
+    A exclusão da venda devolve os produtos ao estoque
     """
     serializer_class = VendaSerializer
+    permission_classes = (IsSellerOrClient, )
 
-    def get_queryset(self):
-        user = self.request.user
-        if user.is_anonymous:
-            return Venda.objects.none()
-        return Venda.objects.filter(Q(vendedor=user) | Q(cliente=user))
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        itens = list(instance.produtovenda_set.all())
+        quantidades = {}
+        for item in itens:
+            quantidades[item.produto_id] = quantidades.get(item.produto_id, 0) + item.quantidade
+
+        estatisticas.registrar_vendas([instance], itens, sinal=-1)
+        Produto.objects.repor_estoque(quantidades)
+        instance.delete()
 
+
+class VendaExportar(VendaQuerysetMixin, GenericAPIView):
+    """
+    Exporta todas as vendas visíveis ao usuário junto com seus produtos, em NDJSON (uma venda por linha) ou CSV
+    (um produto vendido por linha). A resposta é gerada sob demanda, sem carregar todas as vendas em memória.\n
+    O formato é escolhido pelo parâmetro formato, sendo ndjson ou csv\n
+    Aceita os mesmos filtros da listagem de vendas\n
+    """
+    serializer_class = VendaSerializer
     permission_classes = (IsSellerOrClient, )
 
+    filter_backends = (DjangoFilterBackend, )
+    filterset_fields = VendaList.filterset_fields
+
+    formatos = {
+        'ndjson': (exportar_ndjson, 'application/x-ndjson'),
+        'csv': (exportar_csv, 'text/csv'),
+    }
+
+    def get(self, request, *args, **kwargs):
+        formato = request.query_params.get('formato', 'ndjson')
+        if formato not in self.formatos:
+            raise ValidationError({'formato': ['Formato inválido, use %s' % ' ou '.join(self.formatos)]})
+
+        exportar, content_type = self.formatos[formato]
+        response = StreamingHttpResponse(exportar(iterar_vendas(self.filter_queryset(self.get_queryset()))),
+                                         content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="vendas.%s"' % formato
+        return response
+
+
+class VendaLote(GenericAPIView):
+    """
+    Registra várias vendas em uma única requisição, para terminais que acumulam vendas sem conexão.\n
+    Recebe uma lista de vendas, cada uma com uma chave única gerada pelo terminal, e retorna o resultado de cada uma
+    na mesma ordem. Vendas cuja chave já foi registrada não são gravadas novamente, então o lote pode ser reenviado
+    com segurança\n
+    """
+    serializer_class = VendaLoteSerializer
+    permission_classes = (IsSeller, )
+
+    tamanho_maximo = 500
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': ['Envie uma lista de vendas']})
+        if len(request.data) > self.tamanho_maximo:
+            raise ValidationError({'non_field_errors': ['O lote pode ter no máximo %d vendas' % self.tamanho_maximo]})
+
+        resultados = [None] * len(request.data)
+        validas = []
+        posicoes = []
+        for posicao, data in enumerate(request.data):
+            serializer = self.get_serializer(data=data)
+            if serializer.is_valid():
+                validas.append(serializer.validated_data)
+                posicoes.append(posicao)
+            else:
+                resultados[posicao] = {'chave': data.get('chave') if isinstance(data, dict) else None,
+                                       'status': status.HTTP_400_BAD_REQUEST,
+                                       'erros': serializer.errors}
 
-class ProdutoMaisVendido(RetrieveAPIView):
+        for posicao, resultado in zip(posicoes, registrar_lote(request.user, validas)):
+            if 'venda' in resultado:
+                resultado['venda'] = reverse('venda-detail', args=[resultado['venda']], request=request)
+            resultados[posicao] = resultado
+
+        return Response(resultados)
+
+
+class EstatisticaMixin:
+    limite_padrao = 10
+    limite_maximo = 100
+
+    def get_limite(self):
+        try:
+            limite = int(self.request.query_params.get('limite', self.limite_padrao))
+        except ValueError:
+            raise ValidationError({'limite': ['Informe um número inteiro']})
+
+        if not 1 <= limite <= self.limite_maximo:
+            raise ValidationError({'limite': ['O limite deve estar entre 1 e %d' % self.limite_maximo]})
+        return limite
+
+    def get_periodo(self):
+        """
+        Retorna o filtro de data dos parâmetros inicio e fim, ou None se nenhum dos dois for informado
+        """
+        periodo = {}
+        for parametro, lookup in (('inicio', 'data__gte'), ('fim', 'data__lte')):
+            valor = self.request.query_params.get(parametro)
+            if valor is None:
+                continue
+            try:
+                data = parse_date(valor)
+            except ValueError:
+                data = None
+            if data is None:
+                raise ValidationError({parametro: ['Informe uma data no formato AAAA-MM-DD']})
+            periodo[lookup] = data
+
+        return periodo or None
+
+
+class ProdutoBusca(CacheCatalogoMixin, CamposViewMixin, EstatisticaMixin, ListAPIView):
+    """
+    Busca produtos pelo nome e pelo nome da categoria, em ordem de relevância.\n
+    O parâmetro q recebe o texto buscado, ignorando acentos e maiúsculas. Cada palavra também encontra as que
+    começam por ela e, a partir de quatro letras, as que diferem por um erro de digitação\n
+    A quantidade de produtos é definida pelo parâmetro limite, sendo no máximo 100\n
+    """
+    serializer_class = ProdutoSerializer
+    permission_classes = (IsSellerOrReadOnly, )
+    escopos_limite = {'GET': 'catalogo'}
+    pagination_class = None
+    filter_backends = ()
+    modelos_cache = ('produto', 'categoria', )
+    limite_padrao = 20
+
+    def get_queryset(self):
+        texto = self.request.query_params.get('q', '').strip()
+        if not texto:
+            raise ValidationError({'q': ['Informe o texto a ser buscado']})
+        return busca.buscar(texto, self.get_limite())
+
+
+class Autocompletar(EstatisticaMixin, APIView):
+    """
+    Sugestões de produtos e categorias cujo nome começa pelo texto digitado, ignorando acentos e maiúsculas.\n
+    O parâmetro q recebe o início do nome. Por padrão só são sugeridos os produtos disponíveis, e com todos=true
+    também os indisponíveis\n
+    A quantidade de sugestões de cada tipo é definida pelo parâmetro limite, sendo no máximo 100\n
+    As sugestões vêm de um índice em memória, sem consultar o banco
+    """
+    permission_classes = (IsSellerOrReadOnly, )
+    escopos_limite = {'GET': 'catalogo'}
+
+    def get(self, request, *args, **kwargs):
+        texto = request.query_params.get('q', '').strip()
+        if not texto:
+            raise ValidationError({'q': ['Informe o início do nome']})
+        limite = self.get_limite()
+        todos = request.query_params.get('todos') == 'true'
+
+        return Response({
+            'produtos': [{'id': produto_id, 'nome': nome}
+                         for produto_id, nome in autocompletar.produtos.buscar(texto, limite, todos)],
+            'categorias': [{'id': categoria_id, 'nome': nome}
+                           for categoria_id, nome in autocompletar.categorias.buscar(texto, limite)],
+        })
+
+
+class Sincronizacao(EstatisticaMixin, APIView):
+    """
+    Alterações do catálogo para os terminais que o guardam localmente: categorias, pagamentos e produtos criados ou
+    alterados e os removidos desde a versão informada no parâmetro since, em ordem de versão.\n
+    Na primeira sincronização since é 0. A resposta traz a versão a ser informada na próxima, e mais igual a true
+    quando ainda há alterações depois dela\n
+    Com completa igual a true na resposta, o terminal deve descartar o catálogo guardado e montá-lo de novo a partir
+    da resposta, informando completa=true nas chamadas seguintes até mais ser false. Isso acontece na primeira
+    sincronização e quando since é anterior às remoções já descartadas, guardadas por RETENCAO_REMOCOES dias\n
+    A quantidade de alterações é definida pelo parâmetro limite, sendo no máximo 2000\n
+    O estoque dos produtos particionados é atualizado quando o produto é salvo ou se esgota, e não a cada venda\n
+    As alterações aparecem depois de numeradas pelo comando numerar_sincronizacao, que deve estar agendado ou
+    rodando com --intervalo; sem ele, nenhuma gravação chega aos terminais
+    """
+    permission_classes = (IsSellerOrReadOnly, )
+    escopos_limite = {'GET': 'catalogo'}
+    limite_padrao = 500
+    limite_maximo = 2000
+
+    def get(self, request, *args, **kwargs):
+        try:
+            desde = int(request.query_params.get('since', 0))
+        except ValueError:
+            raise ValidationError({'since': ['Informe um número inteiro']})
+        if desde < 0:
+            raise ValidationError({'since': ['A versão não pode ser negativa']})
+
+        return Response(sincronizacao.alteracoes(desde, self.get_limite(), {'request': request, 'view': self},
+                                                 completa=request.query_params.get('completa') == 'true'))
+
+
+class ProdutoMaisVendido(LeituraReplicaMixin, RetrieveAPIView):
+    """
+    Produto com mais unidades vendidas
+    """
     serializer_class = ProdutoMaisVendidoSerializer
     permission_classes = (IsSellerOrReadOnly, )
 
     def get_object(self):
         try:
-            return Produto.objects.get(id=ProdutoVenda.objects.values('produto').annotate(
-                produtos_count=Count('produto')).order_by('-produtos_count')[0].get('produto'))
+            return Produto.objects.get(id=EstatisticaProduto.objects.filter(unidades__gt=0).order_by(
+                '-unidades').values_list('produto', flat=True)[0])
         except IndexError:
             raise Http404
         except Produto.DoesNotExist:
             raise Http404
 
 
-class PagamentoMaisUtilizado(RetrieveAPIView):
+class PagamentoMaisUtilizado(LeituraReplicaMixin, RetrieveAPIView):
+    """
+    Pagamento utilizado no maior número de vendas
+    """
     serializer_class = PagamentoMaisUtilizadoSerializer
     permission_classes = (IsSellerOrReadOnly, )
 
     def get_object(self):
         try:
-            return Pagamento.objects.get(id=Venda.objects.values('pagamento').annotate(
-                pagamentos_count=Count('pagamento')).order_by('-pagamentos_count')[0].get('pagamento'))
+            return Pagamento.objects.get(id=EstatisticaPagamento.objects.filter(vendas__gt=0).order_by(
+                '-vendas').values_list('pagamento', flat=True)[0])
         except IndexError:
             raise Http404
-        except Produto.DoesNotExist:
+        except Pagamento.DoesNotExist:
             raise Http404
+
+
+class ProdutosMaisVendidos(LeituraReplicaMixin, CamposViewMixin, EstatisticaMixin, ListAPIView):
+    """
+    Lista os produtos mais vendidos, em unidades, com a receita e a margem de cada um.\n
+    As estatísticas incluem as vendas consolidadas pela última execução do comando atualizar_resumos\n
+    A quantidade de produtos é definida pelo parâmetro limite, sendo no máximo 100\n
+    Pode ser filtrada por período com os parâmetros inicio e fim, no formato AAAA-MM-DD\n
+    """
+    serializer_class = EstatisticaProdutoSerializer
+    permission_classes = (IsSellerOrReadOnly, )
+    pagination_class = None
+    filter_backends = ()
+
+    def get_queryset(self):
+        periodo = self.get_periodo()
+        if periodo is None:
+            return EstatisticaProduto.objects.filter(unidades__gt=0).order_by('-unidades', 'produto')[
+                :self.get_limite()]
+
+        return [EstatisticaProduto(produto_id=linha['produto'], unidades=linha['total_unidades'],
+                                   receita=linha['total_receita'], margem=linha['total_margem'])
+                for linha in EstatisticaProdutoDiaria.objects.filter(**periodo).values('produto').annotate(
+                    total_unidades=Sum('unidades'), total_receita=Sum('receita'), total_margem=Sum('margem'),
+                ).filter(total_unidades__gt=0).order_by('-total_unidades', 'produto')[:self.get_limite()]]
+
+
+class PagamentosMaisUtilizados(LeituraReplicaMixin, CamposViewMixin, EstatisticaMixin, ListAPIView):
+    """
+    Lista os pagamentos utilizados no maior número de vendas, com o valor total vendido em cada um.\n
+    As estatísticas incluem as vendas consolidadas pela última execução do comando atualizar_resumos\n
+    A quantidade de pagamentos é definida pelo parâmetro limite, sendo no máximo 100\n
+    Pode ser filtrada por período com os parâmetros inicio e fim, no formato AAAA-MM-DD\n
+    """
+    serializer_class = EstatisticaPagamentoSerializer
+    permission_classes = (IsSellerOrReadOnly, )
+    pagination_class = None
+    filter_backends = ()
+
+    def get_queryset(self):
+        periodo = self.get_periodo()
+        if periodo is None:
+            return EstatisticaPagamento.objects.filter(vendas__gt=0).order_by('-vendas', 'pagamento')[
+                :self.get_limite()]
+
+        return [EstatisticaPagamento(pagamento_id=linha['pagamento'], vendas=linha['total_vendas'],
+                                     valor=linha['total_valor'])
+                for linha in EstatisticaPagamentoDiaria.objects.filter(**periodo).values('pagamento').annotate(
+                    total_vendas=Sum('vendas'), total_valor=Sum('valor'),
+                ).filter(total_vendas__gt=0).order_by('-total_vendas', 'pagamento')[:self.get_limite()]]
+
+
+class SerieVendas(LeituraReplicaMixin, EstatisticaMixin, ListAPIView):
+    """
+    Série de vendas, unidades, receita e ticket médio, calculada a partir dos resumos diários.\n
+    O parâmetro periodo agrupa a série por dia, semana ou mes (padrão dia)\n
+    O parâmetro dimensao separa a série por total, categoria, vendedor ou pagamento (padrão total)\n
+    Pode ser filtrada por período com os parâmetros inicio e fim, no formato AAAA-MM-DD. Sem inicio, a série
+    começa 30 dias, 12 semanas ou 12 meses antes do fim\n
+    """
+    serializer_class = SerieVendaSerializer
+    permission_classes = (IsSeller, )
+    pagination_class = None
+    filter_backends = ()
+
+    truncamentos = {'dia': None, 'semana': TruncWeek, 'mes': TruncMonth}
+
+    def get_queryset(self):
+        periodo = self.request.query_params.get('periodo', 'dia')
+        if periodo not in self.truncamentos:
+            raise ValidationError({'periodo': ['Use %s' % ', '.join(self.truncamentos)]})
+
+        dimensao = self.request.query_params.get('dimensao', ResumoVendaDiario.TOTAL)
+        if dimensao not in dict(ResumoVendaDiario.DIMENSOES):
+            raise ValidationError({'dimensao': ['Use %s' % ', '.join(dict(ResumoVendaDiario.DIMENSOES))]})
+
+        filtro = self.get_periodo() or {}
+        filtro.setdefault('data__lte', timezone.localdate())
+        filtro.setdefault('data__gte', periodo_padrao(periodo, filtro['data__lte']))
+
+        truncamento = self.truncamentos[periodo]
+        bucket = truncamento('data') if truncamento else F('data')
+
+        return ResumoVendaDiario.objects.filter(dimensao=dimensao, **filtro).annotate(
+            periodo=bucket).values('periodo', 'chave').annotate(
+            vendas=Sum('vendas'), unidades=Sum('unidades'), receita=Sum('receita')).order_by('periodo', 'chave')
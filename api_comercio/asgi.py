@@ -7,10 +7,109 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 """
 
+import asyncio
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.base import BaseHandler
+from django.db import close_old_connections
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api_comercio.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+from api.exceptions import LoginSobrecarregado  # noqa: E402
+
+METODOS_LEITURA = ('GET', 'HEAD', 'OPTIONS')
+# Rotas cujas escritas vão para o pool de autenticação: o login e o cadastro de usuários calculam o hash da senha,
+# que é lento de propósito
+ROTAS_AUTENTICACAO = ('token_obtain_pair', 'token_refresh', 'token_verify', 'user')
+POOLS = ('leitura', 'escrita', 'autenticacao')
+
+
+def executar(funcao, *args):
+    close_old_connections()
+    try:
+        return funcao(*args)
+    finally:
+        # Devolve a conexão ao pool ao fim da tarefa, já que os sinais da requisição rodam em outra thread
+        close_old_connections()
+
+
+class ASGIHandlerLimitado(ASGIHandler):
+    """
+    Atende as requisições em pools de threads de tamanho fixo, um para leituras, um para escritas e um para a
+    autenticação, para que a espera pelo banco não bloqueie o event loop, uma rajada de vendas não ocupe as threads
+    das consultas e uma rajada de logins não ocupe as threads das vendas. Os tamanhos vêm de ASGI_THREADS.
+    Cada thread mantém a sua conexão com o banco, então o número de conexões por processo é a soma dos pools.
+    As views continuam síncronas, pois o Django 3.0 e o DRF não possuem views nem ORM assíncronos.
+    Quando já há settings.SENHAS['fila'] requisições esperando pelo pool de autenticação, as novas são recusadas
+    com 503 no próprio event loop, sem ocupar uma thread
+    """
+
+    def __init__(self):
+        super(ASGIHandlerLimitado, self).__init__()
+        self.pools = {nome: ThreadPoolExecutor(settings.ASGI_THREADS[nome], thread_name_prefix='asgi-%s' % nome)
+                      for nome in POOLS}
+        # Só é alterado no event loop, então não precisa de trava
+        self.autenticando = 0
+
+    def escolher_pool(self, request):
+        if request.method in METODOS_LEITURA:
+            return 'leitura'
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return 'escrita'
+        return 'autenticacao' if url_name in ROTAS_AUTENTICACAO else 'escrita'
+
+    async def get_response(self, request):
+        nome = self.escolher_pool(request)
+        if nome != 'autenticacao':
+            return await self.atender(nome, request)
+        if self.autenticando >= settings.ASGI_THREADS['autenticacao'] + settings.SENHAS['fila']:
+            return JsonResponse({'detail': LoginSobrecarregado.default_detail}, status=LoginSobrecarregado.status_code)
+        self.autenticando += 1
+        try:
+            return await self.atender(nome, request)
+        finally:
+            self.autenticando -= 1
+
+    async def atender(self, nome, request):
+        pool = self.pools[nome]
+        response = await asyncio.get_running_loop().run_in_executor(pool, executar, BaseHandler.get_response,
+                                                                    self, request)
+        response._pool = pool
+        return response
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super(ASGIHandlerLimitado, self).send_response(response, send)
+
+        # O conteúdo é gerado consultando o banco, então cada parte é obtida no pool que atendeu a requisição
+        headers = [(str(header).encode('ascii'), str(valor).encode('latin1'))
+                   for header, valor in response.items()]
+        headers += [(b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+                    for cookie in response.cookies.values()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+
+        loop = asyncio.get_running_loop()
+        pool = getattr(response, '_pool', self.pools['leitura'])
+        partes = iter(response)
+        while True:
+            parte = await loop.run_in_executor(pool, next, partes, None)
+            if parte is None:
+                break
+            for chunk, _ in self.chunk_bytes(parte):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+
+        await send({'type': 'http.response.body'})
+        await loop.run_in_executor(pool, response.close)
+
+
+application = ASGIHandlerLimitado()
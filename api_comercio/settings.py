@@ -13,6 +13,7 @@ import dj_database_url
 from datetime import timedelta
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -48,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metricas.MetricasMiddleware',
+    'api.compressao.CompressaoMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -56,6 +59,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.metricas.MetricasViewMiddleware',
 ]
 
 ROOT_URLCONF = 'api_comercio.urls'
@@ -78,6 +82,15 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'api_comercio.wsgi.application'
 
+# Threads usadas pelo servidor ASGI (api_comercio.asgi) para atender leituras, escritas e a autenticação (login,
+# renovação de token e cadastro de usuários). O hash das senhas ocupa a CPU, então o pool de autenticação
+# acompanha o número de núcleos
+ASGI_THREADS = {
+    'leitura': int(os.environ.get('ASGI_THREADS_LEITURA', (os.cpu_count() or 1) * 4)),
+    'escrita': int(os.environ.get('ASGI_THREADS_ESCRITA', 4)),
+    'autenticacao': int(os.environ.get('ASGI_THREADS_AUTENTICACAO', os.cpu_count() or 1)),
+}
+
 
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
@@ -89,9 +102,59 @@ DATABASES = {
     }
 }
 
-db_from_env = dj_database_url.config(conn_max_age=600)
+# Pool de conexões
+# Com o pool ligado, as conexões voltam ao pool ao fim de cada requisição, em vez de ficarem presas à thread
+# por CONN_MAX_AGE. Réplicas de leitura são informadas por DATABASE_REPLICAS, separadas por vírgula
+
+DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+
+db_from_env = dj_database_url.config(conn_max_age=0 if DB_POOL else 600)
 DATABASES['default'].update(db_from_env)
 
+# No SQLite o banco de testes fica em arquivo: em memória, as conexões das threads dos testes de concorrência
+# recebem erro de tabela bloqueada em vez de esperar pela transação das outras
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('TEST', {'NAME': os.path.join(tempfile.gettempdir(),
+                                                                  'api_comercio_testes.sqlite3')})
+
+for posicao, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(','))):
+    DATABASES['replica_%d' % (posicao + 1)] = dict(dj_database_url.parse(url, conn_max_age=0 if DB_POOL else 600),
+                                                   TEST={'MIRROR': 'default'})
+
+BACKENDS_POOL = {
+    'django.db.backends.postgresql': 'api.backends.postgresql',
+    'django.db.backends.postgresql_psycopg2': 'api.backends.postgresql',
+    'django.db.backends.sqlite3': 'api.backends.sqlite3',
+}
+
+if DB_POOL:
+    for banco in DATABASES.values():
+        banco['ENGINE'] = BACKENDS_POOL.get(banco['ENGINE'], banco['ENGINE'])
+        banco['POOL'] = {
+            'minimo': int(os.environ.get('DB_POOL_MINIMO', 0)),
+            'maximo': int(os.environ.get('DB_POOL_MAXIMO', 10)),
+            'transbordo': int(os.environ.get('DB_POOL_TRANSBORDO', 5)),
+            'espera': float(os.environ.get('DB_POOL_ESPERA', 10)),
+            'pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+        }
+
+DATABASE_ROUTERS = ['api.replicas.RoteadorReplicas']
+
+# Cache
+# O cache do catálogo usa memória local por padrão, o que só invalida as respostas no próprio processo.
+# Com mais de um worker, configure um backend compartilhado (ex.: memcached) pelas variáveis de ambiente
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogo': {
+        'BACKEND': os.environ.get('CACHE_CATALOGO_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_CATALOGO_LOCATION', 'catalogo'),
+        'TIMEOUT': 300,
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -111,6 +174,29 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Hash das senhas
+# O algoritmo preferido é escolhido por PASSWORD_HASHER e o seu custo pelas variáveis abaixo. Senhas gravadas com
+# outro algoritmo ou custo são recalculadas no próximo login. Cada processo calcula no máximo 'workers' hashes ao
+# mesmo tempo, na thread da própria requisição; sem vaga o login responde 503 na hora. No servidor ASGI até 'fila'
+# requisições de autenticação aguardam uma thread do seu pool sem ocupar nenhuma; além disso também respondem 503
+
+SENHAS = {
+    'iteracoes': int(os.environ.get('SENHAS_ITERACOES', 180000)),
+    'iteracoes_argon2': int(os.environ.get('SENHAS_ITERACOES_ARGON2', 2)),
+    'rodadas_bcrypt': int(os.environ.get('SENHAS_RODADAS_BCRYPT', 12)),
+    'workers': int(os.environ.get('SENHAS_WORKERS', os.cpu_count() or 1)),
+    'fila': int(os.environ.get('SENHAS_FILA', 64)),
+}
+
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'api.hashers.PBKDF2Configuravel')
+
+PASSWORD_HASHERS = [PASSWORD_HASHER] + [hasher for hasher in ('api.hashers.PBKDF2Configuravel',
+                                                             'api.hashers.Argon2Configuravel',
+                                                             'api.hashers.BCryptConfiguravel',
+                                                             'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+                                                             ) if hasher != PASSWORD_HASHER]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.1/topics/i18n/
 
@@ -138,21 +224,69 @@ AUTH_USER_MODEL = 'api.User'
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.JSONRapidoRenderer',
+        'api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+
+    'DEFAULT_PARSER_CLASSES': (
+        'api.renderers.JSONRapidoParser',
+        'api.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.JWTAutenticacaoCache',
     ),
 
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle'
+        'api.throttling.LimitePorEscopo',
     ],
 
+    # Cada escopo tem a taxa dos autenticados e, com o sufixo _anon, a dos anônimos; sem ela os anônimos ficam na
+    # taxa 'anon'
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '10/min',
-        'user': '60/min'
+        'anon': os.environ.get('THROTTLE_ANON', '10/min'),
+        'user': os.environ.get('THROTTLE_USER', '60/min'),
+        'catalogo': os.environ.get('THROTTLE_CATALOGO', '120/min'),
+        'catalogo_anon': os.environ.get('THROTTLE_CATALOGO_ANON', '10/min'),
+        'venda': os.environ.get('THROTTLE_VENDA', '30/min'),
+        'importacao': os.environ.get('THROTTLE_IMPORTACAO', '10/min'),
     },
 }
 
+# Compressão das respostas da API com brotli ou gzip, conforme o Accept-Encoding. Respostas menores que 'minimo'
+# bytes são enviadas sem compressão; os níveis vão de 1 a 9 no gzip e de 0 a 11 no brotli
+COMPRESSAO = {
+    'ativa': os.environ.get('COMPRESSAO_ATIVA', '1') == '1',
+    'minimo': int(os.environ.get('COMPRESSAO_MINIMO', 1024)),
+    'nivel_gzip': int(os.environ.get('COMPRESSAO_NIVEL_GZIP', 6)),
+    'nivel_brotli': int(os.environ.get('COMPRESSAO_NIVEL_BROTLI', 4)),
+}
+
+# Estado dos limites de requisições. 'compartilhado' guarda os baldes em um arquivo mapeado na memória, em
+# 'local', comum a todos os workers da máquina; 'redis' usa o servidor da URL em 'local', comum a várias máquinas;
+# 'memoria' vale apenas para um único processo. 'chaves' é o número de posições da tabela compartilhada
+LIMITES = {
+    'ativos': os.environ.get('LIMITES_ATIVOS', '1') == '1',
+    'backend': os.environ.get('LIMITES_BACKEND', 'compartilhado'),
+    'local': os.environ.get('LIMITES_LOCAL', os.path.join(tempfile.gettempdir(), 'api_comercio_limites')),
+    'chaves': int(os.environ.get('LIMITES_CHAVES', 65536)),
+}
+
+# Versões compartilhadas pelos workers, para que cada processo perceba na hora as alterações feitas pelos outros:
+# a de cada usuário, conferida pelo cache da autenticação, e a do índice de autocompletar. Os backends são os
+# mesmos dos limites de requisições
+VERSOES = {
+    'backend': os.environ.get('VERSOES_BACKEND', 'compartilhado'),
+    'local': os.environ.get('VERSOES_LOCAL', os.path.join(tempfile.gettempdir(), 'api_comercio_versoes')),
+    'chaves': int(os.environ.get('VERSOES_CHAVES', 65536)),
+}
+
 SWAGGER_SETTINGS = {
    'SECURITY_DEFINITIONS': {
         'Bearer': {
@@ -191,4 +325,46 @@ SIMPLE_JWT = {
     'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Usuários autenticados por token ficam em memória por até 'validade' segundos. As alterações feitas por outros
+# workers são percebidas antes disso, pela versão compartilhada de cada usuário (VERSOES)
+JWT_CACHE_USUARIOS = {
+    'tamanho': int(os.environ.get('JWT_CACHE_USUARIOS_TAMANHO', 10000)),
+    'validade': int(os.environ.get('JWT_CACHE_USUARIOS_VALIDADE', 30)),
+}
+
+# Refresh tokens já verificados ficam em memória por até 'validade' segundos, sem passar da sua expiração
+JWT_CACHE_REFRESH = {
+    'tamanho': int(os.environ.get('JWT_CACHE_REFRESH_TAMANHO', 10000)),
+    'validade': int(os.environ.get('JWT_CACHE_REFRESH_VALIDADE', 300)),
+}
+
+# Dias em que as remoções ficam disponíveis para a sincronização dos terminais. Depois disso são descartadas pelo
+# comando numerar_sincronizacao, e os terminais que não sincronizaram nesse período recebem uma sincronização completa
+RETENCAO_REMOCOES = int(os.environ.get('RETENCAO_REMOCOES', 30))
+
+# Intervalo máximo, em segundos, para o índice de autocompletar perceber alterações feitas por outros processos
+AUTOCOMPLETAR_INTERVALO = int(os.environ.get('AUTOCOMPLETAR_INTERVALO', 5))
+
+# Métricas de desempenho por rota, expostas em /metrics no formato do Prometheus. Todas as requisições contam na
+# duração, no status e no tamanho das respostas, e a fração 'amostragem' delas também mede consultas e serialização.
+# Nessas, consultas acima de 'consulta_lenta' segundos são registradas no log com a origem no código. /metrics só
+# existe com 'token' configurado e exige o cabeçalho Authorization: Bearer <token>
+METRICAS = {
+    'ativas': os.environ.get('METRICAS_ATIVAS', '1') == '1',
+    'amostragem': float(os.environ.get('METRICAS_AMOSTRAGEM', 0.1)),
+    'consulta_lenta': float(os.environ.get('METRICAS_CONSULTA_LENTA', 0.2)),
+    'token': os.environ.get('METRICAS_TOKEN', ''),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
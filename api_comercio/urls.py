@@ -16,7 +16,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
-from api.views import ObterJWTToken, VerificarToken, RefreshJWTToken
+from api.compressao import sem_compressao
+from api.views import ObterJWTToken, VerificarToken, RefreshJWTToken, exportar_metricas
 
 
 def redirect_to_api_root(request):
@@ -27,9 +28,11 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('api.urls')),
     path('', redirect_to_api_root),
-    path('auth/token/', ObterJWTToken.as_view(), name='token_obtain_pair'),
-    path('auth/token/verify/', VerificarToken.as_view(), name='token_verify'),
-    path('auth/token/refresh/', RefreshJWTToken.as_view(), name='token_refresh'),
+    # As respostas dos tokens não são comprimidas, por causa do BREACH
+    path('auth/token/', sem_compressao(ObterJWTToken.as_view()), name='token_obtain_pair'),
+    path('auth/token/verify/', sem_compressao(VerificarToken.as_view()), name='token_verify'),
+    path('auth/token/refresh/', sem_compressao(RefreshJWTToken.as_view()), name='token_refresh'),
+    path('metrics', exportar_metricas, name='metricas'),
 ]
 
 